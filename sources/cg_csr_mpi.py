@@ -0,0 +1,278 @@
+# cg_csr_mpi.py
+# ------------------------------------------------------------
+# CG paralelo (mpi4py) para A x = b com A esparsa GERAL (simétrica positiva
+# definida), em formato CSR distribuído.
+# - Matriz lida de um arquivo Matrix Market (.mtx, coordinate) — cada rank
+#   percorre o arquivo em blocos e GUARDA só as suas linhas — ou gerada
+#   (--laplacian n: Laplaciano 5-pontos n x n, para conferir com cg_spmv_ep.py).
+# - Partição por blocos de linhas (split_rows de cg_spmv_ep.py).
+# - Análise de fantasmas (uma vez): colunas não-locais -> rank dono -> padrão
+#   de comunicação (quem manda o quê para quem).
+# - SpMV: troca de fantasmas com Alltoallv (ou Neighbor_alltoallv num grafo
+#   distribuído, --comm neighbor) + produto CSR local.
+# - Os laços CG de cg_spmv_ep.py (classic/pipelined) rodam sem alteração.
+#
+# Execução:
+#   mpiexec -n 4 python cg_csr_mpi.py --mtx matriz.mtx
+#   mpiexec -n 4 python cg_csr_mpi.py --laplacian 127 --comm neighbor --variant pipelined
+# ------------------------------------------------------------
+
+from mpi4py import MPI
+import numpy as np
+import argparse
+import itertools
+import math
+
+from cg_spmv_ep import split_rows, dot_global, cg_loop_classic, cg_loop_pipelined
+
+try:
+    import scipy.sparse as sp      # opcional: produto CSR local mais rápido
+except ImportError:
+    sp = None
+
+# ---------- leitura Matrix Market (só as linhas locais) ----------
+def read_mm_header(path: str):
+    """
+    Lê o cabeçalho de um .mtx: devolve (nrows, ncols, nnz, field, symmetry, nlines),
+    com nlines = linhas de cabeçalho/comentário antes das entradas.
+    """
+    with open(path, "r") as f:
+        banner = f.readline().split()
+        if len(banner) < 5 or banner[0].lower() != "%%matrixmarket":
+            raise ValueError(f"{path}: não é um arquivo Matrix Market")
+        fmt, field, symmetry = banner[2].lower(), banner[3].lower(), banner[4].lower()
+        if fmt != "coordinate":
+            raise ValueError(f"{path}: só o formato 'coordinate' (esparso) é suportado")
+        if field not in ("real", "integer", "pattern"):
+            raise ValueError(f"{path}: campo '{field}' não suportado")
+        if symmetry not in ("general", "symmetric"):
+            raise ValueError(f"{path}: simetria '{symmetry}' não suportada")
+        nlines = 1
+        line = f.readline()
+        while line.startswith("%") or not line.strip():
+            nlines += 1
+            line = f.readline()
+        nrows, ncols, nnz = (int(t) for t in line.split())
+        nlines += 1
+    return nrows, ncols, nnz, field, symmetry, nlines
+
+def read_mm_local_rows(path: str, r0: int, r1: int, chunk: int = 1_000_000):
+    """
+    Percorre as entradas em blocos de 'chunk' linhas e guarda só as de linha
+    global em [r0, r1): memória O(nnz_local + chunk), nunca a matriz inteira.
+    No formato 'symmetric' cada (i, j) fora da diagonal vale também como (j, i).
+    Retorna (rows, cols, vals, nrows) com índices globais base 0.
+    """
+    nrows, ncols, nnz, field, symmetry, nlines = read_mm_header(path)
+    ncol_file = 2 if field == "pattern" else 3
+    rows, cols, vals = [], [], []
+
+    def keep(i, j, v):
+        m = (i >= r0) & (i < r1)
+        rows.append(i[m]); cols.append(j[m]); vals.append(v[m])
+
+    with open(path, "r") as f:
+        for _ in range(nlines):
+            f.readline()
+        left = nnz
+        while left > 0:
+            block = np.loadtxt(itertools.islice(f, min(chunk, left)), ndmin=2, comments="%")
+            left -= block.shape[0]
+            i = block[:, 0].astype(np.int64) - 1
+            j = block[:, 1].astype(np.int64) - 1
+            v = block[:, 2] if ncol_file == 3 else np.ones(block.shape[0])
+            keep(i, j, v)
+            if symmetry == "symmetric":
+                off = i != j
+                keep(j[off], i[off], v[off])
+
+    return (np.concatenate(rows), np.concatenate(cols),
+            np.concatenate(vals).astype(np.float64), nrows)
+
+def laplacian_local_rows(n: int, r0: int, r1: int):
+    """Linhas [r0, r1) do Laplaciano 5-pontos n x n (k = i*n + j), em COO global."""
+    k = np.arange(r0, r1, dtype=np.int64)
+    i, j = k // n, k % n
+    rows, cols, vals = [k], [k], [np.full(k.size, 4.0)]
+    for di, dj in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        ii, jj = i + di, j + dj
+        m = (ii >= 0) & (ii < n) & (jj >= 0) & (jj < n)
+        rows.append(k[m]); cols.append(ii[m] * n + jj[m]); vals.append(np.full(int(m.sum()), -1.0))
+    return np.concatenate(rows), np.concatenate(cols), np.concatenate(vals), n * n
+
+# ---------- CSR distribuído ----------
+class DistCSR:
+    """
+    Bloco de linhas [r0, r1) de A em CSR, com colunas renumeradas:
+      0..n_local-1                 → valores próprios do rank
+      n_local..n_local+n_ghost-1   → fantasmas (colunas de outros ranks)
+    Os vetores têm n_local + n_ghost posições: a fatia [:n_local] é do rank e
+    o final [n_local:] recebe os fantasmas (o "halo" do caso geral).
+    A análise de fantasmas roda UMA vez no construtor; cada SpMV só empacota
+    v[send_idx] num buffer fixo e faz a troca direto no final do vetor.
+    """
+    def __init__(self, rows, cols, vals, N: int, comm: MPI.Comm, comm_mode: str = "alltoallv"):
+        size = comm.Get_size()
+        rank = comm.Get_rank()
+        counts, displs = split_rows(N, size)
+        self.comm = comm
+        self.N = N
+        self.r0 = int(displs[rank])
+        self.n_local = int(counts[rank])
+        r0, r1 = self.r0, self.r0 + self.n_local
+
+        # CSR local ordenado por linha (global → local)
+        order = np.argsort(rows, kind="stable")
+        rows, cols, vals = rows[order] - r0, cols[order], vals[order]
+        self.indptr = np.zeros(self.n_local + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=self.n_local), out=self.indptr[1:])
+        self.row_of = rows                                 # linha local de cada entrada
+        self.diag = np.zeros(self.n_local)
+        dmask = cols == rows + r0
+        np.add.at(self.diag, rows[dmask], vals[dmask])
+
+        # --- análise de fantasmas: colunas fora de [r0, r1) ---
+        ghost_g = np.unique(cols[(cols < r0) | (cols >= r1)])   # ordenado ⇒ agrupado por dono
+        owner = np.searchsorted(displs, ghost_g, side="right") - 1
+        self.recv_counts = np.bincount(owner, minlength=size).astype(np.int64)
+        self.send_counts = np.empty_like(self.recv_counts)
+        comm.Alltoall([self.recv_counts, MPI.INT64_T], [self.send_counts, MPI.INT64_T])
+        self.recv_displs = np.zeros(size, dtype=np.int64)
+        self.send_displs = np.zeros(size, dtype=np.int64)
+        self.recv_displs[1:] = np.cumsum(self.recv_counts[:-1])
+        self.send_displs[1:] = np.cumsum(self.send_counts[:-1])
+
+        # cada rank diz aos donos quais colunas quer; o dono guarda o que enviar
+        wanted = np.empty(int(self.send_counts.sum()), dtype=np.int64)
+        comm.Alltoallv([ghost_g, (self.recv_counts, self.recv_displs), MPI.INT64_T],
+                       [wanted, (self.send_counts, self.send_displs), MPI.INT64_T])
+        self.send_idx = wanted - r0
+        self.sendbuf = np.empty(self.send_idx.size, dtype=np.float64)
+        self.n_ghost = int(ghost_g.size)
+
+        # renumera colunas: próprias → c - r0 ; fantasmas → n_local + posição em ghost_g
+        local = (cols >= r0) & (cols < r1)
+        self.indices = np.where(local, cols - r0,
+                                self.n_local + np.searchsorted(ghost_g, cols)).astype(np.int64)
+        self.data = vals
+        if sp is not None:
+            self.A = sp.csr_matrix((self.data, self.indices, self.indptr),
+                                   shape=(self.n_local, self.n_local + self.n_ghost))
+
+        # --- comunicação: Alltoallv no comm todo ou Neighbor_alltoallv só com os vizinhos ---
+        self.comm_mode = comm_mode
+        if comm_mode == "neighbor":
+            srcs = np.flatnonzero(self.recv_counts)
+            dsts = np.flatnonzero(self.send_counts)
+            self.graph = comm.Create_dist_graph_adjacent(srcs.tolist(), dsts.tolist(), reorder=False)
+            self.nb_send = (self.send_counts[dsts], self.send_displs[dsts])
+            self.nb_recv = (self.recv_counts[srcs], self.recv_displs[srcs])
+
+    def alloc(self) -> np.ndarray:
+        return np.zeros(self.n_local + self.n_ghost, dtype=np.float64)
+
+    def exchange_ghosts(self, v: np.ndarray):
+        """v[n_local:] ← valores das colunas fantasmas, vindos dos donos."""
+        np.take(v, self.send_idx, out=self.sendbuf)
+        ghosts = v[self.n_local:]
+        if self.comm_mode == "neighbor":
+            self.graph.Neighbor_alltoallv([self.sendbuf, self.nb_send, MPI.DOUBLE],
+                                          [ghosts, self.nb_recv, MPI.DOUBLE])
+        else:
+            self.comm.Alltoallv([self.sendbuf, (self.send_counts, self.send_displs), MPI.DOUBLE],
+                                [ghosts, (self.recv_counts, self.recv_displs), MPI.DOUBLE])
+
+    def matvec(self, v: np.ndarray, out: np.ndarray):
+        """out[:n_local] = A v (troca fantasmas de v e aplica o CSR local)."""
+        self.exchange_ghosts(v)
+        if sp is not None:
+            out[:self.n_local] = self.A @ v
+        else:
+            out[:self.n_local] = np.bincount(self.row_of, weights=self.data * v[self.indices],
+                                             minlength=self.n_local)
+
+    def free(self):
+        if self.comm_mode == "neighbor":
+            self.graph.Free()
+
+    def comm_stats(self):
+        """(nº de vizinhos, valores recebidos por SpMV) deste rank."""
+        return int(np.count_nonzero(self.recv_counts)), self.n_ghost
+
+# ---------- main ----------
+def main():
+    parser = argparse.ArgumentParser(description="CG paralelo para matriz esparsa CSR (Matrix Market) — mpi4py")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--mtx", type=str, help="arquivo Matrix Market (coordinate, real/integer/pattern)")
+    src.add_argument("--laplacian", type=int, metavar="n", help="gera o Laplaciano 5-pontos n x n")
+    parser.add_argument("--max-iters", type=int, default=1000, help="máximo de iterações do CG")
+    parser.add_argument("--tol", type=float, default=1e-8, help="tolerância de parada (resíduo relativo)")
+    parser.add_argument("--comm", type=str, default="alltoallv", choices=["alltoallv", "neighbor"],
+                        help="troca de fantasmas: Alltoallv global ou Neighbor_alltoallv (grafo distribuído)")
+    parser.add_argument("--variant", type=str, default="classic", choices=["classic", "pipelined"],
+                        help="laço CG de cg_spmv_ep.py")
+    parser.add_argument("--precond", type=str, default="none", choices=["none", "jacobi"],
+                        help="pré-condicionador (jacobi = diagonal de A)")
+    args = parser.parse_args()
+
+    comm = MPI.COMM_WORLD
+    rank = comm.Get_rank()
+    size = comm.Get_size()
+
+    # Leitura/geração: cada rank só monta as suas linhas
+    comm.Barrier()
+    t0 = MPI.Wtime()
+    if args.mtx:
+        N = read_mm_header(args.mtx)[0]
+        counts, displs = split_rows(N, size)
+        r0 = int(displs[rank])
+        rows, cols, vals, N = read_mm_local_rows(args.mtx, r0, r0 + int(counts[rank]))
+    else:
+        N = args.laplacian ** 2
+        counts, displs = split_rows(N, size)
+        r0 = int(displs[rank])
+        rows, cols, vals, N = laplacian_local_rows(args.laplacian, r0, r0 + int(counts[rank]))
+    A = DistCSR(rows, cols, vals, N, comm, args.comm)
+    t1 = MPI.Wtime()
+
+    I = np.s_[:A.n_local]   # valores próprios do rank (o resto do vetor são fantasmas)
+    M = None
+    if args.precond == "jacobi":
+        dinv = 1.0 / A.diag
+        def M(r, z):
+            z[I] = r[I] * dinv
+
+    # b = 1 (mesmo lado direito, a menos de escala, de cg_spmv_ep.py)
+    b = A.alloc()
+    b[I] = 1.0
+    x = A.alloc()
+
+    loop = cg_loop_pipelined if args.variant == "pipelined" else cg_loop_classic
+    comm.Barrier()
+    t2 = MPI.Wtime()
+    rel, it = loop(A.matvec, A.alloc, b, x, args.max_iters, args.tol, comm, M, I)
+    t3 = MPI.Wtime()
+
+    # Checagem independente: ||b - A x|| / ||b||
+    Ax = A.alloc()
+    A.matvec(x, Ax)
+    res = math.sqrt(dot_global(b[I] - Ax[I], b[I] - Ax[I], comm) / dot_global(b[I], b[I], comm))
+
+    nnz = comm.allreduce(int(A.data.size), op=MPI.SUM)
+    nbrs, ghosts = A.comm_stats()
+    max_nbrs = comm.allreduce(nbrs, op=MPI.MAX)
+    max_ghosts = comm.allreduce(ghosts, op=MPI.MAX)
+    t_setup = comm.allreduce(t1 - t0, op=MPI.MAX)
+    t_loop = comm.allreduce(t3 - t2, op=MPI.MAX)
+    A.free()
+
+    if rank == 0:
+        print(f"\n[Resumo] N={N} nnz={nnz}  P={size}  comm={args.comm}  variante={args.variant}  precond={args.precond}")
+        print(f"Fantasmas por rank (máx.): {max_ghosts} valores de {max_nbrs} vizinhos por SpMV")
+        print(f"Convergiu (||r||/||r0|| = {rel:.3e}) em {it} iterações; ||b - A x||/||b|| = {res:.3e}")
+        print(f"Leitura + análise: {t_setup:0.6f} s | CG: {t_loop:0.6f} s | por iteração: {t_loop / max(it, 1) * 1e3:0.4f} ms")
+
+    MPI.Finalize()
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,35 @@
 # cg_spmv_ep.py
 # ------------------------------------------------------------
 # CG paralelo (mpi4py) para A x = b com A = Laplaciano 2D (5-pontos, Dirichlet u=0).
-# - Decomposição 1D por linhas (cada rank fica com um bloco de linhas).
-# - SpMV distribuído com troca de halos (linhas superiores/inferiores).
-# - Comunicação configurável: --mode sendrecv | isendirecv
+# - Decomposição 1D por linhas (cada rank fica com um bloco de linhas) ou
+#   2D em blocos (--decomp 2d, Create_cart; colunas trocadas com tipo derivado vector).
+# - SpMV distribuído com troca de halos (linhas superiores/inferiores; + colunas no 2D).
+# - Comunicação configurável: --mode sendrecv | isendirecv | persistent
+#   (persistent = Send_init/Recv_init criados uma vez por vetor; Startall/Waitall por troca)
+#   (overlap = persistent + stencil do miolo enquanto os halos viajam)
 # - Produtos internos e norma global via Allreduce.
+# - Variante configurável: --variant classic | pipelined | sstep
+#   (pipelined = Ghysels–Vanroose: 1 Iallreduce/iter sobreposto ao SpMV)
+#   (sstep = CG s-step: halos de profundidade s + base de Krylov local e
+#    1 Allreduce da matriz de Gram a cada s iterações)
+# - Pré-condicionador: --precond none | jacobi | ssor | mg (V-cycle distribuído)
+# - Vários lados direitos: --nrhs k (vetores com eixo final k; 1 troca de halos
+#   por SpMV e 1 Allreduce de k valores por produto interno, para todos os RHS)
+# - Precisão: --precision double | mixed (CG float32 + refinamento iterativo float64,
+#   mantendo a direção de busca entre refinamentos)
+# - Backend: --backend numpy | numba | both (numba = kernels fundidos stencil+dot e
+#   axpys+dot, sem temporários; opcional, precisa do pacote numba)
 #
 # Execução:
 #   mpiexec -n 4 python cg_spmv_ep.py --Nx 256 --Ny 256 --mode sendrecv
+#   mpiexec -n 4 python cg_spmv_ep.py --Nx 256 --Ny 256 --variant pipelined
+#   mpiexec -n 4 python cg_spmv_ep.py --Nx 255 --Ny 255 --precond mg
+#   mpiexec -n 16 python cg_spmv_ep.py --Nx 512 --Ny 512 --decomp both
+#   mpiexec -n 4 python cg_spmv_ep.py --Nx 1024 --Ny 1024 --bench-halo 1000
+#   mpiexec -n 4 python cg_spmv_ep.py --Nx 256 --Ny 256 --nrhs 16 --mode persistent
+#   mpiexec -n 16 python cg_spmv_ep.py --Nx 512 --Ny 512 --variant sstep --s 2 4 8
+#   mpiexec -n 4 python cg_spmv_ep.py --Nx 1024 --Ny 1024 --precision mixed --max-iters 5000
+#   mpiexec -n 1 python cg_spmv_ep.py --Nx 1024 --Ny 1024 --max-iters 500 --backend both --threads 8
 # ------------------------------------------------------------
 
 from mpi4py import MPI
@@ -16,6 +38,11 @@ import argparse
 import math
 from typing import Tuple
 
+try:
+    from numba import njit, prange, set_num_threads   # opcional: --backend numba
+except ImportError:
+    njit = None
+
 # ---------- util: partição de linhas ----------
 def split_rows(Ny: int, size: int) -> Tuple[np.ndarray, np.ndarray]:
     """Distribui Ny linhas entre 'size' processos de forma balanceada."""
@@ -26,9 +53,92 @@ def split_rows(Ny: int, size: int) -> Tuple[np.ndarray, np.ndarray]:
     return counts, displs
 
 # ---------- alocação com halos ----------
-def alloc_with_halos(nx: int, ny_local: int) -> np.ndarray:
-    """Array (ny_local+2, nx+2) com halos nas bordas."""
-    return np.zeros((ny_local + 2, nx + 2), dtype=np.float64)
+def alloc_with_halos(nx: int, ny_local: int, nrhs: int = 0, dtype=np.float64) -> np.ndarray:
+    """Array (ny_local+2, nx+2) com halos nas bordas; (ny_local+2, nx+2, nrhs) se nrhs > 0."""
+    shape = (ny_local + 2, nx + 2) + ((nrhs,) if nrhs > 0 else ())
+    return np.zeros(shape, dtype=dtype)
+
+# ---------- decomposição: 1D (faixas de linhas) ou 2D (blocos cartesianos) ----------
+class Decomp:
+    """
+    Bloco local de um rank: tamanho (ny, nx) sem halos, deslocamento global
+    (gy0, gx0) do 1º ponto interior e os vizinhos up/down/left/right
+    (PROC_NULL na borda física). Na decomposição 1D, left = right = PROC_NULL.
+    Com nrhs > 0, alloc() devolve vetores com um eixo final de nrhs colunas
+    (um ponto = nrhs valores contíguos), usados pelo CG de vários lados direitos.
+    dtype = precisão de trabalho dos vetores do solver (float32 em --precision mixed).
+    """
+    def __init__(self, comm: MPI.Comm, Nx: int, Ny: int, nx: int, ny: int, gx0: int, gy0: int,
+                 up: int, down: int, left: int = MPI.PROC_NULL, right: int = MPI.PROC_NULL):
+        self.comm = comm
+        self.Nx, self.Ny = Nx, Ny
+        self.nx, self.ny = nx, ny
+        self.gx0, self.gy0 = gx0, gy0
+        self.up, self.down = up, down
+        self.left, self.right = left, right
+        self.coltypes = {}     # (dtype, shape) -> tipo derivado de coluna
+        self.persistent = {}   # id(arr) -> (arr, requisições persistentes)
+        self.overlap_stats = np.zeros(3)   # --mode overlap: [chamadas, t_interior, t_espera]
+        self.nrhs = 0          # > 0: eixo final de lados direitos (--nrhs)
+        self.dtype = np.float64
+
+    def alloc(self, dtype=None) -> np.ndarray:
+        return alloc_with_halos(self.nx, self.ny, self.nrhs, dtype or self.dtype)
+
+    def sub(self, nx: int, ny: int, gx0: int, gy0: int) -> "Decomp":
+        """Mesmo comunicador e vizinhos, outro bloco (níveis grossos do multigrid)."""
+        d = Decomp(self.comm, (self.Nx - 1) // 2, (self.Ny - 1) // 2, nx, ny, gx0, gy0,
+                   self.up, self.down, self.left, self.right)
+        d.coltypes, d.persistent = self.coltypes, self.persistent   # caches compartilhados
+        d.nrhs, d.dtype = self.nrhs, self.dtype
+        return d
+
+    def column_type(self, arr: np.ndarray) -> MPI.Datatype:
+        """
+        Tipo derivado 'vector' para uma coluna do interior de 'arr' (ny itens,
+        passo = 1 linha). Criado e commitado uma vez por (dtype, shape).
+        """
+        key = (arr.dtype.str, arr.shape)
+        if key not in self.coltypes:
+            base = MPI.Datatype.fromcode(arr.dtype.char)
+            block = int(np.prod(arr.shape[2:], dtype=int))   # itens por ponto (i, j)
+            stride = arr.strides[0] // arr.itemsize
+            self.coltypes[key] = base.Create_vector(arr.shape[0] - 2, block, stride).Commit()
+        return self.coltypes[key]
+
+    def free(self):
+        """Libera requisições persistentes e tipos derivados criados para esta decomposição."""
+        for _, reqs in self.persistent.values():
+            for req in reqs:
+                req.Free()
+        for ctype in self.coltypes.values():
+            ctype.Free()
+        self.persistent.clear()
+        self.coltypes.clear()
+
+def make_decomp(Nx: int, Ny: int, kind: str, comm: MPI.Comm) -> Decomp:
+    """
+    kind="1d": split_rows + vizinhos up/down (rank ± 1).
+    kind="2d": Create_cart com dims de Compute_dims ([Py, Px]); linhas e colunas
+               repartidas com split_rows em cada eixo.
+    """
+    size = comm.Get_size()
+    if kind == "2d":
+        dims = MPI.Compute_dims(size, [0, 0])            # [Py, Px]
+        cart = comm.Create_cart(dims, periods=[False, False], reorder=True)
+        cy, cx = cart.Get_coords(cart.Get_rank())
+        rcounts, rdispls = split_rows(Ny, dims[0])
+        ccounts, cdispls = split_rows(Nx, dims[1])
+        up, down = cart.Shift(0, 1)
+        left, right = cart.Shift(1, 1)
+        return Decomp(cart, Nx, Ny, int(ccounts[cx]), int(rcounts[cy]),
+                      int(cdispls[cx]), int(rdispls[cy]), up, down, left, right)
+
+    rank = comm.Get_rank()
+    counts, displs = split_rows(Ny, size)
+    up   = rank - 1 if rank > 0        else MPI.PROC_NULL
+    down = rank + 1 if rank < size - 1 else MPI.PROC_NULL
+    return Decomp(comm, Nx, Ny, Nx, int(counts[rank]), 0, int(displs[rank]), up, down)
 
 # ---------- troca de halos: duas variantes ----------
 def halo_exchange_sendrecv(arr: np.ndarray, comm: MPI.Comm, up: int, down: int, tagbase: int = 100):
@@ -85,94 +195,456 @@ def halo_exchange_isendirecv(arr: np.ndarray, comm: MPI.Comm, up: int, down: int
     if reqs:
         MPI.Request.Waitall(reqs)
 
+def halo_exchange_cols(arr: np.ndarray, dec: Decomp, mode: str, tagbase: int = 300):
+    """
+    Troca das colunas fantasmas (oeste/leste) na decomposição 2D. Cada coluna é
+    descrita por um tipo derivado 'vector' (dec.column_type) ancorado no 1º item
+    da coluna: o MPI lê/escreve direto no array, sem cópias de empacotamento.
+    """
+    left, right = dec.left, dec.right
+    # Borda física (ou decomposição 1D): Dirichlet 0
+    if left == MPI.PROC_NULL:
+        arr[:, 0] = 0.0
+    if right == MPI.PROC_NULL:
+        arr[:, -1] = 0.0
+    if left == MPI.PROC_NULL and right == MPI.PROC_NULL:
+        return
+
+    ctype = dec.column_type(arr)
+    flat = arr.reshape(-1)                   # visão plana (arrays com halos são contíguos)
+    row = arr.strides[0] // arr.itemsize     # itens por linha
+    item = arr.strides[1] // arr.itemsize    # itens por ponto (1, ou k com várias RHS)
+    ncol = arr.shape[1]
+
+    def col(j):
+        return [flat[row + j * item:], 1, ctype]
+
+    comm = dec.comm
+    if mode == "sendrecv":
+        # 1ª coluna interior → oeste; ghost leste ← leste
+        comm.Sendrecv(sendbuf=col(1), dest=left, sendtag=tagbase+0,
+                      recvbuf=col(ncol - 1), source=right, recvtag=tagbase+0)
+        # última coluna interior → leste; ghost oeste ← oeste
+        comm.Sendrecv(sendbuf=col(ncol - 2), dest=right, sendtag=tagbase+1,
+                      recvbuf=col(0), source=left, recvtag=tagbase+1)
+    else:
+        reqs = [comm.Irecv(col(0), source=left, tag=tagbase+1),
+                comm.Irecv(col(ncol - 1), source=right, tag=tagbase+0),
+                comm.Isend(col(1), dest=left, tag=tagbase+0),
+                comm.Isend(col(ncol - 2), dest=right, tag=tagbase+1)]
+        MPI.Request.Waitall(reqs)
+
+def halo_requests_persistent(arr: np.ndarray, dec: Decomp, tagbase: int = 400):
+    """
+    Cria UMA vez (por vetor) as requisições Send_init/Recv_init da troca de halos:
+    linhas como visões contíguas de 'arr' e colunas com o tipo derivado da
+    decomposição. Depois, cada troca é só Startall/Waitall, sem alocar nada.
+    """
+    entry = dec.persistent.get(id(arr))
+    if entry is not None:
+        return entry[1]
+
+    comm = dec.comm
+    reqs = []
+    if dec.up != MPI.PROC_NULL:
+        reqs.append(comm.Recv_init(arr[0, 1:-1], source=dec.up, tag=tagbase+1))
+        reqs.append(comm.Send_init(arr[1, 1:-1], dest=dec.up, tag=tagbase+0))
+    if dec.down != MPI.PROC_NULL:
+        reqs.append(comm.Recv_init(arr[-1, 1:-1], source=dec.down, tag=tagbase+0))
+        reqs.append(comm.Send_init(arr[-2, 1:-1], dest=dec.down, tag=tagbase+1))
+    if dec.left != MPI.PROC_NULL or dec.right != MPI.PROC_NULL:
+        ctype = dec.column_type(arr)
+        flat = arr.reshape(-1)
+        row = arr.strides[0] // arr.itemsize
+        item = arr.strides[1] // arr.itemsize
+        ncol = arr.shape[1]
+
+        def col(j):
+            return [flat[row + j * item:], 1, ctype]
+
+        if dec.left != MPI.PROC_NULL:
+            reqs.append(comm.Recv_init(col(0), source=dec.left, tag=tagbase+3))
+            reqs.append(comm.Send_init(col(1), dest=dec.left, tag=tagbase+2))
+        if dec.right != MPI.PROC_NULL:
+            reqs.append(comm.Recv_init(col(ncol - 1), source=dec.right, tag=tagbase+2))
+            reqs.append(comm.Send_init(col(ncol - 2), dest=dec.right, tag=tagbase+3))
+
+    # guarda 'arr' junto: mantém o buffer vivo (e o id único) enquanto houver requisições
+    dec.persistent[id(arr)] = (arr, reqs)
+    return reqs
+
+def halo_start_persistent(arr: np.ndarray, dec: Decomp):
+    """Inicia (Startall) a troca persistente e devolve as requisições, sem esperar."""
+    reqs = halo_requests_persistent(arr, dec)
+    # Bordas físicas: Dirichlet 0 (sem requisição para PROC_NULL)
+    if dec.up == MPI.PROC_NULL:
+        arr[0, :] = 0.0
+    if dec.down == MPI.PROC_NULL:
+        arr[-1, :] = 0.0
+    if dec.left == MPI.PROC_NULL:
+        arr[:, 0] = 0.0
+    if dec.right == MPI.PROC_NULL:
+        arr[:, -1] = 0.0
+    if reqs:
+        MPI.Prequest.Startall(reqs)
+    return reqs
+
+def halo_exchange_persistent(arr: np.ndarray, dec: Decomp):
+    """Troca de halos com requisições persistentes: só Startall/Waitall por chamada."""
+    reqs = halo_start_persistent(arr, dec)
+    if reqs:
+        MPI.Request.Waitall(reqs)
+
+def halo_exchange_corners(arr: np.ndarray, dec: Decomp, tagbase: int = 600):
+    """
+    Cantos dos halos (só na decomposição 2D). Depois da troca de colunas, as linhas
+    de borda são reenviadas INTEIRAS (com as colunas fantasmas) para cima/baixo:
+    o canto chega do vizinho diagonal através do vizinho de cima/baixo.
+    """
+    up, down = dec.up, dec.down
+    if (dec.left == MPI.PROC_NULL and dec.right == MPI.PROC_NULL) or \
+       (up == MPI.PROC_NULL and down == MPI.PROC_NULL):
+        return                                # colunas fantasmas = 0 (1D) ou nada a receber
+    comm = dec.comm
+    comm.Sendrecv(sendbuf=arr[1], dest=up, sendtag=tagbase+0,
+                  recvbuf=arr[-1], source=down, recvtag=tagbase+0)
+    comm.Sendrecv(sendbuf=arr[-2], dest=down, sendtag=tagbase+1,
+                  recvbuf=arr[0], source=up, recvtag=tagbase+1)
+    # Borda física: Dirichlet 0 (inclusive nos cantos)
+    if up == MPI.PROC_NULL:
+        arr[0] = 0.0
+    if down == MPI.PROC_NULL:
+        arr[-1] = 0.0
+
+def halo_exchange(arr: np.ndarray, dec: Decomp, mode: str, corners: bool = False):
+    """
+    Despacha para a variante de troca de halos escolhida em --mode (linhas + colunas).
+    corners=True: preenche também os cantos (restrição/prolongamento do mg usam os
+    pontos diagonais; SpMV e suavizadores não).
+    """
+    if mode in ("persistent", "overlap"):
+        halo_exchange_persistent(arr, dec)
+    else:
+        if mode == "sendrecv":
+            halo_exchange_sendrecv(arr, dec.comm, dec.up, dec.down, tagbase=100)
+        else:
+            halo_exchange_isendirecv(arr, dec.comm, dec.up, dec.down, tagbase=200)
+        halo_exchange_cols(arr, dec, mode)
+    if corners:
+        halo_exchange_corners(arr, dec)
+
 # ---------- SpMV (A·v) com Laplaciano 5-pontos ----------
-def spmv_Ax(v: np.ndarray, out: np.ndarray, nx: int, comm: MPI.Comm, up: int, down: int, mode: str):
+def spmv_Ax(v: np.ndarray, out: np.ndarray, dec: Decomp, mode: str):
     """
     Aplica A (Laplaciano 5-pontos com Dirichlet 0) sobre 'v' e grava em 'out'.
-    'v' e 'out' têm halos (ny_local+2, nx+2). Decomp. por linhas => trocar apenas linhas fantasmas.
+    'v' e 'out' têm halos (ny_local+2, nx_local+2). Decomp. 1D => só linhas fantasmas
+    vêm dos vizinhos (colunas fantasmas = 0); decomp. 2D => as quatro.
     A v = 4*v - (v_l + v_r + v_u + v_d)   (sem 1/h^2; b já é h^2 f)
     """
-    # Bordas esquerda/direita são Dirichlet 0 → halos laterais = 0
-    v[:, 0]  = 0.0
-    v[:, -1] = 0.0
+    if mode == "overlap":
+        spmv_Ax_overlap(v, out, dec)
+        return
 
-    # Halos superior/inferior vindos dos vizinhos
-    if mode == "sendrecv":
-        halo_exchange_sendrecv(v, comm, up, down, tagbase=100)
-    else:
-        halo_exchange_isendirecv(v, comm, up, down, tagbase=200)
+    # Halos vindos dos vizinhos (e Dirichlet 0 nas bordas físicas)
+    halo_exchange(v, dec, mode)
 
     # Aplica stencil no interior
     # out = A v
     out[1:-1, 1:-1] = (4.0 * v[1:-1, 1:-1]
                        - (v[1:-1, 2:] + v[1:-1, :-2] + v[2:, 1:-1] + v[:-2, 1:-1]))
 
+def stencil_block(v: np.ndarray, out: np.ndarray, i0: int, i1: int, j0: int, j1: int):
+    """out = A v só no bloco [i0:i1, j0:j1] (índices do array com halos)."""
+    out[i0:i1, j0:j1] = (4.0 * v[i0:i1, j0:j1]
+                         - (v[i0:i1, j0+1:j1+1] + v[i0:i1, j0-1:j1-1]
+                            + v[i0+1:i1+1, j0:j1] + v[i0-1:i1-1, j0:j1]))
+
+def spmv_Ax_overlap(v: np.ndarray, out: np.ndarray, dec: Decomp):
+    """
+    SpMV com sobreposição comunicação/computação (--mode overlap):
+      1) inicia a troca de halos não-bloqueante (requisições persistentes);
+      2) aplica o stencil no miolo que não lê fantasmas vindos de vizinhos
+         (linhas 2..ny_local-1; no 2D também colunas 2..nx_local-1);
+      3) espera a troca e termina a moldura (linhas/colunas de borda).
+    Acumula em dec.overlap_stats o tempo do miolo e o tempo bloqueado no Waitall.
+    """
+    ny, nx = v.shape[0] - 2, v.shape[1] - 2
+    t0 = MPI.Wtime()
+    reqs = halo_start_persistent(v, dec)
+
+    # Lados em borda física (PROC_NULL) já têm fantasma = 0: entram no miolo
+    i0 = 2 if dec.up    != MPI.PROC_NULL else 1
+    i1 = ny if dec.down != MPI.PROC_NULL else ny + 1
+    j0 = 2 if dec.left  != MPI.PROC_NULL else 1
+    j1 = nx if dec.right != MPI.PROC_NULL else nx + 1
+    if i1 > i0 and j1 > j0:
+        stencil_block(v, out, i0, i1, j0, j1)
+    t1 = MPI.Wtime()
+
+    if reqs:
+        MPI.Request.Waitall(reqs)
+    t2 = MPI.Wtime()
+
+    # Moldura que depende dos fantasmas recebidos
+    if i0 == 2:
+        stencil_block(v, out, 1, 2, 1, nx + 1)
+    if i1 == ny:
+        stencil_block(v, out, ny, ny + 1, 1, nx + 1)
+    if j0 == 2 and i1 > i0:
+        stencil_block(v, out, i0, i1, 1, 2)
+    if j1 == nx and i1 > i0:
+        stencil_block(v, out, i0, i1, nx, nx + 1)
+
+    dec.overlap_stats += (1.0, t1 - t0, t2 - t1)
+
+def overlap_report(dec: Decomp):
+    """
+    Resume --mode overlap no nível fino (médias por SpMV, máximo entre ranks):
+    tempo do miolo, tempo bloqueado no Waitall e a fração sobreposta =
+    t_miolo / (t_miolo + t_espera), i.e. a parte da "janela" da troca
+    (do Startall ao fim do Waitall) em que a CPU fez trabalho útil.
+    """
+    calls, t_int, t_wait = dec.overlap_stats
+    calls = max(calls, 1.0)
+    t_int  = dec.comm.allreduce(t_int / calls, op=MPI.MAX)
+    t_wait = dec.comm.allreduce(t_wait / calls, op=MPI.MAX)
+    frac = t_int / (t_int + t_wait) if t_int + t_wait > 0 else 0.0
+    return t_int, t_wait, frac
+
 # ---------- produtos internos globais ----------
 def dot_global(a: np.ndarray, b: np.ndarray, comm: MPI.Comm) -> float:
     """<a, b> global (só interior)."""
     loc = float(np.dot(a.ravel(), b.ravel()))
     return comm.allreduce(loc, op=MPI.SUM)
 
-# ---------- CG principal ----------
-def conjugate_gradient(nx: int, ny: int, max_iters: int, tol: float, mode: str):
-    comm  = MPI.COMM_WORLD
-    rank  = comm.Get_rank()
-    size  = comm.Get_size()
+def dots_global(pairs, comm: MPI.Comm) -> np.ndarray:
+    """Vários <a, b> globais num único Allreduce (buffer NumPy empacotado)."""
+    loc = np.array([np.dot(a.ravel(), b.ravel()) for a, b in pairs], dtype=np.float64)
+    glob = np.empty_like(loc)
+    comm.Allreduce(loc, glob, op=MPI.SUM)
+    return glob
+
+def dots_global_rhs(pairs, comm: MPI.Comm) -> np.ndarray:
+    """
+    Produtos internos coluna a coluna de vetores com eixo final de k lados
+    direitos: devolve shape (len(pairs), k) com UM Allreduce de len(pairs)*k valores.
+    """
+    k = pairs[0][0].shape[-1]
+    loc = np.concatenate([np.einsum("ik,ik->k", a.reshape(-1, k), b.reshape(-1, k))
+                          for a, b in pairs])
+    glob = np.empty_like(loc)
+    comm.Allreduce(loc, glob, op=MPI.SUM)
+    return glob.reshape(len(pairs), -1)
 
-    # Partição de linhas
-    counts, displs = split_rows(ny, size)
-    ny_local = int(counts[rank])
+INT = np.s_[1:-1, 1:-1]   # fatia do interior (sem halos)
 
-    # Vizinhos 1D (por linhas)
-    up   = rank - 1 if rank > 0        else MPI.PROC_NULL
-    down = rank + 1 if rank < size - 1 else MPI.PROC_NULL
+# ---------- pré-condicionadores: precond(r, z) grava z = M^{-1} r ----------
+# Todos operam nos arrays com halos (ny_local+2, nx_local+2) e só escrevem o interior de z.
+# M precisa ser simétrica positiva definida para o CG: por isso o SSOR é
+# simétrico (ida R→B, volta B→R) e o V-cycle tem pré/pós-suavização iguais e
+# restrição = (prolongação)^T / 4.
 
-    # Passo de malha para b = h^2 f   (f=1)
-    hx = 1.0 / (nx + 1)
-    hy = 1.0 / (ny + 1)
-    assert abs(hx - hy) < 1e-12, "Exemplo assume hx == hy; use Nx == Ny."
-    h2 = hx * hy  # com hx==hy, isso vira hx^2
+def make_jacobi(diag: float = 4.0):
+    """Jacobi (diagonal). Com o Laplaciano 5-pontos a diagonal é constante (4),
+    então só reescala o resíduo: não muda o número de iterações (referência)."""
+    def precond(r, z):
+        z[INT] = r[INT] / diag
+    return precond
 
-    # Vetores com halos
-    x  = alloc_with_halos(nx, ny_local)  # solução
-    r  = alloc_with_halos(nx, ny_local)  # resíduo
-    p  = alloc_with_halos(nx, ny_local)  # direção de busca
-    Ap = alloc_with_halos(nx, ny_local)  # A·p
+def red_black_masks(dec: Decomp):
+    """Máscaras vermelho/preto do interior pela paridade GLOBAL (linha + coluna)."""
+    gi = dec.gy0 + np.arange(1, dec.ny + 1)[:, None]
+    gj = dec.gx0 + np.arange(1, dec.nx + 1)[None, :]
+    red = (gi + gj) % 2 == 0
+    return red, ~red
 
-    # Monta b (interior): b = h^2 * f, com f=1 → b = h^2
-    b = alloc_with_halos(nx, ny_local)
-    b[1:-1, 1:-1] = h2
+def make_ssor(dec: Decomp, mode: str, omega: float = 1.0):
+    """
+    SSOR com ordenação vermelho-preto global: ida (R, B) + volta (B, R) partindo de z=0.
+    Cada meia-varredura atualiza uma cor e troca halos antes (a outra cor pode
+    estar no vizinho). Com omega=1 é o Gauss–Seidel simétrico.
+    """
+    red, black = red_black_masks(dec)
+
+    def half_sweep(z, r, mask):
+        halo_exchange(z, dec, mode)
+        zi = z[INT]
+        gs = 0.25 * (r[INT] + z[1:-1, 2:] + z[1:-1, :-2] + z[2:, 1:-1] + z[:-2, 1:-1])
+        zi[mask] = (1.0 - omega) * zi[mask] + omega * gs[mask]
+
+    def precond(r, z):
+        z[...] = 0.0
+        for mask in (red, black, black, red):
+            half_sweep(z, r, mask)
+    return precond
+
+def coarsen_axis(n: int, g0: int):
+    """
+    Eixo com n pontos locais, índice global g = g0 + i (i = 1..n, halo em 0 e n+1).
+    Os pontos grossos são os de g par (G = g/2), o que exige N global ímpar.
+    Retorna (n_c, g0_c, i1, lo, hi):
+      i1     = 1º índice fino local que também é ponto grosso
+      lo, hi = índices grossos (com halo) vizinhos de cada ponto fino i=1..n
+               (iguais quando g é par; consecutivos quando g é ímpar)
+    """
+    i1 = 1 if (g0 + 1) % 2 == 0 else 2
+    n_c = max(0, (n - i1) // 2 + 1)
+    g0_c = (g0 + i1) // 2 - 1
+    g = g0 + np.arange(1, n + 1)
+    lo = g // 2 - g0_c
+    hi = (g + 1) // 2 - g0_c
+    return n_c, g0_c, i1, lo, hi
+
+def restrict_fw(t: np.ndarray, out: np.ndarray, i1: int, nyc: int, j1: int, nxc: int):
+    """Full-weighting (1/16)[1 2 1; 2 4 2; 1 2 1] de t (halos válidos) para out[INT]."""
+    def sl(start, n, shift):
+        return slice(start + shift, start + shift + 2 * n - 1, 2)
+    R0, Rm, Rp = sl(i1, nyc, 0), sl(i1, nyc, -1), sl(i1, nyc, +1)
+    C0, Cm, Cp = sl(j1, nxc, 0), sl(j1, nxc, -1), sl(j1, nxc, +1)
+    out[INT] = (4.0 * t[R0, C0]
+                + 2.0 * (t[Rm, C0] + t[Rp, C0] + t[R0, Cm] + t[R0, Cp])
+                + (t[Rm, Cm] + t[Rm, Cp] + t[Rp, Cm] + t[Rp, Cp])) / 16.0
+
+def prolong_bilinear_add(ec: np.ndarray, e: np.ndarray, rlo, rhi, clo, chi):
+    """e[INT] += interpolação bilinear de ec (halos válidos)."""
+    e[INT] += 0.25 * (ec[np.ix_(rlo, clo)] + ec[np.ix_(rlo, chi)]
+                      + ec[np.ix_(rhi, clo)] + ec[np.ix_(rhi, chi)])
+
+def make_multigrid(dec: Decomp, mode: str, nu: int = 2, omega: float = 0.8,
+                   coarse_sweeps: int = 30, max_levels: int = 20):
+    """
+    Um V-cycle distribuído como pré-condicionador, na MESMA decomposição do CG:
+    cada rank engrossa o seu bloco, e todos os níveis usam spmv_Ax/halo_exchange
+    com os mesmos vizinhos (dec.sub).
+    Engrossa enquanto Nx, Ny globais forem ímpares e todo rank mantiver >= 1 ponto
+    grosso por eixo (por isso use Nx = Ny = 2^k - 1). No nível mais grosso:
+    coarse_sweeps Jacobi. Operador grosso = mesmo stencil sem escala, com
+    rhs grosso = 4 * FW(resíduo).
+    """
+    # hierarquia de decomposições por nível + índices de transferência
+    decs = [dec]
+    transfers = []
+    while len(decs) < max_levels:
+        d = decs[-1]
+        if d.Nx % 2 == 0 or d.Ny % 2 == 0 or d.Nx < 3 or d.Ny < 3:
+            break
+        nyc, gy0c, i1, rlo, rhi = coarsen_axis(d.ny, d.gy0)
+        nxc, gx0c, j1, clo, chi = coarsen_axis(d.nx, d.gx0)
+        if d.comm.allreduce(min(nyc, nxc), op=MPI.MIN) < 1:
+            break
+        transfers.append((i1, nyc, j1, nxc, rlo, rhi, clo, chi))
+        decs.append(d.sub(nxc, nyc, gx0c, gy0c))
+
+    # arrays de trabalho por nível, alocados uma vez: e (correção), f (rhs), t (temp)
+    E = [d.alloc() for d in decs]
+    F = [d.alloc() for d in decs]
+    T = [d.alloc() for d in decs]
+    nlev = len(decs)
+
+    def smooth(l, sweeps):
+        e, f, t = E[l], F[l], T[l]
+        for _ in range(sweeps):
+            spmv_Ax(e, t, decs[l], mode)
+            e[INT] += (omega / 4.0) * (f[INT] - t[INT])
+
+    def vcycle(l):
+        e, f, t = E[l], F[l], T[l]
+        e[...] = 0.0
+        if l == nlev - 1:
+            smooth(l, coarse_sweeps)
+            return
+        smooth(l, nu)
+        # resíduo t = f - A e, com halos para a restrição
+        spmv_Ax(e, t, decs[l], mode)
+        t[INT] = f[INT] - t[INT]
+        halo_exchange(t, decs[l], mode, corners=True)
+        i1, nyc, j1, nxc, rlo, rhi, clo, chi = transfers[l]
+        restrict_fw(t, F[l + 1], i1, nyc, j1, nxc)
+        F[l + 1][INT] *= 4.0
+        vcycle(l + 1)
+        # correção grossa (com halos dos vizinhos) → fino
+        ec = E[l + 1]
+        halo_exchange(ec, decs[l + 1], mode, corners=True)
+        prolong_bilinear_add(ec, e, rlo, rhi, clo, chi)
+        smooth(l, nu)
+
+    def precond(r, z):
+        F[0][INT] = r[INT]
+        vcycle(0)
+        z[INT] = E[0][INT]
+
+    precond.levels = nlev
+    return precond
+
+def make_preconditioner(kind: str, dec: Decomp, mode: str):
+    """Fábrica: devolve precond(r, z) ou None (CG sem pré-condicionador)."""
+    if kind == "jacobi":
+        return make_jacobi()
+    if kind == "ssor":
+        return make_ssor(dec, mode)
+    if kind == "mg":
+        pc = make_multigrid(dec, mode)
+        if dec.comm.Get_rank() == 0:
+            print(f"[mg] {pc.levels} níveis")
+            if pc.levels == 1:
+                print("[mg] Aviso: sem engrossamento; use Nx = Ny = 2^k - 1 (ex.: 127, 255).")
+        return pc
+    return None
+
+# ---------- CG clássico: 2 Allreduce bloqueantes por iteração ----------
+def cg_loop_classic(apply_A, alloc, b, x, max_iters: int, tol: float, comm: MPI.Comm,
+                    precond=None, I=INT):
+    """
+    CG de Hestenes–Stiefel (PCG se 'precond' for dado). Por iteração: 1 SpMV +
+    2 reduções (pAp e, depois, <r,r> junto com <r,z> num só buffer).
+    A parada usa sempre o resíduo NÃO pré-condicionado ||r||/||r0||. Retorna (rel, it).
+    O laço só conhece apply_A(v, out), alloc() e a fatia I dos valores próprios do
+    rank (padrão: interior da malha com halos; ver cg_csr_mpi.py para vetores CSR).
+    """
+    rank = comm.Get_rank()
+    r  = alloc()  # resíduo
+    p  = alloc()  # direção de busca
+    Ap = alloc()  # A·p
+    z  = alloc() if precond else r  # z = M^{-1} r  (sem pré-condicionador: z é r)
 
-    # Inicialização CG
     # x = 0 ⇒ r = b - A x = b
-    r[1:-1, 1:-1] = b[1:-1, 1:-1]
-    p[1:-1, 1:-1] = r[1:-1, 1:-1]
+    r[I] = b[I]
+    if precond:
+        precond(r, z)
+    p[I] = z[I]
 
     # Norma relativa do resíduo
-    rr = dot_global(r[1:-1, 1:-1], r[1:-1, 1:-1], comm)
+    if precond:
+        rr, rz = dots_global([(r[I], r[I]), (r[I], z[I])], comm).tolist()
+    else:
+        rr = rz = dot_global(r[I], r[I], comm)
     rr0 = max(rr, 1e-30)  # evita divisões por zero se b=0
     rel = math.sqrt(rr / rr0)
     if rank == 0:
         print(f"[init] ||r||/||r0|| = {rel:.3e}  (rr={rr:.3e})")
 
-    # Iterações CG
+    it = 0
     for it in range(1, max_iters + 1):
         # Ap = A p
-        spmv_Ax(p, Ap, nx, comm, up, down, mode)
+        apply_A(p, Ap)
 
-        pAp = dot_global(p[1:-1, 1:-1], Ap[1:-1, 1:-1], comm)
+        pAp = dot_global(p[I], Ap[I], comm)
         if abs(pAp) < 1e-30:
             if rank == 0:
                 print(f"[CG] p^T(Ap) ~ 0 na iteração {it}, parando.")
             break
 
-        alpha = rr / pAp
+        alpha = rz / pAp
 
         # Atualizações locais (somente interior)
-        x[1:-1, 1:-1]  += alpha * p[1:-1, 1:-1]
-        r[1:-1, 1:-1]  -= alpha * Ap[1:-1, 1:-1]
+        x[I] += alpha * p[I]
+        r[I] -= alpha * Ap[I]
 
-        rr_new = dot_global(r[1:-1, 1:-1], r[1:-1, 1:-1], comm)
+        if precond:
+            precond(r, z)
+            rr_new, rz_new = dots_global([(r[I], r[I]), (r[I], z[I])], comm).tolist()
+        else:
+            rr_new = rz_new = dot_global(r[I], r[I], comm)
         rel = math.sqrt(rr_new / rr0)
 
         if rank == 0 and (it == 1 or it % 10 == 0 or rel < tol):
@@ -181,12 +653,607 @@ def conjugate_gradient(nx: int, ny: int, max_iters: int, tol: float, mode: str):
         if rel < tol:
             break
 
-        beta = rr_new / rr
-        # p = r + beta * p
-        p[1:-1, 1:-1] = r[1:-1, 1:-1] + beta * p[1:-1, 1:-1]
+        beta = rz_new / rz
+        # p = z + beta * p
+        p[I] = z[I] + beta * p[I]
+        rz = rz_new
+
+    return rel, it
+
+# ---------- CG pipelined (Ghysels–Vanroose): 1 Iallreduce por iteração ----------
+def cg_loop_pipelined(apply_A, alloc, b, x, max_iters: int, tol: float, comm: MPI.Comm,
+                      precond=None, I=INT):
+    """
+    CG "pipelined" (Ghysels & Vanroose, 2014), com pré-condicionador opcional.
+    Recorrências extras (u = M r, w = A u, s = A p, q = M s, z = A q) permitem
+    calcular gamma = <r,u>, delta = <w,u> e <r,r> juntos: os produtos locais vão
+    num único buffer NumPy e são reduzidos por UM Iallreduce não-bloqueante,
+    sobreposto a m = M w e n = A m. Retorna (rel, it), com 'it' = número de
+    atualizações de x (comparável ao CG clássico).
+    Obs.: a sobreposição real depende do progresso assíncrono da biblioteca MPI.
+    """
+    rank = comm.Get_rank()
+    r = alloc()  # resíduo
+    w = alloc()  # w = A u
+    n = alloc()  # n = A m
+    p = alloc()  # direção de busca
+    s = alloc()  # s = A p
+    z = alloc()  # z = A q
+    if precond:
+        u = alloc()  # u = M^{-1} r
+        m = alloc()  # m = M^{-1} w
+        q = alloc()  # q = M^{-1} s
+    else:
+        u, m, q = r, w, s  # M = I: as recorrências coincidem
+
+    # x = 0 ⇒ r = b ; u = M r ; w = A u
+    r[I] = b[I]
+    if precond:
+        precond(r, u)
+    apply_A(u, w)
+
+    loc  = np.empty(3, dtype=np.float64)  # [<r,u>, <w,u>, <r,r>] locais (empacotados)
+    glob = np.empty(3, dtype=np.float64)  # resultado global
+
+    rr0 = 1.0
+    gamma_old = alpha_old = 1.0
+    rel = 1.0
+    it = 0
+    while True:
+        loc[0] = np.dot(r[I].ravel(), u[I].ravel())
+        loc[1] = np.dot(w[I].ravel(), u[I].ravel())
+        loc[2] = np.dot(r[I].ravel(), r[I].ravel()) if precond else loc[0]
+        req = comm.Iallreduce(loc, glob, op=MPI.SUM)
+
+        # Sobreposição: pré-condicionador + SpMV enquanto a redução está em andamento
+        if precond:
+            precond(w, m)
+        apply_A(m, n)
+
+        req.Wait()
+        gamma, delta, rr = float(glob[0]), float(glob[1]), float(glob[2])
+
+        if it == 0:
+            rr0 = max(rr, 1e-30)
+        rel = math.sqrt(max(rr, 0.0) / rr0)
+        if rank == 0:
+            if it == 0:
+                print(f"[init] ||r||/||r0|| = {rel:.3e}  (rr={rr:.3e})")
+            elif it == 1 or it % 10 == 0 or rel < tol:
+                print(f"[it {it:4d}] ||r||/||r0|| = {rel:.3e}")
+
+        if rel < tol or it >= max_iters:
+            break
+
+        if it == 0:
+            beta = 0.0
+            denom = delta
+        else:
+            beta = gamma / gamma_old
+            denom = delta - beta * gamma / alpha_old
+        if abs(denom) < 1e-30:
+            if rank == 0:
+                print(f"[CG-pipe] denominador ~ 0 na iteração {it + 1}, parando.")
+            break
+        alpha = gamma / denom
+
+        # Atualizações locais (somente interior), sem nova comunicação
+        z[I] = n[I] + beta * z[I]
+        if precond:
+            q[I] = m[I] + beta * q[I]
+        s[I] = w[I] + beta * s[I]
+        p[I] = u[I] + beta * p[I]
+        x[I] += alpha * p[I]
+        r[I] -= alpha * s[I]
+        if precond:
+            u[I] -= alpha * q[I]
+        w[I] -= alpha * z[I]
+
+        gamma_old, alpha_old = gamma, alpha
+        it += 1
+
+    return rel, it
+
+# ---------- CG com vários lados direitos (--nrhs k) ----------
+def cg_loop_multi(apply_A, alloc, b, x, max_iters: int, tol: float, comm: MPI.Comm,
+                  precond=None, I=INT):
+    """
+    k CGs simultâneos sobre o mesmo operador: x, r, p, Ap têm um eixo final de
+    k colunas, e alpha, beta, <r,r> viram arrays de tamanho k. A comunicação é
+    compartilhada: cada SpMV faz UMA troca de halos levando as k colunas (o
+    stencil roda em lote) e os k produtos internos de cada etapa vão num único
+    Allreduce (dots_global_rhs). Colunas que já convergiram ficam congeladas
+    (alpha = beta = 0). Para quando todas convergem; retorna (max rel, it).
+    """
+    rank = comm.Get_rank()
+    r  = alloc()  # resíduos (k colunas)
+    p  = alloc()  # direções de busca
+    Ap = alloc()  # A·p
+    z  = alloc() if precond else r
+
+    def safe_div(num, den, active):
+        return np.divide(num, den, out=np.zeros_like(num), where=active & (den != 0.0))
+
+    r[I] = b[I]
+    if precond:
+        precond(r, z)
+    p[I] = z[I]
+
+    if precond:
+        rr, rz = dots_global_rhs([(r[I], r[I]), (r[I], z[I])], comm)
+    else:
+        rr = rz = dots_global_rhs([(r[I], r[I])], comm)[0]
+    rr0 = np.maximum(rr, 1e-30)
+    rel = np.sqrt(rr / rr0)
+    active = rel >= tol
+    if rank == 0:
+        print(f"[init] k={rr.size} lados direitos, max ||r||/||r0|| = {rel.max():.3e}")
+
+    it = 0
+    for it in range(1, max_iters + 1):
+        apply_A(p, Ap)
+
+        pAp = dots_global_rhs([(p[I], Ap[I])], comm)[0]
+        alpha = safe_div(rz, pAp, active)
+
+        x[I] += alpha * p[I]
+        r[I] -= alpha * Ap[I]
+
+        if precond:
+            precond(r, z)
+            rr, rz_new = dots_global_rhs([(r[I], r[I]), (r[I], z[I])], comm)
+        else:
+            rr = rz_new = dots_global_rhs([(r[I], r[I])], comm)[0]
+        rel = np.sqrt(rr / rr0)
+        active = rel >= tol
+
+        if rank == 0 and (it == 1 or it % 10 == 0 or not active.any()):
+            print(f"[it {it:4d}] max ||r||/||r0|| = {rel.max():.3e}  (convergidas: {rel.size - active.sum()}/{rel.size})")
+
+        if not active.any():
+            break
+
+        beta = safe_div(rz_new, rz, active)
+        p[I] = z[I] + beta * p[I]
+        rz = rz_new
+
+    return float(rel.max()), it
+
+# ---------- CG s-step (evita comunicação): halos de profundidade s ----------
+def halo_exchange_deep(arr: np.ndarray, dec: Decomp, d: int, tagbase: int = 500):
+    """
+    Troca de halos de profundidade d ('arr' com d camadas fantasmas por lado e
+    eixo final opcional). Primeiro oeste/leste (linhas interiores), depois
+    norte/sul com a largura toda: assim os cantos, necessários para A^k com
+    k >= 2, chegam em duas etapas. Bordas físicas (PROC_NULL): fantasmas = 0.
+    """
+    comm = dec.comm
+    if dec.left != MPI.PROC_NULL or dec.right != MPI.PROC_NULL:
+        send = np.ascontiguousarray(arr[d:-d, d:2 * d])
+        recv = np.zeros_like(send)   # fica 0 se a origem for PROC_NULL
+        comm.Sendrecv(sendbuf=send, dest=dec.left, sendtag=tagbase+0,
+                      recvbuf=recv, source=dec.right, recvtag=tagbase+0)
+        arr[d:-d, -d:] = recv
+        send = np.ascontiguousarray(arr[d:-d, -2 * d:-d])
+        recv = np.zeros_like(send)
+        comm.Sendrecv(sendbuf=send, dest=dec.right, sendtag=tagbase+1,
+                      recvbuf=recv, source=dec.left, recvtag=tagbase+1)
+        arr[d:-d, :d] = recv
+    else:
+        arr[:, :d] = 0.0
+        arr[:, -d:] = 0.0
+
+    # d linhas inteiras são blocos contíguos: sem cópia
+    if dec.up == MPI.PROC_NULL:
+        arr[:d] = 0.0
+    if dec.down == MPI.PROC_NULL:
+        arr[-d:] = 0.0
+    comm.Sendrecv(sendbuf=arr[d:2 * d], dest=dec.up, sendtag=tagbase+2,
+                  recvbuf=arr[-d:], source=dec.down, recvtag=tagbase+2)
+    comm.Sendrecv(sendbuf=arr[-2 * d:-d], dest=dec.down, sendtag=tagbase+3,
+                  recvbuf=arr[:d], source=dec.up, recvtag=tagbase+3)
+
+def domain_mask(dec: Decomp, d: int) -> np.ndarray:
+    """1 nos pontos do bloco estendido (d camadas) dentro do domínio global, 0 fora."""
+    gi = dec.gy0 + np.arange(1 - d, dec.ny + d + 1)
+    gj = dec.gx0 + np.arange(1 - d, dec.nx + d + 1)
+    inside = ((gi >= 1) & (gi <= dec.Ny))[:, None] & ((gj >= 1) & (gj <= dec.Nx))[None, :]
+    return inside.astype(np.float64)[:, :, None]
+
+def matrix_powers_cheb(W: np.ndarray, mask: np.ndarray, s: int):
+    """
+    "Matrix powers" sem comunicação: com W[0] válido até s camadas fora do
+    interior, calcula W[k] = T_k(θ) W[0], k = 1..s, com θ = (A - 4I)/4 e T_k os
+    polinômios de Chebyshev (o espectro de A, em (0, 8), vira (-1, 1): base bem
+    condicionada mesmo para s = 8, ao contrário da base monomial A^k).
+    Cada potência perde uma camada: W[k] é válido até s-k camadas fora do interior.
+    """
+    n0, n1 = W.shape[1], W.shape[2]
+    for k in range(1, s + 1):
+        v = W[k - 1]
+        R, C = slice(k, n0 - k), slice(k, n1 - k)
+        # θ v = -(v_l + v_r + v_u + v_d) / 4
+        th = -0.25 * (v[k:n0-k, k+1:n1-k+1] + v[k:n0-k, k-1:n1-k-1]
+                      + v[k+1:n0-k+1, k:n1-k] + v[k-1:n0-k-1, k:n1-k])
+        if k == 1:
+            W[1, R, C] = th
+        else:
+            W[k, R, C] = 2.0 * th - W[k - 2, R, C]
+        W[k, R, C] *= mask[R, C]   # Dirichlet: nada "vaza" para fora do domínio
+
+def cheb_change_of_basis(m: int) -> np.ndarray:
+    """
+    B (m+1)x(m+1) com A P_j = sum_i B[i, j] P_i, j < m, para P_j = T_j(θ) v:
+    A P_0 = 4 P_0 + 4 P_1 ;  A P_j = 2 P_{j-1} + 4 P_j + 2 P_{j+1}.
+    A última coluna fica 0 (A P_m sairia da base).
+    """
+    B = np.zeros((m + 1, m + 1))
+    for j in range(m):
+        B[j, j] = 4.0
+        if j == 0:
+            B[1, 0] = 4.0
+        else:
+            B[j - 1, j] = 2.0
+            B[j + 1, j] = 2.0
+    return B
+
+def cg_loop_sstep(dec: Decomp, b, x, max_iters: int, tol: float, s: int):
+    """
+    CG s-step / "communication-avoiding" (Chronopoulos–Gear, Hoemmen, Carson).
+    A cada bloco de s iterações:
+      1) UMA troca de halos de profundidade s de [p, r] (um único array com eixo
+         final 2, então as mesmas mensagens levam os dois vetores);
+      2) base de Krylov local Y = [T_0..T_s (p), T_0..T_{s-1} (r)] (2s+1 colunas)
+         por matrix_powers_cheb, sem comunicação;
+      3) UM Allreduce da matriz de Gram G = Y^T Y ((2s+1)^2 valores);
+      4) s iterações de CG nas coordenadas (p', r', x' de tamanho 2s+1), com
+         <u, v> = u'^T G v' e A Y = Y B: nenhuma comunicação;
+      5) recupera x += Y x', r = Y r', p = Y p'.
+    Mesmo número de iterações do CG clássico em aritmética exata. Retorna (rel, it).
+    """
+    rank = dec.comm.Get_rank()
+    d = s
+    ny, nx = dec.ny, dec.nx
+    assert dec.comm.allreduce(min(ny, nx), op=MPI.MIN) >= s, \
+        "s-step: cada rank precisa de pelo menos s linhas e colunas (use s menor ou menos ranks)."
+
+    W = np.zeros((s + 1, ny + 2 * d, nx + 2 * d, 2))   # W[k, ..., 0] = T_k p ; W[k, ..., 1] = T_k r
+    core = np.s_[d:-d, d:-d]
+    mask = domain_mask(dec, d)
+    m = 2 * s + 1
+    B = np.zeros((m, m))
+    B[:s + 1, :s + 1] = cheb_change_of_basis(s)
+    B[s + 1:, s + 1:] = cheb_change_of_basis(s - 1)
+    Y = np.empty((m, ny * nx))
+    G = np.empty((m, m))
+
+    r = b[INT].copy()
+    p = r.copy()
+    rr0 = None
+    rel = 1.0
+    it = 0
+    done = False
+    while not done:
+        W[0][core + (0,)] = p
+        W[0][core + (1,)] = r
+        halo_exchange_deep(W[0], dec, d)
+        matrix_powers_cheb(W, mask, s)
+
+        Wc = W[(slice(None),) + core]
+        Y[:s + 1] = Wc[:, :, :, 0].reshape(s + 1, -1)
+        Y[s + 1:] = Wc[:s, :, :, 1].reshape(s, -1)
+        dec.comm.Allreduce(Y @ Y.T, G, op=MPI.SUM)
+
+        pc = np.zeros(m); pc[0] = 1.0
+        rc = np.zeros(m); rc[s + 1] = 1.0
+        xc = np.zeros(m)
+        rr = G[s + 1, s + 1]
+        if rr0 is None:
+            rr0 = max(rr, 1e-30)
+            if rank == 0:
+                print(f"[init] ||r||/||r0|| = {math.sqrt(rr / rr0):.3e}  (rr={rr:.3e}, s={s})")
+
+        for _ in range(s):
+            Bp = B @ pc
+            pAp = pc @ G @ Bp
+            if abs(pAp) < 1e-30:
+                if rank == 0:
+                    print(f"[CG-s] p^T(Ap) ~ 0 na iteração {it + 1}, parando.")
+                done = True
+                break
+            alpha = rr / pAp
+            xc += alpha * pc
+            rc -= alpha * Bp
+            rr_new = max(rc @ G @ rc, 0.0)
+            it += 1
+            rel = math.sqrt(rr_new / rr0)
+            if rank == 0 and (it == 1 or it % 10 == 0 or rel < tol):
+                print(f"[it {it:4d}] ||r||/||r0|| = {rel:.3e}")
+            if rel < tol or it >= max_iters:
+                done = True
+                break
+            beta = rr_new / rr
+            pc = rc + beta * pc
+            rr = rr_new
+
+        x[INT] += (xc @ Y).reshape(ny, nx)
+        if not done:
+            r = (rc @ Y).reshape(ny, nx)
+            p = (pc @ Y).reshape(ny, nx)
+
+    return rel, it
+
+def comm_counts(variant: str, it: int, s: int = 1):
+    """(trocas de halo, Allreduce) por rank em 'it' iterações de cada variante."""
+    if variant == "sstep":
+        outer = -(-it // s)
+        return outer, outer
+    return it, 2 * it + 1   # clássico: 1 SpMV + 2 reduções por iteração (+1 inicial)
+
+# ---------- precisão mista: CG float32 + refinamento iterativo float64 ----------
+def cg_loop_mixed(dec: Decomp, mode: str, b, x, max_iters: int, tol: float,
+                  precond=None, delta: float = 0.1):
+    """
+    CG em precisão mista com "reliable updates" (refinamento iterativo sem
+    reiniciar o espaço de Krylov, como nos solvers mistos de QCD):
+      - SpMV, axpys, produtos internos e halos (MPI.FLOAT) em float32: metade
+        dos bytes por iteração num laço limitado por banda de memória;
+      - a correção y (float32) é somada a x (float64) sempre que ||r|| cai por
+        um fator delta desde o último refinamento; então r = b - A x é
+        recalculado em float64 (halos MPI.DOUBLE) e substitui o resíduo float32,
+        mas a direção p é mantida (reiniciar o CG a cada refinamento custaria
+        muitas iterações a mais quando A é mal condicionada).
+    A parada usa o resíduo verdadeiro em float64: ||b - A x||/||b|| < tol, a mesma
+    precisão final do CG em float64. Vetores internos e pré-condicionador usam
+    dec.dtype (float32); b e x são float64. Retorna (rel, it).
+    """
+    comm = dec.comm
+    rank = comm.Get_rank()
+    r64 = dec.alloc(np.float64)   # resíduo verdadeiro
+    A64 = dec.alloc(np.float64)
+    r   = dec.alloc()             # float32 daqui para baixo
+    p   = dec.alloc()
+    Ap  = dec.alloc()
+    y   = dec.alloc()             # correção acumulada desde o último refinamento
+    z   = dec.alloc() if precond else r
+
+    def true_residual():
+        spmv_Ax(x, A64, dec, mode)
+        r64[INT] = b[INT] - A64[INT]
+        r[INT] = r64[INT]
+        return dot_global(r64[INT], r64[INT], comm)
+
+    rr = true_residual()
+    rr0 = max(rr, 1e-30)
+    r_ref = math.sqrt(rr)   # ||r|| no último refinamento
+    if precond:
+        precond(r, z)
+    p[INT] = z[INT]
+    rz = dot_global(r[INT], z[INT], comm) if precond else rr
+    rel = math.sqrt(rr / rr0)
+    nref = 0
+    if rank == 0:
+        print(f"[init] ||r||/||r0|| = {rel:.3e}  (rr={rr:.3e}, CG float32 + refinamento float64)")
+
+    it = 0
+    for it in range(1, max_iters + 1):
+        spmv_Ax(p, Ap, dec, mode)
+        pAp = dot_global(p[INT], Ap[INT], comm)
+        if abs(pAp) < 1e-30:
+            if rank == 0:
+                print(f"[CG] p^T(Ap) ~ 0 na iteração {it}, parando.")
+            break
+        alpha = rz / pAp
+        y[INT] += alpha * p[INT]
+        r[INT] -= alpha * Ap[INT]
+        rr = dot_global(r[INT], r[INT], comm)
+
+        if math.sqrt(rr) < delta * r_ref or math.sqrt(rr / rr0) < tol or it == max_iters:
+            # refinamento: x += y em float64 e resíduo verdadeiro
+            x[INT] += y[INT]
+            y[INT] = 0.0
+            rr = true_residual()
+            r_ref = math.sqrt(rr)
+            nref += 1
+        rel = math.sqrt(rr / rr0)
+
+        if rank == 0 and (it == 1 or it % 10 == 0 or rel < tol):
+            print(f"[it {it:4d}] ||r||/||r0|| = {rel:.3e}  (refinamentos: {nref})")
+        if rel < tol:
+            break
+
+        if precond:
+            precond(r, z)
+            rz_new = dot_global(r[INT], z[INT], comm)
+        else:
+            rz_new = rr
+        beta = rz_new / rz
+        p[INT] = z[INT] + beta * p[INT]
+        rz = rz_new
+
+    x[INT] += y[INT]
+    return rel, it
+
+# ---------- backend Numba: kernels fundidos (opcional) ----------
+if njit is not None:
+    @njit(parallel=True)
+    def nb_spmv_dot(v, out):
+        """out = A v no interior e devolve <v, A v> local: 1 passada, sem temporários."""
+        ny, nx = v.shape[0] - 2, v.shape[1] - 2
+        acc = 0.0
+        for i in prange(1, ny + 1):
+            for j in range(1, nx + 1):
+                a = 4.0 * v[i, j] - (v[i, j + 1] + v[i, j - 1] + v[i + 1, j] + v[i - 1, j])
+                out[i, j] = a
+                acc += v[i, j] * a
+        return acc
+
+    @njit(parallel=True)
+    def nb_update_xr(x, r, p, Ap, alpha):
+        """x += alpha p ; r -= alpha Ap e devolve <r, r> local (3 axpys/dot → 1 passada)."""
+        ny, nx = x.shape[0] - 2, x.shape[1] - 2
+        acc = 0.0
+        for i in prange(1, ny + 1):
+            for j in range(1, nx + 1):
+                x[i, j] += alpha * p[i, j]
+                ri = r[i, j] - alpha * Ap[i, j]
+                r[i, j] = ri
+                acc += ri * ri
+        return acc
+
+    @njit(parallel=True)
+    def nb_xpby(p, r, beta):
+        """p = r + beta p no interior (in-place)."""
+        ny, nx = p.shape[0] - 2, p.shape[1] - 2
+        for i in prange(1, ny + 1):
+            for j in range(1, nx + 1):
+                p[i, j] = r[i, j] + beta * p[i, j]
+
+def numba_warmup():
+    """Compila os kernels (JIT) antes da medição de tempo."""
+    a = np.ones((4, 4))
+    nb_spmv_dot(a, a.copy())
+    nb_update_xr(a.copy(), a.copy(), a, a, 0.5)
+    nb_xpby(a.copy(), a, 0.5)
+
+def cg_loop_numba(dec: Decomp, mode: str, b, x, max_iters: int, tol: float):
+    """
+    Mesmo CG de cg_loop_classic (sem pré-condicionador), mas cada iteração faz
+    3 passadas pela memória em vez de ~9 expressões NumPy com temporários:
+      troca de halos de p → nb_spmv_dot (Ap e <p,Ap>) → Allreduce
+      → nb_update_xr (x, r e <r,r>) → Allreduce → nb_xpby (p).
+    Retorna (rel, it).
+    """
+    comm = dec.comm
+    rank = comm.Get_rank()
+    r  = dec.alloc()
+    p  = dec.alloc()
+    Ap = dec.alloc()
+
+    r[INT] = b[INT]
+    p[INT] = r[INT]
+    rr = dot_global(r[INT], r[INT], comm)
+    rr0 = max(rr, 1e-30)
+    rel = math.sqrt(rr / rr0)
+    if rank == 0:
+        print(f"[init] ||r||/||r0|| = {rel:.3e}  (rr={rr:.3e}, backend numba)")
+
+    it = 0
+    for it in range(1, max_iters + 1):
+        halo_exchange(p, dec, mode)
+        pAp = comm.allreduce(nb_spmv_dot(p, Ap), op=MPI.SUM)
+        if abs(pAp) < 1e-30:
+            if rank == 0:
+                print(f"[CG] p^T(Ap) ~ 0 na iteração {it}, parando.")
+            break
+        alpha = rr / pAp
+
+        rr_new = comm.allreduce(nb_update_xr(x, r, p, Ap, alpha), op=MPI.SUM)
+        rel = math.sqrt(rr_new / rr0)
+        if rank == 0 and (it == 1 or it % 10 == 0 or rel < tol):
+            print(f"[it {it:4d}] ||r||/||r0|| = {rel:.3e}")
+        if rel < tol:
+            break
+
+        nb_xpby(p, r, rr_new / rr)
         rr = rr_new
 
-    return x, rel, it
+    return rel, it
+
+# ---------- CG principal ----------
+def halo_words(dec: Decomp, depth: int = 1, nvec: int = 0) -> int:
+    """
+    Quantidade de valores float64 que este rank envia por troca de halos.
+    depth > 1 (halo_exchange_deep, s-step): depth colunas interiores e depth linhas
+    com a largura toda (nx + 2*depth); nvec vetores por ponto (padrão: nrhs).
+    """
+    rows = (dec.up != MPI.PROC_NULL) + (dec.down != MPI.PROC_NULL)
+    cols = (dec.left != MPI.PROC_NULL) + (dec.right != MPI.PROC_NULL)
+    width = dec.nx if depth == 1 else dec.nx + 2 * depth
+    return int((rows * width + cols * dec.ny) * depth * max(nvec or dec.nrhs, 1))
+
+def bench_halo(dec: Decomp, reps: int):
+    """
+    Micro-benchmark: tempo médio por troca de halos (máx. entre ranks) para os
+    três modos, no mesmo vetor. A 1ª chamada de cada modo é aquecimento (no modo
+    persistent é ela que cria as requisições).
+    """
+    v = dec.alloc()
+    v[INT] = 1.0
+    times = {}
+    for mode in ("sendrecv", "isendirecv", "persistent"):
+        halo_exchange(v, dec, mode)
+        dec.comm.Barrier()
+        t0 = MPI.Wtime()
+        for _ in range(reps):
+            halo_exchange(v, dec, mode)
+        times[mode] = dec.comm.allreduce(MPI.Wtime() - t0, op=MPI.MAX) / reps
+    return times
+
+def conjugate_gradient(nx: int, ny: int, max_iters: int, tol: float, mode: str,
+                       variant: str = "classic", precond: str = "none", decomp: str = "1d",
+                       nrhs: int = 0, s: int = 4, precision: str = "double",
+                       backend: str = "numpy", comm: MPI.Comm = None):
+    """
+    Monta o problema (decomposição, vizinhos, b) e executa o laço CG escolhido.
+    Retorna (x, rel, it, t_iter, dec), com t_iter = tempo médio por iteração do laço
+    e dec = decomposição usada (x é o bloco local de dec, com halos).
+    Com nrhs = k > 0 resolve k sistemas de uma vez (cg_loop_multi), com
+    f_j(x, y) = 1 + j*x*y (a coluna 0 é o problema de sempre).
+    variant = "sstep" usa cg_loop_sstep(s) (sem pré-condicionador; ignora 'mode').
+    precision = "mixed": CG float32 com refinamento float64 (cg_loop_mixed).
+    backend = "numba": CG clássico com kernels fundidos (cg_loop_numba).
+    comm: comunicador dos processos que resolvem (padrão MPI.COMM_WORLD).
+    """
+    dec = make_decomp(nx, ny, decomp, comm if comm is not None else MPI.COMM_WORLD)
+    dec.nrhs = nrhs
+    if precision == "mixed":
+        dec.dtype = np.float32   # vetores do CG interno e pré-condicionador
+    comm = dec.comm
+
+    # Passo de malha para b = h^2 f   (f=1)
+    hx = 1.0 / (nx + 1)
+    hy = 1.0 / (ny + 1)
+    assert abs(hx - hy) < 1e-12, "Exemplo assume hx == hy; use Nx == Ny."
+    h2 = hx * hy  # com hx==hy, isso vira hx^2
+
+    def apply_A(v, out):
+        spmv_Ax(v, out, dec, mode)
+
+    M = make_preconditioner(precond, dec, mode)
+
+    x = dec.alloc(np.float64)  # solução
+
+    # Monta b (interior): b = h^2 * f, com f=1 → b = h^2
+    b = dec.alloc(np.float64)
+    if nrhs > 0:
+        X = (dec.gx0 + np.arange(1, dec.nx + 1))[None, :] * hx
+        Y = (dec.gy0 + np.arange(1, dec.ny + 1))[:, None] * hy
+        for j in range(nrhs):
+            b[INT][..., j] = h2 * (1.0 + j * X * Y)
+    else:
+        b[INT] = h2
+
+    if nrhs > 0:
+        loop = cg_loop_multi
+    else:
+        loop = cg_loop_pipelined if variant == "pipelined" else cg_loop_classic
+    if backend == "numba":
+        numba_warmup()
+    comm.Barrier()
+    t0 = MPI.Wtime()
+    if backend == "numba":
+        rel, it = cg_loop_numba(dec, mode, b, x, max_iters, tol)
+    elif variant == "sstep":
+        rel, it = cg_loop_sstep(dec, b, x, max_iters, tol, s)
+    elif precision == "mixed":
+        rel, it = cg_loop_mixed(dec, mode, b, x, max_iters, tol, M)
+    else:
+        rel, it = loop(apply_A, dec.alloc, b, x, max_iters, tol, comm, M)
+    t_loop = comm.allreduce(MPI.Wtime() - t0, op=MPI.MAX)
+    dec.free()
+
+    return x, rel, it, t_loop / max(it, 1), dec
 
 # ---------- main ----------
 def main():
@@ -195,22 +1262,137 @@ def main():
     parser.add_argument("--Ny", type=int, default=128, help="pontos interiores em Y (global)")
     parser.add_argument("--max-iters", type=int, default=200, help="máximo de iterações do CG")
     parser.add_argument("--tol", type=float, default=1e-8, help="tolerância de parada (resíduo relativo)")
-    parser.add_argument("--mode", type=str, default="sendrecv", choices=["sendrecv", "isendirecv"],
-                        help="método de troca de halos (bloqueante ou não-bloqueante)")
+    parser.add_argument("--mode", type=str, default="sendrecv",
+                        choices=["sendrecv", "isendirecv", "persistent", "overlap"],
+                        help="troca de halos: bloqueante, não-bloqueante, persistente ou "
+                             "overlap (persistente + miolo do stencil durante a troca)")
+    parser.add_argument("--variant", type=str, default="classic", choices=["classic", "pipelined", "sstep"],
+                        help="classic: 2 Allreduce/iter | pipelined: 1 Iallreduce/iter sobreposto ao SpMV | "
+                             "sstep: 1 troca de halos (profundidade s) + 1 Allreduce a cada s iterações")
+    parser.add_argument("--s", type=int, nargs="+", default=[2, 4, 8],
+                        help="valores de s para --variant sstep (cada um é comparado ao clássico)")
+    parser.add_argument("--precond", type=str, default="none", choices=["none", "jacobi", "ssor", "mg"],
+                        help="pré-condicionador (mg = V-cycle distribuído; use Nx = Ny = 2^k - 1)")
+    parser.add_argument("--decomp", type=str, default="1d", choices=["1d", "2d", "both"],
+                        help="1d: faixas de linhas | 2d: blocos (Create_cart) | both: compara as duas")
+    parser.add_argument("--bench-halo", type=int, default=0, metavar="REPS",
+                        help="só mede o tempo por troca de halos dos 3 modos (REPS chamadas cada)")
+    parser.add_argument("--precision", type=str, default="double", choices=["double", "mixed"],
+                        help="mixed: CG em float32 (halos MPI.FLOAT) + refinamento iterativo em float64")
+    parser.add_argument("--backend", type=str, default="numpy", choices=["numpy", "numba", "both"],
+                        help="numba: kernels fundidos para o CG clássico | both: compara os dois por iteração")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="threads Numba por processo (0 = usar NUMBA_NUM_THREADS/env)")
+    parser.add_argument("--nrhs", type=int, default=0, metavar="K",
+                        help="resolve K lados direitos juntos (halos e Allreduce compartilhados; "
+                             "só com --variant classic)")
     args = parser.parse_args()
+    if args.nrhs > 0 and args.variant != "classic":
+        parser.error("--nrhs só está implementado para --variant classic")
+    if args.variant == "sstep" and args.precond != "none":
+        parser.error("--variant sstep não suporta pré-condicionador")
+    if args.precision == "mixed" and (args.variant != "classic" or args.nrhs > 0):
+        # o CG pipelined em float32 estagna perto de 1e-3 (recorrências amplificam o arredondamento)
+        parser.error("--precision mixed só com --variant classic e sem --nrhs")
+    if args.backend != "numpy":
+        if njit is None:
+            parser.error("--backend numba requer o pacote numba (pip install numba)")
+        if (args.variant != "classic" or args.precond != "none" or args.precision != "double"
+                or args.nrhs > 0 or args.mode == "overlap"):
+            parser.error("--backend numba: só CG clássico sem pré-condicionador, float64, "
+                         "sem --nrhs e sem --mode overlap")
+        if args.threads > 0:
+            set_num_threads(args.threads)
 
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
+    size = comm.Get_size()
 
-    comm.Barrier()
-    t0 = MPI.Wtime()
-    x, rel, it = conjugate_gradient(args.Nx, args.Ny, args.max_iters, args.tol, args.mode)
-    comm.Barrier()
-    t1 = MPI.Wtime()
+    kinds = ["1d", "2d"] if args.decomp == "both" else [args.decomp]
 
-    if rank == 0:
-        print(f"\n[Resumo] modo={args.mode}  P={comm.Get_size()}  Nx={args.Nx} Ny={args.Ny}")
-        print(f"Convergiu (||r||/||r0|| = {rel:.3e}) em {it} iterações. Tempo total: {t1 - t0:0.6f} s")
+    if args.bench_halo > 0:
+        for kind in kinds:
+            dec = make_decomp(args.Nx, args.Ny, kind, comm)
+            times = bench_halo(dec, args.bench_halo)
+            dec.free()
+            if rank == 0:
+                print(f"[Halo] decomp={kind}  P={size}  Nx={args.Nx} Ny={args.Ny}  ({args.bench_halo} chamadas)")
+                for mode, t in times.items():
+                    print(f"  {mode:>10}: {t * 1e6:10.2f} us/troca")
+        MPI.Finalize()
+        return
+    # --variant sstep: clássico como referência + um s-step para cada s
+    # --backend both: o mesmo CG clássico com NumPy e com Numba
+    runs = [(args.variant, 1, args.backend)]
+    if args.variant == "sstep":
+        runs = [("classic", 1, "numpy")] + [("sstep", s, "numpy") for s in args.s]
+    elif args.backend == "both":
+        runs = [("classic", 1, "numpy"), ("classic", 1, "numba")]
+
+    stats = []
+    for kind in kinds:
+        sstats, bstats = [], []
+        for variant, s, backend in runs:
+            comm.Barrier()
+            t0 = MPI.Wtime()
+            x, rel, it, t_iter, dec = conjugate_gradient(args.Nx, args.Ny, args.max_iters, args.tol,
+                                                         args.mode, variant, args.precond, kind,
+                                                         args.nrhs, s, args.precision, backend)
+            comm.Barrier()
+            t1 = MPI.Wtime()
+            # s-step: uma troca de profundidade s de [p, r] a cada s iterações
+            hw = halo_words(dec, depth=s, nvec=2) if variant == "sstep" else halo_words(dec)
+            words = dec.comm.allreduce(hw, op=MPI.MAX)
+            block = dec.comm.allreduce(dec.nx * dec.ny, op=MPI.MAX)
+            label = kind
+            if args.variant == "sstep":
+                label = f"{kind}:{variant if variant != 'sstep' else f's={s}'}"
+            elif args.backend == "both":
+                label = f"{kind}:{backend}"
+            stats.append((label, it, t_iter, words, block))
+            sstats.append((variant, s, it, t1 - t0))
+            bstats.append((backend, it, t_iter))
+
+            if rank == 0:
+                vname = variant if variant != "sstep" else f"sstep (s={s})"
+                if backend != "numpy":
+                    vname += f"  backend={backend}"
+                print(f"\n[Resumo] decomp={kind}  modo={args.mode}  variante={vname}  precond={args.precond}  precisão={args.precision}  P={size}  Nx={args.Nx} Ny={args.Ny}")
+                print(f"Convergiu (||r||/||r0|| = {rel:.3e}) em {it} iterações. Tempo total: {t1 - t0:0.6f} s")
+                print(f"Tempo por iteração: {t_iter * 1e3:0.4f} ms")
+                if args.nrhs > 0:
+                    print(f"[nrhs] {args.nrhs} lados direitos: {t_iter * 1e3 / args.nrhs:0.4f} ms por iteração e por RHS")
+
+            if args.mode == "overlap" and variant != "sstep":
+                t_int, t_wait, frac = overlap_report(dec)
+                if rank == 0:
+                    print(f"[Overlap] miolo: {t_int * 1e6:.1f} us/SpMV | espera no Waitall: {t_wait * 1e6:.1f} us/SpMV | "
+                          f"fração sobreposta: {100 * frac:.1f}%")
+
+        if rank == 0 and args.backend == "both":
+            print(f"\n[Backend] decomp={kind}  P={size}  N={args.Nx}x{args.Ny}  threads/rank={args.threads or 'env'}")
+            print(" backend | iters | ms/iter  | ganho")
+            for backend, it, t_iter in bstats:
+                print(f" {backend:>7} | {it:5d} | {t_iter * 1e3:8.4f} | {bstats[0][2] / t_iter:5.2f}x")
+
+        if rank == 0 and args.variant == "sstep":
+            # mensagens por rank = trocas de halo x vizinhos (2 a 4) + Allreduce
+            print(f"\n[s-step] decomp={kind}  P={size}  N={args.Nx}x{args.Ny}  (contagens por rank)")
+            print(" variante | iters | trocas halo | Allreduce | tempo (s) | ganho")
+            t_ref = sstats[0][3]
+            for variant, s, it, t in sstats:
+                nh, nr = comm_counts(variant, it, s)
+                name = "classic" if variant != "sstep" else f"s={s}"
+                print(f" {name:>8} | {it:5d} | {nh:11d} | {nr:9d} | {t:9.4f} | {t_ref / t:5.2f}x")
+
+    if rank == 0 and len(stats) > 1:
+        # Mesmo tamanho global: compare com -n 4, 16, 64... (escalabilidade forte)
+        print(f"\n[Escala] P={size}  N={args.Nx}x{args.Ny}  (halo = valores enviados por rank em cada troca, máx.;"
+              f" 1 troca por SpMV, ou de profundidade s a cada s iterações no s-step)")
+        w = max(6, max(len(st[0]) for st in stats))
+        print(f" {'decomp':>{w}} | iters | ms/iter  | halo/troca | pontos/rank | halo/ponto")
+        for kind, it, t_iter, words, block in stats:
+            print(f" {kind:>{w}} | {it:5d} | {t_iter * 1e3:8.4f} | {words:10d} | {block:11d} | {words / max(block, 1):.4f}")
 
     MPI.Finalize()
 
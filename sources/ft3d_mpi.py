@@ -1,8 +1,33 @@
 # ft3d_mpi.py
 # ------------------------------------------------------------
 # FT acadêmico: FFT 3D distribuída (slab e pencil)
-# - Transposições com MPI Alltoall
+# - Transposições com MPI Alltoallv: Nx, Ny, Nz quaisquer (blocos desiguais entre
+#   os ranks; formas e deslocamentos de cada rank em PencilLayout)
 # - Checagens globais com Allreduce
+# - --transform r2c: dados reais, rfft em X (Nx//2+1 complexos) e irfft na volta;
+#   as transposições levam metade dos dados (Alltoallv: Nx//2+1 dividido de forma
+#   desigual entre as Px colunas)
+# - --transpose alltoallw: transposições sem cópias de empacotamento (tipos
+#   'subarray' criados uma vez por forma + Alltoallw); --transpose both compara
+#   tempo e pico de memória com o caminho atual (copy)
+# - --plan: DistributedFFTPlan, com comunicadores, buffers alinhados, tipos e
+#   (opcionalmente) coletivas persistentes criados no construtor; forward/backward
+#   não alocam arrays
+# - --transposed: entrada da forward / saída da inversa em pencils "transpostos"
+#   (eixo completo à frente: X-pencil (Nx, dz, dy)); a reordenação para o layout
+#   original some e cada transformada faz uma passada de cópia a menos
+#   (PencilLayout.pencil dá forma, deslocamento e eixos de cada layout)
+# - --chunks k: trocas em k fatias com Ialltoall; a fatia i+1 viaja enquanto a
+#   FFT da fatia i é calculada (c2c, caminho copy)
+# - --fft-backend numpy|scipy|pyfftw|auto e --fft-threads T: FFTs 1D locais
+#   multithread (execuções híbridas: poucos ranks por nó, muitos núcleos cada);
+#   pyfftw guarda a sabedoria FFTW em disco (--fftw-wisdom); --fft-inplace
+#   transforma os temporários do pipeline no próprio lugar
+# - --fields F: FFT em lote de F campos (eixo de lote à frente), com uma só
+#   coletiva por transposição para todos os campos
+# - --dtype c64: precisão simples (complex64 nas FFTs locais, MPI.COMPLEX nas
+#   trocas): metade da memória e do volume das transposições; o relatório mostra
+#   o erro de ida e volta contra o mesmo caso em complex128
 #
 # Execução:
 #   # modo slab (P processos, Py=P, Px=1)
@@ -12,12 +37,52 @@
 #   mpiexec -n 8 python ft3d_mpi.py --Nx 128 --Ny 128 --Nz 128 --mode pencil
 #   # ou escolhendo grade:
 #   mpiexec -n 8 python ft3d_mpi.py --Nx 128 --Ny 128 --Nz 128 --mode pencil --py 4 --px 2
+#
+#   # grade não divisível pelo número de processos (sem padding)
+#   mpiexec -n 6 python ft3d_mpi.py --Nx 100 --Ny 90 --Nz 70 --mode pencil --py 3 --px 2
+#
+#   # entrada real (r2c/c2r)
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 128 --Ny 128 --Nz 128 --mode pencil --transform r2c
+#
+#   # transposições com Alltoallw vs. cópias (tempo e pico de memória por rank)
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --transpose both
+#
+#   # sobreposição das transposições com as FFTs em 4 fatias (Ialltoall), vs. copy
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --chunks 4
+#
+#   # FFTs locais com 8 threads (scipy.fft / FFTW), 2 ranks por nó
+#   mpiexec -n 2 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --fft-backend pyfftw --fft-threads 8
+#
+#   # 5 campos: campo a campo vs. em lote (mesmas 2 coletivas por forward para todos)
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 128 --Ny 128 --Nz 128 --mode pencil --fields 5
+#
+#   # entrada/saída transpostas (sem a reordenação final da inversa), vs. copy
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --transposed
+#
+#   # precisão simples (complex64): metade do tráfego de Alltoall
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --dtype c64
+#
+#   # DistributedFFTPlan (buffers/transposições criados uma vez; --persistent: MPI-4)
+#   mpiexec -n 8 python ft3d_mpi.py --Nx 256 --Ny 256 --Nz 256 --mode pencil --transpose both --plan
 # ------------------------------------------------------------
 
 from mpi4py import MPI
 import numpy as np
 import argparse
 import math
+import os
+import pickle
+import tracemalloc
+
+try:
+    import scipy.fft as scipy_fft          # opcional: --fft-backend scipy
+except ImportError:
+    scipy_fft = None
+try:
+    import pyfftw                          # opcional: --fft-backend pyfftw
+    import pyfftw.interfaces.scipy_fft as fftw_fft
+except ImportError:
+    pyfftw = None
 
 def compute_dims(size, py=None, px=None):
     """Escolhe (Py, Px) para a grade 2D de processos."""
@@ -31,16 +96,98 @@ def compute_dims(size, py=None, px=None):
     py = size // px
     return py, px
 
-def init_local_data(Nz, Ny, Nx, z0, y0, dz, dy):
+def init_local_data(Nz, Ny, Nx, z0, y0, dz, dy, dtype=np.complex128):
     """
-    Dados determinísticos para teste (complex128):
+    Dados determinísticos para teste (complex128, ou dtype):
     u[z,y,x] = exp( 2πi * (z/Nz + y/Ny + x/Nx) )
     """
     zz = (np.arange(dz) + z0)[:, None, None] / Nz
     yy = (np.arange(dy) + y0)[None, :, None] / Ny
     xx = np.arange(Nx)[None, None, :] / Nx
     phase = zz + yy + xx
-    return np.exp(2j * np.pi * phase).astype(np.complex128)
+    return np.exp(2j * np.pi * phase).astype(dtype)
+
+# Precisões dos dados complexos (--dtype) e o tipo MPI correspondente nas trocas
+DTYPES = {"c128": np.complex128, "c64": np.complex64}
+MPI_COMPLEX = {np.dtype(np.complex128): MPI.COMPLEX16, np.dtype(np.complex64): MPI.COMPLEX}
+
+def split_sizes(N, P):
+    """Divide N pontos em P blocos: (tamanhos, deslocamentos); os N % P primeiros têm +1."""
+    counts = np.full(P, N // P, dtype=int)
+    counts[: N % P] += 1
+    offs = np.zeros(P, dtype=int)
+    offs[1:] = np.cumsum(counts[:-1])
+    return counts, offs
+
+class PencilLayout:
+    """
+    Formas e deslocamentos globais do bloco de um rank (row, col) nas três
+    orientações do pencil, para grades quaisquer: cada eixo é dividido com
+    split_sizes (blocos desiguais), sem exigir divisibilidade.
+      X-pencil (entrada): x_shape = (zc[row], yc[col], NX)   em x_offset = (zo[row], yo[col], 0)
+      Y-pencil          : y_shape = (zc[row], Ny, xc[col])   em y_offset = (zo[row], 0, xo[col])
+      Z-pencil (saída)  : z_shape = (Nz, yzc[row], xc[col])  em z_offset = (0, yzo[row], xo[col])
+    Z em Py blocos, Y em Px (entrada) e em Py (saída), X (NX = Nx, ou Nx//2+1 no
+    r2c) em Px. Guarda também, calculados uma vez, os (counts, deslocamentos) em
+    elementos dos Alltoallv das duas transposições (X↔Y em row_comm, Y↔Z em col_comm).
+    Layouts transpostos (transposed=True nas transformadas): o eixo completo vai à
+    frente, X-pencil (NX, dz, dy) e Y-pencil (Ny, dz, dxc); ver pencil().
+    """
+    def __init__(self, Nz, Ny, NX, Py, Px, row, col):
+        self.key = (Nz, Ny, NX, Py, Px, row, col)
+        self.zcounts, self.zoffs = split_sizes(Nz, Py)
+        self.ycounts, self.yoffs = split_sizes(Ny, Px)
+        self.xcounts, self.xoffs = split_sizes(NX, Px)
+        self.yzcounts, self.yzoffs = split_sizes(Ny, Py)
+        dz, z0 = int(self.zcounts[row]), int(self.zoffs[row])
+        dy, y0 = int(self.ycounts[col]), int(self.yoffs[col])
+        dxc, x0 = int(self.xcounts[col]), int(self.xoffs[col])
+        dyz, yz0 = int(self.yzcounts[row]), int(self.yzoffs[row])
+        self.x_shape, self.x_offset = (dz, dy, NX), (z0, y0, 0)
+        self.y_shape, self.y_offset = (dz, Ny, dxc), (z0, 0, x0)
+        self.z_shape, self.z_offset = (Nz, dyz, dxc), (0, yz0, x0)
+        self.xt_shape, self.yt_shape = (NX, dz, dy), (Ny, dz, dxc)
+        # X↔Y: envio por blocos de X (todas as linhas Y locais), recepção por blocos de Y
+        self.xy_send = (dz * dy * self.xcounts, dz * dy * self.xoffs)
+        self.xy_recv = (dz * self.ycounts * dxc, dz * self.yoffs * dxc)
+        # Y↔Z: envio por blocos de Y, recepção por blocos de Z (já contíguos no Z-pencil)
+        self.yz_send = (dz * self.yzcounts * dxc, dz * self.yzoffs * dxc)
+        self.yz_recv = (self.zcounts * dyz * dxc, self.zoffs * dyz * dxc)
+
+    def pencil(self, which, transposed=False):
+        """
+        (forma, deslocamento, eixos) do array local no pencil which = "x", "y" ou "z",
+        tudo na ordem dos eixos do array; eixos[k] = eixo global (0 = Z, 1 = Y, 2 = X)
+        do eixo k. O eixo local (completo) é o último no X-pencil, o do meio no
+        Y-pencil e o primeiro no Z-pencil; com transposed=True é sempre o primeiro.
+        """
+        shape, offset = {"x": (self.x_shape, self.x_offset), "y": (self.y_shape, self.y_offset),
+                         "z": (self.z_shape, self.z_offset)}[which]
+        axes = PENCIL_AXES[which, transposed]
+        if transposed and which != "z":
+            shape = self.xt_shape if which == "x" else self.yt_shape
+            offset = tuple(offset[a] for a in axes)
+        return shape, offset, axes
+
+# eixo global de cada eixo do array local, por (pencil, transposed)
+PENCIL_AXES = {("x", False): (0, 1, 2), ("x", True): (2, 0, 1),
+               ("y", False): (0, 1, 2), ("y", True): (1, 0, 2),
+               ("z", False): (0, 1, 2), ("z", True): (0, 1, 2)}
+
+def global_order(u, axes):
+    """Vista (sem cópia) de um array local com eixos 'axes' indexada como (z, y, x)."""
+    return u.transpose(np.argsort(axes))
+
+_LAYOUTS = {}   # (comunicador, Nz, Ny, NX) -> PencilLayout
+
+def pencil_layout(comm2d, Nz, Ny, NX):
+    """PencilLayout deste rank na grade cartesiana comm2d (criado uma vez por forma)."""
+    key = (id(comm2d), Nz, Ny, NX)
+    if key not in _LAYOUTS:
+        Py, Px = comm2d.dims
+        row, col = comm2d.Get_coords(comm2d.Get_rank())
+        _LAYOUTS[key] = PencilLayout(Nz, Ny, NX, Py, Px, row, col)
+    return _LAYOUTS[key]
 
 def global_l2(u_local, comm):
     """||u||_2 global, via soma de quadrados e Allreduce."""
@@ -48,9 +195,345 @@ def global_l2(u_local, comm):
     tot = comm.allreduce(loc, op=MPI.SUM)
     return math.sqrt(tot)
 
+# ====== BACKEND DAS FFTs 1D LOCAIS ======
+
+def available_fft_backends():
+    """Backends instalados, do preferido para o menos preferido (usado por 'auto')."""
+    return [name for name, mod in (("pyfftw", pyfftw), ("scipy", scipy_fft), ("numpy", np))
+            if mod is not None]
+
+class LocalFFT:
+    """
+    FFTs 1D locais de todos os estágios do pencil (fft/ifft/rfft/irfft ao longo
+    de um eixo), com o backend escolhido uma vez:
+      numpy : np.fft (pocketfft, 1 thread); escreve direto em out=
+      scipy : scipy.fft com workers=threads
+      pyfftw: FFTW via pyfftw.interfaces.scipy_fft, threads, planos FFTW_MEASURE em
+              cache e sabedoria (wisdom) lida/gravada em disco (load/save_wisdom)
+    inplace=True: quando a entrada é um temporário do pipeline (scratch=True), a
+    transformada c2c reaproveita a memória dela (numpy: out=a; scipy/pyfftw:
+    overwrite_x) em vez de alocar a saída.
+    """
+    def __init__(self, name="numpy", threads=1, inplace=False):
+        if name == "auto":
+            name = available_fft_backends()[0]
+        assert name in available_fft_backends(), f"backend FFT '{name}' não instalado"
+        self.name, self.threads, self.inplace = name, max(threads, 1), inplace
+        self.mod = {"numpy": None, "scipy": scipy_fft, "pyfftw": fftw_fft if pyfftw else None}[name]
+        if name == "pyfftw":
+            pyfftw.interfaces.cache.enable()
+            pyfftw.interfaces.cache.set_keepalive_time(60.0)
+            pyfftw.config.PLANNER_EFFORT = "FFTW_MEASURE"
+
+    def _run(self, kind, a, axis, n=None, out=None, scratch=False):
+        overwrite = scratch and self.inplace
+        if out is None and overwrite and kind in ("fft", "ifft"):
+            out = a
+        if self.mod is None:
+            return getattr(np.fft, kind)(a, n=n, axis=axis, out=out)
+        res = getattr(self.mod, kind)(a, n=n, axis=axis, overwrite_x=overwrite, workers=self.threads)
+        if out is None:
+            return res
+        if res.ctypes.data != out.ctypes.data or res.strides != out.strides:
+            out[...] = res
+        return out
+
+    def fft(self, a, axis=-1, out=None, scratch=False):
+        return self._run("fft", a, axis, out=out, scratch=scratch)
+
+    def ifft(self, a, axis=-1, out=None, scratch=False):
+        return self._run("ifft", a, axis, out=out, scratch=scratch)
+
+    def rfft(self, a, axis=-1, out=None, scratch=False):
+        return self._run("rfft", a, axis, out=out, scratch=scratch)
+
+    def irfft(self, a, n=None, axis=-1, out=None, scratch=False):
+        return self._run("irfft", a, axis, n=n, out=out, scratch=scratch)
+
+    def load_wisdom(self, path):
+        """pyfftw: importa a sabedoria FFTW de 'path' (se existir); retorna True se leu."""
+        if self.name != "pyfftw" or not path or not os.path.exists(path):
+            return False
+        with open(path, "rb") as f:
+            pyfftw.import_wisdom(pickle.load(f))
+        return True
+
+    def save_wisdom(self, path, comm):
+        """pyfftw: junta a sabedoria de todos os ranks (formas locais diferem) e o rank 0 grava."""
+        if self.name != "pyfftw" or not path:
+            return
+        all_wisdom = comm.gather(pyfftw.export_wisdom(), root=0)
+        if comm.Get_rank() == 0:
+            for w in all_wisdom:
+                pyfftw.import_wisdom(w)
+            with open(path, "wb") as f:
+                pickle.dump(pyfftw.export_wisdom(), f)
+
+FFT = LocalFFT("numpy")   # backend em uso (trocado por set_fft_backend)
+
+def set_fft_backend(name="numpy", threads=1, inplace=False):
+    """Troca o backend usado por todas as transformadas deste módulo."""
+    global FFT
+    FFT = LocalFFT(name, threads, inplace)
+    return FFT
+
+# ====== TRANSPOSIÇÕES SEM CÓPIA: tipos subarray + Alltoallw ======
+
+class AlltoallwTranspose:
+    """
+    Transposição em que o próprio MPI junta/espalha os blocos: para cada parceiro,
+    um tipo 'subarray' descreve o bloco enviado (dentro do array de origem) e o
+    bloco recebido (dentro do array de destino), e Alltoallw lê/escreve direto
+    nos arrays das FFTs, sem swapaxes/.copy() para empacotar nem concatenate
+    para desempacotar. Os tipos são criados uma vez e servem aos dois sentidos:
+    backward() troca os papéis de origem e destino.
+      src_blocks[i] = (subsizes, starts) do bloco de src que vai para o rank i
+      dst_blocks[j] = (subsizes, starts) do bloco de dst que vem do rank j
+    """
+    def __init__(self, comm, src_shape, dst_shape, src_blocks, dst_blocks, dtype):
+        self.comm = comm
+        self.dtype = np.dtype(dtype)
+        self.src_shape, self.dst_shape = tuple(src_shape), tuple(dst_shape)
+        self.created = []
+        self.src_types, self.src_counts = self._types(self.src_shape, src_blocks)
+        self.dst_types, self.dst_counts = self._types(self.dst_shape, dst_blocks)
+        self.displs = [0] * comm.Get_size()   # deslocamentos já estão nos 'starts'
+
+    def _types(self, shape, blocks):
+        base = MPI.Datatype.fromcode(self.dtype.char)
+        types, counts = [], []
+        for sub, start in blocks:
+            if min(sub) == 0:   # bloco vazio (ex.: Nx//2+1 < Px): nada a trocar
+                types.append(base)
+                counts.append(0)
+                continue
+            t = base.Create_subarray(shape, [int(n) for n in sub], [int(n) for n in start]).Commit()
+            self.created.append(t)
+            types.append(t)
+            counts.append(1)
+        return types, counts
+
+    def forward(self, src, out=None):
+        """src (src_shape, C-contíguo) → out (dst_shape)."""
+        if out is None:
+            out = np.empty(self.dst_shape, dtype=self.dtype)
+        self.comm.Alltoallw([src, (self.src_counts, self.displs), self.src_types],
+                            [out, (self.dst_counts, self.displs), self.dst_types])
+        return out
+
+    def backward(self, dst, out=None):
+        """dst (dst_shape) → out (src_shape): mesma troca no sentido inverso."""
+        if out is None:
+            out = np.empty(self.src_shape, dtype=self.dtype)
+        self.comm.Alltoallw([dst, (self.dst_counts, self.displs), self.dst_types],
+                            [out, (self.src_counts, self.displs), self.src_types])
+        return out
+
+    def init_forward(self, src, out):
+        """Versão persistente (MPI-4) de forward, presa aos arrays src/out: Start()/Wait() a cada uso."""
+        return self.comm.Alltoallw_init([src, (self.src_counts, self.displs), self.src_types],
+                                        [out, (self.dst_counts, self.displs), self.dst_types])
+
+    def init_backward(self, dst, out):
+        """Versão persistente (MPI-4) de backward."""
+        return self.comm.Alltoallw_init([dst, (self.dst_counts, self.displs), self.dst_types],
+                                        [out, (self.src_counts, self.displs), self.src_types])
+
+    def free(self):
+        for t in self.created:
+            t.Free()
+        self.created = []
+
+_TRANSPOSES = {}   # (tipo, comunicador, forma, dtype) -> AlltoallwTranspose
+
+def _with_batch(nbatch, shape, blocks):
+    """Acrescenta o eixo de lote (nbatch campos) à frente da forma e de cada bloco."""
+    if not nbatch:
+        return shape, blocks
+    return (nbatch, *shape), [((nbatch, *sub), (0, *start)) for sub, start in blocks]
+
+def make_xy_transpose(row_comm, lay, dtype, nbatch=0):
+    """
+    X ↔ Y em row_comm: X-pencil lay.x_shape ↔ Y-pencil lay.y_shape.
+    nbatch > 0: arrays com eixo de lote à frente, (nbatch, ...), numa só troca.
+    """
+    Px = row_comm.Get_size()
+    dz, dy, _ = lay.x_shape
+    dxc = lay.y_shape[2]
+    src_shape, src_blocks = _with_batch(nbatch, lay.x_shape,
+                                        [((dz, dy, lay.xcounts[i]), (0, 0, lay.xoffs[i])) for i in range(Px)])
+    dst_shape, dst_blocks = _with_batch(nbatch, lay.y_shape,
+                                        [((dz, lay.ycounts[j], dxc), (0, lay.yoffs[j], 0)) for j in range(Px)])
+    return AlltoallwTranspose(row_comm, src_shape, dst_shape, src_blocks, dst_blocks, dtype)
+
+def make_yz_transpose(col_comm, lay, dtype, nbatch=0):
+    """Y ↔ Z em col_comm: Y-pencil lay.y_shape ↔ Z-pencil lay.z_shape (nbatch: idem)."""
+    Py = col_comm.Get_size()
+    dz, _, dxc = lay.y_shape
+    dyz = lay.z_shape[1]
+    src_shape, src_blocks = _with_batch(nbatch, lay.y_shape,
+                                        [((dz, lay.yzcounts[i], dxc), (0, lay.yzoffs[i], 0)) for i in range(Py)])
+    dst_shape, dst_blocks = _with_batch(nbatch, lay.z_shape,
+                                        [((lay.zcounts[j], dyz, dxc), (lay.zoffs[j], 0, 0)) for j in range(Py)])
+    return AlltoallwTranspose(col_comm, src_shape, dst_shape, src_blocks, dst_blocks, dtype)
+
+def xy_transpose(row_comm, lay, dtype, nbatch=0):
+    """make_xy_transpose criada uma vez por forma (cache)."""
+    key = ("xy", id(row_comm), lay.key, np.dtype(dtype).str, nbatch)
+    if key not in _TRANSPOSES:
+        _TRANSPOSES[key] = make_xy_transpose(row_comm, lay, dtype, nbatch)
+    return _TRANSPOSES[key]
+
+def yz_transpose(col_comm, lay, dtype, nbatch=0):
+    """make_yz_transpose criada uma vez por forma (cache)."""
+    key = ("yz", id(col_comm), lay.key, np.dtype(dtype).str, nbatch)
+    if key not in _TRANSPOSES:
+        _TRANSPOSES[key] = make_yz_transpose(col_comm, lay, dtype, nbatch)
+    return _TRANSPOSES[key]
+
+def free_transposes():
+    """Libera os tipos derivados de todas as transposições em cache."""
+    for t in _TRANSPOSES.values():
+        t.free()
+    _TRANSPOSES.clear()
+
+# ====== TRANSPOSIÇÕES COM CÓPIAS: Alltoallv com blocos desiguais ======
+
+def _batch_counts(counts_displs, nf):
+    """(counts, deslocamentos) por campo → para um lote de nf campos contíguos."""
+    counts, displs = counts_displs
+    return (counts * nf, displs * nf) if nf != 1 else counts_displs
+
+def transpose_x_to_y(u, row_comm, lay):
+    """
+    X-pencil (dz, dy, NX) → Y-pencil (dz, Ny, dxc). Cada rank manda à coluna i o
+    bloco X [xoffs[i], xoffs[i]+xcounts[i]) de todas as suas linhas Y e recebe da
+    coluna j as ycounts[j] linhas dela. Counts/deslocamentos vêm de lay (PencilLayout).
+    Eixos extras à frente (lote de campos, ...) vão todos na mesma Alltoallv.
+    """
+    T = MPI_COMPLEX[u.dtype]
+    Px = row_comm.Get_size()
+    lead = u.shape[:-3]
+    nf = int(np.prod(lead))
+    dz, _, dxc = lay.y_shape
+    send, recv = _batch_counts(lay.xy_send, nf), _batch_counts(lay.xy_recv, nf)
+    sbuf = np.concatenate([u[..., lay.xoffs[i]:lay.xoffs[i] + lay.xcounts[i]].ravel() for i in range(Px)])
+    rbuf = np.empty(int(recv[0].sum()), dtype=u.dtype)
+    row_comm.Alltoallv([sbuf, send, T], [rbuf, recv, T])
+    return np.concatenate([rbuf[d:d + c].reshape(*lead, dz, lay.ycounts[j], dxc)
+                           for j, (c, d) in enumerate(zip(*recv))], axis=-2)
+
+def transpose_y_to_x(u_y, row_comm, lay):
+    """Inversa de transpose_x_to_y: Y-pencil (dz, Ny, dxc) → X-pencil (dz, dy, NX)."""
+    T = MPI_COMPLEX[u_y.dtype]
+    Px = row_comm.Get_size()
+    lead = u_y.shape[:-3]
+    nf = int(np.prod(lead))
+    dz, dy, _ = lay.x_shape
+    send, recv = _batch_counts(lay.xy_recv, nf), _batch_counts(lay.xy_send, nf)
+    sbuf = np.concatenate([u_y[..., lay.yoffs[j]:lay.yoffs[j] + lay.ycounts[j], :].ravel() for j in range(Px)])
+    rbuf = np.empty(int(recv[0].sum()), dtype=u_y.dtype)
+    row_comm.Alltoallv([sbuf, send, T], [rbuf, recv, T])
+    return np.concatenate([rbuf[d:d + c].reshape(*lead, dz, dy, lay.xcounts[i])
+                           for i, (c, d) in enumerate(zip(*recv))], axis=-1)
+
+def transpose_y_to_z(u_y, col_comm, lay):
+    """Y-pencil (dz, Ny, dxc) → Z-pencil (Nz, dyz, dxc): reparticiona Y e junta Z."""
+    T = MPI_COMPLEX[u_y.dtype]
+    Py = col_comm.Get_size()
+    lead = u_y.shape[:-3]
+    nf = int(np.prod(lead))
+    _, dyz, dxc = lay.z_shape
+    send, recv = _batch_counts(lay.yz_send, nf), _batch_counts(lay.yz_recv, nf)
+    sbuf = np.concatenate([u_y[..., lay.yzoffs[i]:lay.yzoffs[i] + lay.yzcounts[i], :].ravel() for i in range(Py)])
+    rbuf = np.empty(int(recv[0].sum()), dtype=u_y.dtype)
+    col_comm.Alltoallv([sbuf, send, T], [rbuf, recv, T])
+    if not lead:
+        return rbuf.reshape(lay.z_shape)    # blocos de Z chegam em ordem: já é (Nz, dyz, dxc)
+    return np.concatenate([rbuf[d:d + c].reshape(*lead, lay.zcounts[j], dyz, dxc)
+                           for j, (c, d) in enumerate(zip(*recv))], axis=-3)
+
+def transpose_z_to_y(u, col_comm, lay):
+    """Inversa de transpose_y_to_z: Z-pencil (Nz, dyz, dxc) → Y-pencil (dz, Ny, dxc)."""
+    T = MPI_COMPLEX[u.dtype]
+    Py = col_comm.Get_size()
+    lead = u.shape[:-3]
+    nf = int(np.prod(lead))
+    dz, _, dxc = lay.y_shape
+    send, recv = _batch_counts(lay.yz_recv, nf), _batch_counts(lay.yz_send, nf)
+    if not lead:
+        sbuf = np.ascontiguousarray(u).ravel()
+    else:
+        sbuf = np.concatenate([u[..., lay.zoffs[j]:lay.zoffs[j] + lay.zcounts[j], :, :].ravel() for j in range(Py)])
+    rbuf = np.empty(int(recv[0].sum()), dtype=u.dtype)
+    col_comm.Alltoallv([sbuf, send, T], [rbuf, recv, T])
+    return np.concatenate([rbuf[d:d + c].reshape(*lead, dz, lay.yzcounts[i], dxc)
+                           for i, (c, d) in enumerate(zip(*recv))], axis=-2)
+
+# Pencils transpostos (eixo completo à frente): os blocos trocados são fatias do
+# eixo 0, contíguas; a reordenação vira UMA cópia transposta, no empacotamento
+# (volta) ou no desempacotamento (ida), em vez de empacotar E concatenar.
+
+def transpose_xt_to_yt(u, row_comm, lay):
+    """
+    (NX, dz, dy) → (Ny, dz, dxc). Os blocos de X já estão em ordem no eixo 0: o
+    envio sai direto de u; cada bloco recebido (dxc, dz, ycounts[j]) é transposto
+    para o seu lugar no Y-pencil.
+    """
+    T = MPI_COMPLEX[u.dtype]
+    dz, dxc = lay.yt_shape[1:]
+    rbuf = np.empty(int(lay.xy_recv[0].sum()), dtype=u.dtype)
+    row_comm.Alltoallv([np.ascontiguousarray(u), lay.xy_send, T],
+                       [rbuf, lay.xy_recv, T])
+    out = np.empty(lay.yt_shape, dtype=u.dtype)
+    for j, (c, d) in enumerate(zip(*lay.xy_recv)):
+        y0, dy = lay.yoffs[j], lay.ycounts[j]
+        out[y0:y0 + dy] = rbuf[d:d + c].reshape(dxc, dz, dy).transpose(2, 1, 0)
+    return out
+
+def transpose_yt_to_z(u_y, col_comm, lay):
+    """(Ny, dz, dxc) → Z-pencil (Nz, dyz, dxc), com envio direto de u_y."""
+    T = MPI_COMPLEX[u_y.dtype]
+    _, dyz, dxc = lay.z_shape
+    rbuf = np.empty(int(lay.yz_recv[0].sum()), dtype=u_y.dtype)
+    col_comm.Alltoallv([np.ascontiguousarray(u_y), lay.yz_send, T],
+                       [rbuf, lay.yz_recv, T])
+    out = np.empty(lay.z_shape, dtype=u_y.dtype)
+    for j, (c, d) in enumerate(zip(*lay.yz_recv)):
+        z0, dz = lay.zoffs[j], lay.zcounts[j]
+        out[z0:z0 + dz] = rbuf[d:d + c].reshape(dyz, dz, dxc).transpose(1, 0, 2)
+    return out
+
+def transpose_z_to_yt(U, col_comm, lay):
+    """Inversa de transpose_yt_to_z: cada bloco de Z é transposto ao empacotar e a recepção já é (Ny, dz, dxc)."""
+    T = MPI_COMPLEX[U.dtype]
+    _, dyz, dxc = lay.z_shape
+    send, recv = lay.yz_recv, lay.yz_send
+    sbuf = np.empty(int(send[0].sum()), dtype=U.dtype)
+    for i, (c, d) in enumerate(zip(*send)):
+        z0, dz = lay.zoffs[i], lay.zcounts[i]
+        sbuf[d:d + c].reshape(dyz, dz, dxc)[...] = U[z0:z0 + dz].transpose(1, 0, 2)
+    out = np.empty(lay.yt_shape, dtype=U.dtype)
+    col_comm.Alltoallv([sbuf, send, T], [out, recv, T])
+    return out
+
+def transpose_yt_to_xt(u_y, row_comm, lay):
+    """Inversa de transpose_xt_to_yt: (Ny, dz, dxc) → (NX, dz, dy), sem reordenar na chegada."""
+    T = MPI_COMPLEX[u_y.dtype]
+    dz, dxc = lay.yt_shape[1:]
+    send, recv = lay.xy_recv, lay.xy_send
+    sbuf = np.empty(int(send[0].sum()), dtype=u_y.dtype)
+    for j, (c, d) in enumerate(zip(*send)):
+        y0, dy = lay.yoffs[j], lay.ycounts[j]
+        sbuf[d:d + c].reshape(dxc, dz, dy)[...] = u_y[y0:y0 + dy].transpose(2, 1, 0)
+    out = np.empty(lay.xt_shape, dtype=u_y.dtype)
+    row_comm.Alltoallv([sbuf, send, T], [out, recv, T])
+    return out
+
 # ====== TRANSFORMADAS: MODO PENCIL (geral, inclui SLAB como caso particular) ======
 
-def fft3d_forward_pencil(u_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm):
+def fft3d_forward_pencil(u_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                         transpose="copy", chunks=1, transposed=False):
     """
     Decomposição:
       - Py divide Z (linhas da grade de processos)
@@ -58,87 +541,373 @@ def fft3d_forward_pencil(u_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm
       - X é local inicialmente
     Pipeline:
       1) FFT em X (local)
-      2) Alltoall em row_comm (entre colunas) para reunir Y completo e dividir X
+      2) Alltoallv em row_comm (entre colunas) para reunir Y completo e dividir X
       3) FFT em Y (local)
-      4) Alltoall em col_comm (entre linhas) para reunir Z completo e dividir Y
+      4) Alltoallv em col_comm (entre linhas) para reunir Z completo e dividir Y
       5) FFT em Z (local)
-    Retorna o array no layout final: (Nz, Ny//Py, Nx//Px) por processo.
+    Os blocos podem ser desiguais (Nz, Ny, Nx quaisquer): formas e deslocamentos
+    de cada rank vêm de pencil_layout(comm2d, Nz, Ny, Nx).
+    transpose="alltoallw": as trocas 2) e 4) usam xy_transpose/yz_transpose.
+    chunks > 1: trocas em fatias com Ialltoall, sobrepostas às FFTs
+    (ver fft3d_forward_pencil_chunked).
+    transposed=True (só no caminho copy): u_local no X-pencil transposto
+    (Nx, ~Nz/Py, ~Ny/Px) (layout.pencil("x", True)); o Y-pencil intermediário também
+    fica transposto e a 1a troca não precisa empacotar.
+    Retorna o Z-pencil (Nz, ~Ny/Py, ~Nx/Px) por processo (layout.z_shape).
     """
-    dz = u_local.shape[0]                  # Nz // Py
-    dy = u_local.shape[1]                  # Ny // Px
-    dx = u_local.shape[2]                  # Nx        (local antes da 1ª troca)
-    assert dx % Px == 0, "Nx deve ser múltiplo de Px"
-    dxc = dx // Px
+    if transposed:
+        assert transpose == "copy" and chunks == 1, "transposed=True requer transpose='copy' e chunks=1"
+        lay = pencil_layout(comm2d, Nz, Ny, Nx)
+        u_y = FFT.fft(transpose_xt_to_yt(FFT.fft(u_local, axis=0), row_comm, lay), axis=0, scratch=True)
+        return FFT.fft(transpose_yt_to_z(u_y, col_comm, lay), axis=0, scratch=True)
+    if chunks > 1:
+        return fft3d_forward_pencil_chunked(u_local, Nz, Ny, Nx, Py, Px, row_comm, col_comm, chunks)
+    lay = pencil_layout(comm2d, Nz, Ny, Nx)
     # 1) FFT em X
-    u_local = np.fft.fft(u_local, axis=2)
-
-    # 2) Alltoall em row_comm (entre colunas) — reparticiona X, junta Y
-    # Prepara buffers [Px, dz*dy*dxc]
-    send = u_local.reshape(dz, dy, Px, dxc).swapaxes(1, 2)            # (dz, Px, dy, dxc)
-    sbuf = send.reshape(Px, -1).copy()
-    rbuf = np.empty_like(sbuf)
-    row_comm.Alltoall([sbuf, MPI.COMPLEX16], [rbuf, MPI.COMPLEX16])
-    # Recebidos Px blocos: concatena no eixo Y → (dz, Ny, dxc)
-    recv = rbuf.reshape(Px, dz, dy, dxc)
-    u_y = np.concatenate([recv[i] for i in range(Px)], axis=1)        # (dz, Ny, dxc)
-
-    # 3) FFT em Y
-    u_y = np.fft.fft(u_y, axis=1)
-
-    # 4) Alltoall em col_comm (entre linhas) — reparticiona Y, junta Z
-    assert Ny % Py == 0, "Ny deve ser múltiplo de Py"
-    ypc = Ny // Py
-    send2 = u_y.reshape(dz, Py, ypc, dxc).swapaxes(0, 1)              # (Py, dz, ypc, dxc)
-    sbuf2 = send2.reshape(Py, -1).copy()
-    rbuf2 = np.empty_like(sbuf2)
-    col_comm.Alltoall([sbuf2, MPI.COMPLEX16], [rbuf2, MPI.COMPLEX16])
-    # Recebidos Py blocos: concatena no eixo Z → (Nz, ypc, dxc)
-    recv2 = rbuf2.reshape(Py, dz, ypc, dxc)
-    u_z = np.concatenate([recv2[i] for i in range(Py)], axis=0)       # (Nz, Ny//Py, Nx//Px)
-
-    # 5) FFT em Z
-    u_z = np.fft.fft(u_z, axis=0)
-    return u_z  # layout final (Nz, Ny//Py, Nx//Px)
-
-def fft3d_inverse_pencil(U_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm):
+    u_local = FFT.fft(u_local, axis=2)
+    if transpose == "alltoallw":
+        u_y = FFT.fft(xy_transpose(row_comm, lay, u_local.dtype).forward(u_local), axis=1, scratch=True)
+        return FFT.fft(yz_transpose(col_comm, lay, u_y.dtype).forward(u_y), axis=0, scratch=True)
+
+    # 2) Alltoallv em row_comm — reparticiona X, junta Y ; 3) FFT em Y
+    u_y = FFT.fft(transpose_x_to_y(u_local, row_comm, lay), axis=1, scratch=True)
+    # 4) Alltoallv em col_comm — reparticiona Y, junta Z ; 5) FFT em Z
+    return FFT.fft(transpose_y_to_z(u_y, col_comm, lay), axis=0, scratch=True)
+
+def fft3d_inverse_pencil(U_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                         transpose="copy", chunks=1, transposed=False):
     """
     Inversa do pipeline acima (em ordem reversa).
-    Entrada: layout (Nz, Ny//Py, Nx//Px)
-    Saída:  layout original (Nz//Py, Ny//Px, Nx)
+    Entrada: Z-pencil (Nz, ~Ny/Py, ~Nx/Px)
+    Saída:  layout original (~Nz/Py, ~Ny/Px, Nx), ou, com transposed=True, o
+            X-pencil transposto (Nx, ~Nz/Py, ~Ny/Px): a última troca recebe direto
+            no array final, sem a reordenação de volta ao layout original.
     """
-    Nz_loc_full, ypc, dxc = U_local.shape
-    assert Nz_loc_full == Nz
+    if transposed:
+        assert transpose == "copy" and chunks == 1, "transposed=True requer transpose='copy' e chunks=1"
+        lay = pencil_layout(comm2d, Nz, Ny, Nx)
+        assert U_local.shape == lay.z_shape
+        u_y = FFT.ifft(transpose_z_to_yt(FFT.ifft(U_local, axis=0), col_comm, lay), axis=0, scratch=True)
+        return FFT.ifft(transpose_yt_to_xt(u_y, row_comm, lay), axis=0, scratch=True)
+    if chunks > 1:
+        return fft3d_inverse_pencil_chunked(U_local, Nz, Ny, Nx, Py, Px, row_comm, col_comm, chunks)
+    lay = pencil_layout(comm2d, Nz, Ny, Nx)
+    assert U_local.shape == lay.z_shape
     # 1) IFFT em Z
-    u = np.fft.ifft(U_local, axis=0)
-
-    # 2) Alltoall inverso em col_comm: repartir Z e juntar Y
-    dz = Nz // Py
-    send = u.reshape(Py, dz, ypc, dxc)                                   # (Py, dz, ypc, dxc)
-    sbuf = send.reshape(Py, -1).copy()
-    rbuf = np.empty_like(sbuf)
-    col_comm.Alltoall([sbuf, MPI.COMPLEX16], [rbuf, MPI.COMPLEX16])
-    recv = rbuf.reshape(Py, dz, ypc, dxc)
-    u_y = np.concatenate([recv[i] for i in range(Py)], axis=1)           # (dz, Ny, dxc)
-
-    # 3) IFFT em Y
-    u_y = np.fft.ifft(u_y, axis=1)
-
-    # 4) Alltoall inverso em row_comm: repartir Y e juntar X completo
-    dy = Ny // Px
-    send2 = u_y.reshape(dz, Px, dy, dxc).swapaxes(1, 0)                  # (Px, dz, dy, dxc) após swap
-    # cuidado: swapaxes(1,0) muda ordem; melhor construir explicitamente:
-    send2 = u_y.reshape(dz, Ny, dxc)
-    # fatia Y em Px blocos e monta lista para concat em X
-    parts = [send2[:, i*dy:(i+1)*dy, :] for i in range(Px)]              # Px blocos (dz, dy, dxc)
-    sbuf2 = np.stack(parts, axis=0).reshape(Px, -1).copy()               # (Px, dz*dy*dxc)
-    rbuf2 = np.empty_like(sbuf2)
-    row_comm.Alltoall([sbuf2, MPI.COMPLEX16], [rbuf2, MPI.COMPLEX16])
-    recv2 = rbuf2.reshape(Px, dz, dy, dxc)
-    u_x = np.concatenate([recv2[i] for i in range(Px)], axis=2)          # (dz, dy, Px*dxc) = (dz, dy, Nx)
-
-    # 5) IFFT em X
-    u_x = np.fft.ifft(u_x, axis=2)
-    return u_x  # layout original (Nz//Py, Ny//Px, Nx)
+    u = FFT.ifft(U_local, axis=0)
+    if transpose == "alltoallw":
+        u_y = FFT.ifft(yz_transpose(col_comm, lay, u.dtype).backward(u), axis=1, scratch=True)
+        return FFT.ifft(xy_transpose(row_comm, lay, u_y.dtype).backward(u_y), axis=2, scratch=True)
+
+    # 2) Alltoallv inverso em col_comm: repartir Z e juntar Y ; 3) IFFT em Y
+    u_y = FFT.ifft(transpose_z_to_y(u, col_comm, lay), axis=1, scratch=True)
+    # 4) Alltoallv inverso em row_comm: repartir Y e juntar X ; 5) IFFT em X
+    return FFT.ifft(transpose_y_to_x(u_y, row_comm, lay), axis=2, scratch=True)
+
+# ====== SOBREPOSIÇÃO COMUNICAÇÃO/CÁLCULO: transposições em fatias ======
+
+def pipeline_chunks(k, start, finish):
+    """
+    Executa k fatias em pipeline: start(i) prepara a fatia i e devolve o seu
+    Ialltoall; finish(i) usa os dados recebidos. A fatia i+1 é postada antes de
+    esperar a i, então viaja enquanto finish(i) (a FFT da fatia i) executa.
+    """
+    reqs = [None] * k
+    reqs[0] = start(0)
+    for i in range(k):
+        if i + 1 < k:
+            reqs[i + 1] = start(i + 1)
+        reqs[i].Wait()
+        finish(i)
+
+def chunk_slices(n, k):
+    """Divide range(n) em min(k, n) fatias contíguas (split_sizes)."""
+    counts, offs = split_sizes(n, min(k, n))
+    return [slice(o, o + c) for c, o in zip(counts, offs)]
+
+def check_chunked_grid(Nz, Ny, Nx, Py, Px):
+    """As trocas em fatias usam Ialltoall de blocos iguais: exigem grade divisível."""
+    assert Nz % Py == 0 and Ny % Py == 0, "--chunks: Nz e Ny devem ser múltiplos de Py"
+    assert Ny % Px == 0 and Nx % Px == 0, "--chunks: Ny e Nx devem ser múltiplos de Px"
+
+def fft3d_forward_pencil_chunked(u_local, Nz, Ny, Nx, Py, Px, row_comm, col_comm, chunks):
+    """
+    fft3d_forward_pencil (c2c, cópias) com as trocas em fatias ao longo de um eixo
+    que a transposição não mexe:
+      - X→Y (row_comm): fatias em Z; FFT-X + empacotamento da fatia i+1 e FFT-Y da
+        fatia i acontecem enquanto os Ialltoall estão em andamento
+      - Y→Z (col_comm): fatias em X; FFT-Z da fatia i enquanto a i+1 viaja
+    Mesmo resultado e layout de fft3d_forward_pencil. Usa Ialltoall (blocos
+    iguais): requer grade divisível (check_chunked_grid).
+    """
+    check_chunked_grid(Nz, Ny, Nx, Py, Px)
+    dz, dy, _ = u_local.shape
+    dxc, ypc = Nx // Px, Ny // Py
+    T = MPI_COMPLEX[u_local.dtype]
+    u_y = np.empty((dz, Ny, dxc), dtype=u_local.dtype)
+    u_z = np.empty((Nz, ypc, dxc), dtype=u_local.dtype)
+
+    zs = chunk_slices(dz, chunks)
+    bufs = [None] * len(zs)
+    def start_xy(i):
+        a = FFT.fft(u_local[zs[i]], axis=2)                           # (nz, dy, Nx)
+        sbuf = a.reshape(-1, dy, Px, dxc).transpose(2, 0, 1, 3).reshape(Px, -1).copy()
+        bufs[i] = (sbuf, np.empty_like(sbuf))   # vivos até o Wait
+        return row_comm.Ialltoall([sbuf, T], [bufs[i][1], T])
+    def finish_xy(i):
+        recv = bufs[i][1].reshape(Px, -1, dy, dxc)                       # (Px, nz, dy, dxc)
+        u_y[zs[i]] = FFT.fft(recv.transpose(1, 0, 2, 3).reshape(-1, Ny, dxc), axis=1, scratch=True)
+        bufs[i] = None
+    pipeline_chunks(len(zs), start_xy, finish_xy)
+
+    xs = chunk_slices(dxc, chunks)
+    bufs = [None] * len(xs)
+    def start_yz(i):
+        sbuf = u_y[:, :, xs[i]].reshape(dz, Py, ypc, -1).swapaxes(0, 1).reshape(Py, -1).copy()
+        bufs[i] = (sbuf, np.empty_like(sbuf))   # vivos até o Wait
+        return col_comm.Ialltoall([sbuf, T], [bufs[i][1], T])
+    def finish_yz(i):
+        u_z[:, :, xs[i]] = FFT.fft(bufs[i][1].reshape(Nz, ypc, -1), axis=0, scratch=True)
+        bufs[i] = None
+    pipeline_chunks(len(xs), start_yz, finish_yz)
+    return u_z
+
+def fft3d_inverse_pencil_chunked(U_local, Nz, Ny, Nx, Py, Px, row_comm, col_comm, chunks):
+    """Inversa de fft3d_forward_pencil_chunked: Z→Y em fatias de X, Y→X em fatias de Z."""
+    check_chunked_grid(Nz, Ny, Nx, Py, Px)
+    _, ypc, dxc = U_local.shape
+    dz, dy = Nz // Py, Ny // Px
+    T = MPI_COMPLEX[U_local.dtype]
+    u_y = np.empty((dz, Ny, dxc), dtype=U_local.dtype)
+    u_x = np.empty((dz, dy, Nx), dtype=U_local.dtype)
+
+    xs = chunk_slices(dxc, chunks)
+    bufs = [None] * len(xs)
+    def start_zy(i):
+        sbuf = FFT.ifft(U_local[:, :, xs[i]], axis=0).reshape(Py, -1)  # (Py, dz*ypc*nx)
+        bufs[i] = (sbuf, np.empty_like(sbuf))   # vivos até o Wait
+        return col_comm.Ialltoall([sbuf, T], [bufs[i][1], T])
+    def finish_zy(i):
+        recv = bufs[i][1].reshape(Py, dz, ypc, -1)
+        u_y[:, :, xs[i]] = FFT.ifft(recv.transpose(1, 0, 2, 3).reshape(dz, Ny, -1), axis=1, scratch=True)
+        bufs[i] = None
+    pipeline_chunks(len(xs), start_zy, finish_zy)
+
+    zs = chunk_slices(dz, chunks)
+    bufs = [None] * len(zs)
+    def start_yx(i):
+        sbuf = u_y[zs[i]].reshape(-1, Px, dy, dxc).transpose(1, 0, 2, 3).reshape(Px, -1).copy()
+        bufs[i] = (sbuf, np.empty_like(sbuf))   # vivos até o Wait
+        return row_comm.Ialltoall([sbuf, T], [bufs[i][1], T])
+    def finish_yx(i):
+        recv = bufs[i][1].reshape(Px, -1, dy, dxc)                       # (Px, nz, dy, dxc)
+        u_x[zs[i]] = FFT.ifft(recv.transpose(1, 2, 0, 3).reshape(-1, dy, Nx), axis=2, scratch=True)
+        bufs[i] = None
+    pipeline_chunks(len(zs), start_yx, finish_yx)
+    return u_x
+
+# ====== TRANSFORMADAS REAIS (r2c / c2r) ======
+
+def fft3d_forward_pencil_r2c(u_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                             transpose="copy", transposed=False):
+    """
+    Como fft3d_forward_pencil, mas para entrada REAL (dz, dy, Nx):
+      1) rfft em X → Nx//2+1 coeficientes (simetria hermitiana: o resto é redundante)
+      2) Alltoallv em row_comm: divide os Nx//2+1 entre as Px colunas
+      3) FFT em Y ; 4) Alltoallv em col_comm ; 5) FFT em Z
+    Metade da memória, do volume de Alltoall e dos FLOPs do caminho complexo.
+    transposed=True: entrada real transposta (Nx, dz, dy), como em fft3d_forward_pencil.
+    Retorna o Z-pencil de pencil_layout(comm2d, Nz, Ny, Nx//2+1).
+    """
+    lay = pencil_layout(comm2d, Nz, Ny, Nx // 2 + 1)
+    if transposed:
+        assert transpose == "copy", "transposed=True requer transpose='copy'"
+        u_y = FFT.fft(transpose_xt_to_yt(FFT.rfft(u_local, axis=0), row_comm, lay), axis=0, scratch=True)
+        return FFT.fft(transpose_yt_to_z(u_y, col_comm, lay), axis=0, scratch=True)
+    u = FFT.rfft(u_local, axis=2)                       # (dz, dy, Nx//2+1)
+    if transpose == "alltoallw":
+        u_y = FFT.fft(xy_transpose(row_comm, lay, u.dtype).forward(u), axis=1, scratch=True)
+        return FFT.fft(yz_transpose(col_comm, lay, u_y.dtype).forward(u_y), axis=0, scratch=True)
+    u_y = FFT.fft(transpose_x_to_y(u, row_comm, lay), axis=1, scratch=True)
+    return FFT.fft(transpose_y_to_z(u_y, col_comm, lay), axis=0, scratch=True)
+
+def fft3d_inverse_pencil_c2r(U_local, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                             transpose="copy", transposed=False):
+    """
+    Inversa de fft3d_forward_pencil_r2c: Z-pencil complexo → real (dz, dy, Nx),
+    com irfft(n=Nx) em X no final; transposed=True: real transposto (Nx, dz, dy).
+    """
+    lay = pencil_layout(comm2d, Nz, Ny, Nx // 2 + 1)
+    u = FFT.ifft(U_local, axis=0)
+    if transposed:
+        assert transpose == "copy", "transposed=True requer transpose='copy'"
+        u_y = FFT.ifft(transpose_z_to_yt(u, col_comm, lay), axis=0, scratch=True)
+        return FFT.irfft(transpose_yt_to_xt(u_y, row_comm, lay), n=Nx, axis=0, scratch=True)
+    if transpose == "alltoallw":
+        u_y = FFT.ifft(yz_transpose(col_comm, lay, u.dtype).backward(u), axis=1, scratch=True)
+        u_x = xy_transpose(row_comm, lay, u_y.dtype).backward(u_y)
+        return FFT.irfft(u_x, n=Nx, axis=2, scratch=True)
+    u_y = FFT.ifft(transpose_z_to_y(u, col_comm, lay), axis=1, scratch=True)
+    u_x = transpose_y_to_x(u_y, row_comm, lay)                       # (dz, dy, Nx//2+1)
+    return FFT.irfft(u_x, n=Nx, axis=2, scratch=True)
+
+# ====== VÁRIOS CAMPOS DE UMA VEZ (lote) ======
+
+def fft3d_forward_pencil_batched(u, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                                 transpose="copy", real=False):
+    """
+    FFT 3D de um lote de campos (componentes de velocidade, escalares...):
+    u (nf, dz, dy, Nx) → (nf, Nz, dyz, dxc). As FFTs locais rodam sobre o lote
+    inteiro e cada transposição é UMA coletiva levando todos os campos: o número
+    de mensagens (e de latências) não cresce com nf, só o tamanho delas.
+    real=True: entrada real, como fft3d_forward_pencil_r2c.
+    """
+    nf = u.shape[0]
+    lay = pencil_layout(comm2d, Nz, Ny, Nx // 2 + 1 if real else Nx)
+    v = FFT.rfft(u, axis=-1) if real else FFT.fft(u, axis=-1)
+    if transpose == "alltoallw":
+        v = FFT.fft(xy_transpose(row_comm, lay, v.dtype, nf).forward(v), axis=-2, scratch=True)
+        return FFT.fft(yz_transpose(col_comm, lay, v.dtype, nf).forward(v), axis=-3, scratch=True)
+    v = FFT.fft(transpose_x_to_y(v, row_comm, lay), axis=-2, scratch=True)
+    return FFT.fft(transpose_y_to_z(v, col_comm, lay), axis=-3, scratch=True)
+
+def fft3d_inverse_pencil_batched(U, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm,
+                                 transpose="copy", real=False):
+    """Inversa de fft3d_forward_pencil_batched: (nf, Nz, dyz, dxc) → (nf, dz, dy, Nx)."""
+    nf = U.shape[0]
+    lay = pencil_layout(comm2d, Nz, Ny, Nx // 2 + 1 if real else Nx)
+    v = FFT.ifft(U, axis=-3)
+    if transpose == "alltoallw":
+        v = FFT.ifft(yz_transpose(col_comm, lay, v.dtype, nf).backward(v), axis=-2, scratch=True)
+        v = xy_transpose(row_comm, lay, v.dtype, nf).backward(v)
+    else:
+        v = FFT.ifft(transpose_z_to_y(v, col_comm, lay), axis=-2, scratch=True)
+        v = transpose_y_to_x(v, row_comm, lay)
+    if real:
+        return FFT.irfft(v, n=Nx, axis=-1, scratch=True)
+    return FFT.ifft(v, axis=-1, scratch=True)
+
+# ====== PLANO DISTRIBUÍDO: tudo criado uma vez, forward/backward sem alocações ======
+
+def aligned_empty(shape, dtype, align=64):
+    """np.empty com o início alinhado a 'align' bytes (linha de cache / registradores SIMD)."""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    raw = np.empty(nbytes + align, dtype=np.uint8)
+    off = -raw.ctypes.data % align
+    return raw[off:off + nbytes].view(dtype).reshape(shape)
+
+class DistributedFFTPlan:
+    """
+    FFT 3D pencil "planejada" (como os planos do FFTW): o construtor cria a grade
+    cartesiana Py x Px e seus sub-comunicadores, os buffers intermediários
+    alinhados, as transposições Alltoallw (tipos subarray) e, se pedido e se a
+    biblioteca for MPI-4, as coletivas persistentes (Alltoallw_init) presas a
+    esses buffers. Depois disso forward(u, out=U) e backward(U, out=u) não alocam
+    arrays: as FFTs escrevem com out= nos buffers do plano (in-place em Y) e as
+    trocas vão de buffer para buffer. (Com o backend numpy; scipy/pyfftw devolvem
+    a transformada num array novo, que é copiado para o buffer.)
+      entrada : X-pencil input_shape  em input_offset   (real se real=True)
+      saída   : Z-pencil output_shape em output_offset
+    Formas e deslocamentos vêm de self.layout (PencilLayout, NX = Nx//2+1 no r2c
+    ou Nx no c2c); a grade não precisa ser divisível por Py, Px.
+    dtype=np.complex64: plano em precisão simples (entrada float32 se real=True).
+    """
+    def __init__(self, comm, Nz, Ny, Nx, Py=None, Px=None, real=False, persistent=False,
+                 dtype=np.complex128):
+        Py, Px = compute_dims(comm.Get_size(), Py, Px)
+        self.Nz, self.Ny, self.Nx, self.Py, self.Px, self.real = Nz, Ny, Nx, Py, Px, real
+
+        # Comunicadores (linhas = Py dividem Z, colunas = Px dividem Y)
+        self.comm2d = comm.Create_cart(dims=[Py, Px], periods=[False, False], reorder=True)
+        self.row_comm = self.comm2d.Sub((False, True))
+        self.col_comm = self.comm2d.Sub((True, False))
+        row, col = self.comm2d.Get_coords(self.comm2d.Get_rank())
+
+        # Layouts
+        lay = self.layout = PencilLayout(Nz, Ny, Nx // 2 + 1 if real else Nx, Py, Px, row, col)
+        dz, dy, _ = lay.x_shape
+        self.input_shape, self.input_offset = (dz, dy, Nx), lay.x_offset
+        self.output_shape, self.output_offset = lay.z_shape, lay.z_offset
+        self.dtype = np.dtype(dtype)
+        self.input_dtype = np.finfo(self.dtype).dtype if real else self.dtype
+
+        # Buffers de trabalho: X completo → Y completo → Z completo
+        self._bx = aligned_empty(lay.x_shape, self.dtype)
+        self._by = aligned_empty(lay.y_shape, self.dtype)
+        self._bz = aligned_empty(lay.z_shape, self.dtype)
+        self._xy = make_xy_transpose(self.row_comm, lay, self.dtype)
+        self._yz = make_yz_transpose(self.col_comm, lay, self.dtype)
+
+        # Coletivas persistentes (opcional): sem MPI-4 cai no Alltoallw comum
+        self._reqs = None
+        if persistent:
+            try:
+                self._reqs = [self._xy.init_forward(self._bx, self._by),
+                              self._yz.init_forward(self._by, self._bz),
+                              self._yz.init_backward(self._bz, self._by),
+                              self._xy.init_backward(self._by, self._bx)]
+            except (NotImplementedError, MPI.Exception):
+                self._reqs = None
+        self.persistent = self._reqs is not None
+
+    def _exchange(self, k):
+        """k: 0 = X→Y, 1 = Y→Z, 2 = Z→Y, 3 = Y→X (sempre entre os buffers do plano)."""
+        if self._reqs is not None:
+            self._reqs[k].Start()
+            self._reqs[k].Wait()
+        elif k == 0:
+            self._xy.forward(self._bx, out=self._by)
+        elif k == 1:
+            self._yz.forward(self._by, out=self._bz)
+        elif k == 2:
+            self._yz.backward(self._bz, out=self._by)
+        else:
+            self._xy.backward(self._by, out=self._bx)
+
+    def alloc_input(self):
+        return aligned_empty(self.input_shape, self.input_dtype)
+
+    def alloc_output(self):
+        return aligned_empty(self.output_shape, self.dtype)
+
+    def forward(self, u, out=None):
+        """u (input_shape) → out (output_shape). Sem alocações quando out é dado."""
+        if out is None:
+            out = self.alloc_output()
+        if self.real:
+            FFT.rfft(u, axis=2, out=self._bx)
+        else:
+            FFT.fft(u, axis=2, out=self._bx)
+        self._exchange(0)
+        FFT.fft(self._by, axis=1, out=self._by, scratch=True)
+        self._exchange(1)
+        FFT.fft(self._bz, axis=0, out=out, scratch=True)
+        return out
+
+    def backward(self, U, out=None):
+        """U (output_shape) → out (input_shape), inversa normalizada. U não é alterado."""
+        if out is None:
+            out = self.alloc_input()
+        FFT.ifft(U, axis=0, out=self._bz)
+        self._exchange(2)
+        FFT.ifft(self._by, axis=1, out=self._by, scratch=True)
+        self._exchange(3)
+        if self.real:
+            FFT.irfft(self._bx, n=self.Nx, axis=2, out=out, scratch=True)
+        else:
+            FFT.ifft(self._bx, axis=2, out=out, scratch=True)
+        return out
+
+    def free(self):
+        """Libera requisições persistentes, tipos derivados e comunicadores."""
+        for r in self._reqs or []:
+            r.Free()
+        self._reqs = None
+        self._xy.free()
+        self._yz.free()
+        for c in (self.row_comm, self.col_comm, self.comm2d):
+            c.Free()
 
 def main():
     ap = argparse.ArgumentParser(description="FFT 3D distribuída (slab/pencil) com Alltoall/Allreduce — mpi4py")
@@ -148,12 +917,49 @@ def main():
     ap.add_argument("--mode", choices=["slab","pencil"], default="slab")
     ap.add_argument("--py", type=int, default=None, help="process rows (Py) para modo pencil")
     ap.add_argument("--px", type=int, default=None, help="process cols (Px) para modo pencil")
+    ap.add_argument("--transform", choices=["c2c", "r2c"], default="c2c",
+                    help="c2c: entrada complexa | r2c: entrada real (rfft/irfft, metade do volume)")
+    ap.add_argument("--transpose", choices=["copy", "alltoallw", "both"], default="copy",
+                    help="copy: empacota com cópias + Alltoall | alltoallw: tipos subarray, sem cópias | "
+                         "both: compara tempo e pico de memória")
+    ap.add_argument("--chunks", type=int, default=1,
+                    help="k > 1: transposições em k fatias (Ialltoall) sobrepostas às FFTs; compara com copy")
+    ap.add_argument("--fft-backend", choices=["numpy", "scipy", "pyfftw", "auto"], default="numpy",
+                    help="FFTs 1D locais (auto: o melhor instalado, pyfftw > scipy > numpy)")
+    ap.add_argument("--fft-threads", type=int, default=1,
+                    help="threads por rank das FFTs locais (scipy workers / FFTW threads)")
+    ap.add_argument("--fft-inplace", action="store_true",
+                    help="FFTs c2c dos temporários do pipeline no próprio array (menos alocações)")
+    ap.add_argument("--fftw-wisdom", type=str, default="ft3d_fftw.wisdom",
+                    help="arquivo da sabedoria FFTW (pyfftw); '' desliga")
+    ap.add_argument("--dtype", choices=list(DTYPES), default="c128",
+                    help="c128: complex128 | c64: complex64 (metade da memória e do tráfego)")
+    ap.add_argument("--fields", type=int, default=1,
+                    help="F > 1: compara F FFTs campo a campo com uma FFT em lote (1 coletiva por troca)")
+    ap.add_argument("--transposed", action="store_true",
+                    help="compara também com entrada/saída em pencils transpostos (eixo completo à frente)")
+    ap.add_argument("--plan", action="store_true",
+                    help="compara também com DistributedFFTPlan (forward/backward sem alocações)")
+    ap.add_argument("--persistent", action="store_true",
+                    help="no plano, usa coletivas persistentes (Alltoallw_init, requer MPI-4)")
     args = ap.parse_args()
+    if args.fft_backend not in ("auto", *available_fft_backends()):
+        ap.error(f"--fft-backend {args.fft_backend}: pacote não instalado "
+                 f"(disponíveis: {', '.join(available_fft_backends())})")
 
     comm = MPI.COMM_WORLD
     rank = comm.Get_rank()
     size = comm.Get_size()
 
+    fft = set_fft_backend(args.fft_backend, args.fft_threads, args.fft_inplace)
+    had_wisdom = fft.load_wisdom(args.fftw_wisdom)
+    if rank == 0:
+        threads = fft.threads if fft.name != "numpy" else 1
+        print(f"[FFT local] backend={fft.name}  threads={threads}  in-place={'sim' if fft.inplace else 'não'}"
+              f"  (instalados: {', '.join(available_fft_backends())})")
+        if fft.name == "pyfftw":
+            print(f"  sabedoria FFTW: {'lida de ' + args.fftw_wisdom if had_wisdom else 'nova'}")
+
     # Define (Py, Px)
     if args.mode == "slab":
         Py, Px = size, 1              # slab em Z
@@ -164,54 +970,184 @@ def main():
 
     # Comunicador cartesiano 2D (linhas=Py, colunas=Px)
     comm2d = comm.Create_cart(dims=[Py, Px], periods=[False, False], reorder=True)
-    coords = comm2d.Get_coords(comm2d.Get_rank())  # (row, col) = (along Z, along Y)
     row_comm = comm2d.Sub((False, True))           # mesma linha (varia coluna)
     col_comm = comm2d.Sub((True, False))           # mesma coluna (varia linha)
 
     Nz, Ny, Nx = args.Nz, args.Ny, args.Nx
-    # Checagens de divisibilidade (didáticas para usar Alltoall simples)
-    assert Nz % Py == 0, "Nz deve ser múltiplo de Py"
-    assert Ny % Px == 0, "Ny deve ser múltiplo de Px"
-    assert Nx % Px == 0, "Nx deve ser múltiplo de Px (para a 1a transposição)"
-    if args.mode == "slab":
-        # nosso pipeline slab usa Ny%Py também (2a transposição)
-        assert Ny % Py == 0, "No modo slab requeremos Ny múltiplo de P (=Py)"
-
-    dz = Nz // Py
-    dy = Ny // Px
-    z0 = coords[0] * dz
-    y0 = coords[1] * dy
+    # Grades quaisquer: blocos desiguais (PencilLayout), trocas com Alltoallv
+    if args.chunks > 1:
+        assert args.transform == "c2c", "--chunks requer --transform c2c"
+        check_chunked_grid(Nz, Ny, Nx, Py, Px)
+    nxs = Nx if args.transform == "c2c" else Nx // 2 + 1
+    lay = pencil_layout(comm2d, Nz, Ny, nxs)
+    dz, dy, _ = lay.x_shape
+    z0, y0, _ = lay.x_offset
 
     # Dados locais (layout inicial: (dz, dy, Nx))
-    u0 = init_local_data(Nz, Ny, Nx, z0, y0, dz, dy)
+    cdtype = np.dtype(DTYPES[args.dtype])
+    u0 = init_local_data(Nz, Ny, Nx, z0, y0, dz, dy, cdtype)
+    forward, inverse = fft3d_forward_pencil, fft3d_inverse_pencil
+    if args.transform == "r2c":
+        u0 = u0.real.copy()   # cos(2π(z/Nz + y/Ny + x/Nx)), float64 (float32 com c64)
+        forward, inverse = fft3d_forward_pencil_r2c, fft3d_inverse_pencil_c2r
 
     # Normas (Allreduce) — antes da FFT
     n0 = global_l2(u0, comm)
 
-    comm.Barrier()
-    t0 = MPI.Wtime()
-    U = fft3d_forward_pencil(u0.copy(), Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm)
-    comm.Barrier()
-    t1 = MPI.Wtime()
+    engines = ["copy", "alltoallw"] if args.transpose == "both" else [args.transpose]
+    if args.chunks > 1:
+        if "copy" not in engines:
+            engines.insert(0, "copy")
+        engines.append("chunked")
+    if args.transposed:
+        if "copy" not in engines:
+            engines.insert(0, "copy")
+        engines.append("transposed")
+    if args.plan:
+        engines.append("plan")
+    results, errors = [], []
+    plan = None
+    for engine in engines:
+        src = u0
+        if engine == "plan":
+            plan = DistributedFFTPlan(comm, Nz, Ny, Nx, Py, Px, real=args.transform == "r2c",
+                                      persistent=args.persistent, dtype=cdtype)
+            assert plan.input_offset == (z0, y0, 0), "grade do plano difere de comm2d"
+            U_out, u_out = plan.alloc_output(), plan.alloc_input()
+            fwd = lambda u: plan.forward(u, out=U_out)
+            inv = lambda U: plan.backward(U, out=u_out)
+        elif engine == "chunked":
+            fwd = lambda u: forward(u, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, "copy", args.chunks)
+            inv = lambda U: inverse(U, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, "copy", args.chunks)
+        elif engine == "transposed":
+            # os dados já vivem no layout transposto (Nx, dz, dy): a cópia é feita uma vez aqui
+            src = np.ascontiguousarray(u0.transpose(PENCIL_AXES["x", True]))
+            fwd = lambda u: forward(u, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, transposed=True)
+            inv = lambda U: inverse(U, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, transposed=True)
+        else:
+            fwd = lambda u, e=engine: forward(u, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, e)
+            inv = lambda U, e=engine: inverse(U, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, e)
 
-    # Inversa
-    u_rec = fft3d_inverse_pencil(U, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm)
-    comm.Barrier()
-    t2 = MPI.Wtime()
+        # aquecimento (a 1a chamada com alltoallw cria os tipos derivados; com pyfftw,
+        # os planos FFTW): ida e volta completa
+        inv(fwd(src))
 
-    # Checagens globais
-    n1 = global_l2(u_rec, comm)                  # deve ser ≈ n0 (até fator de normalização do FFT)
-    # erro máximo local
-    err_loc = float(np.max(np.abs(u_rec - u0)))
-    err_glob = comm.allreduce(err_loc, op=MPI.MAX)
+        comm.Barrier()
+        t0 = MPI.Wtime()
+        U = fwd(src)
+        comm.Barrier()
+        t1 = MPI.Wtime()
 
-    if rank == 0:
-        print(f"[FT3D] modo={args.mode}  P={size}  Py={Py} Px={Px}  N=({Nz},{Ny},{Nx})")
-        print(f"  Tempo forward : {t1 - t0:0.6f} s")
-        print(f"  Tempo inverse : {t2 - t1:0.6f} s")
-        print(f"  ||u0||_2={n0:0.6e}  ||u_rec||_2={n1:0.6e}  (dif={abs(n1-n0):.3e})")
-        print(f"  erro max |u_rec - u0| = {err_glob:.3e}")
+        # Inversa
+        u_rec = inv(U)
+        comm.Barrier()
+        t2 = MPI.Wtime()
+
+        # Pico de memória (alocações NumPy) de uma ida e volta, numa execução à parte
+        # (tracemalloc deixa as alocações mais lentas; fora da medição de tempo)
+        tracemalloc.start()
+        inv(fwd(src))
+        peak = comm.allreduce(tracemalloc.get_traced_memory()[1], op=MPI.MAX)
+        tracemalloc.stop()
+
+        # Checagens globais
+        n1 = global_l2(u_rec, comm)                  # deve ser ≈ n0 (até fator de normalização do FFT)
+        # erro máximo local
+        err_loc = float(np.max(np.abs(u_rec - src), initial=0.0))
+        err_glob = comm.allreduce(err_loc, op=MPI.MAX)
+        # bytes enviados por rank nas duas transposições da forward (máx. entre ranks)
+        vol = comm.allreduce(dz * dy * nxs * cdtype.itemsize + U.nbytes, op=MPI.MAX)
+        results.append((engine, t1 - t0, t2 - t1, peak))
+        errors.append(err_glob)
+
+        if rank == 0:
+            print(f"[FT3D] modo={args.mode}  transform={args.transform}  transpose={engine}  dtype={cdtype.name}  P={size}  Py={Py} Px={Px}  N=({Nz},{Ny},{Nx})")
+            if plan is not None and engine == "plan":
+                print(f"  Coletivas persistentes: {'sim' if plan.persistent else 'não (Alltoallw comum)'}")
+            if engine == "chunked":
+                print(f"  Fatias (Ialltoall sobreposto às FFTs): {args.chunks}")
+            print(f"  Tempo forward : {t1 - t0:0.6f} s")
+            print(f"  Tempo inverse : {t2 - t1:0.6f} s")
+            print(f"  ||u0||_2={n0:0.6e}  ||u_rec||_2={n1:0.6e}  (dif={abs(n1-n0):.3e})")
+            print(f"  erro max |u_rec - u0| = {err_glob:.3e}")
+            print(f"  Alltoall (forward): {vol / 2**20:0.2f} MiB enviados por rank")
+            print(f"  Pico de memória (ida e volta): {peak / 2**20:0.2f} MiB por rank (máx.)")
+
+    if rank == 0 and len(results) > 1:
+        print(f"\n[Transposições] dados locais = {u0.nbytes / 2**20:0.2f} MiB por rank")
+        print("  transpose | forward (s) | inverse (s) | pico (MiB)")
+        for engine, tf, ti, peak in results:
+            print(f" {engine:>10} | {tf:11.6f} | {ti:11.6f} | {peak / 2**20:10.2f}")
+        times = {engine: (tf, ti) for engine, tf, ti, _ in results}
+        if "chunked" in times:
+            (cf, ci), (kf, ki) = times["copy"], times["chunked"]
+            print(f"Speedup da sobreposição (k={args.chunks}) sobre copy: forward {cf / kf:0.2f}x, "
+                  f"inverse {ci / ki:0.2f}x")
+        if "transposed" in times:
+            (cf, ci), (tf, ti) = times["copy"], times["transposed"]
+            print(f"Speedup de transposed (sem reordenar X/Y) sobre copy: forward {cf / tf:0.2f}x, "
+                  f"inverse {ci / ti:0.2f}x")
+
+    if cdtype != np.complex128:
+        # Custo em precisão: a mesma ida e volta (caminho copy) em complex128
+        u64 = init_local_data(Nz, Ny, Nx, z0, y0, dz, dy)
+        if args.transform == "r2c":
+            u64 = u64.real.copy()
+        U64 = forward(u64, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm)
+        err64 = comm.allreduce(float(np.max(np.abs(inverse(U64, Nz, Ny, Nx, Py, Px, comm2d, row_comm,
+                                                             col_comm) - u64), initial=0.0)), op=MPI.MAX)
+        U32 = forward(u0, Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm)
+        dU = comm.allreduce(float(np.max(np.abs(U32 - U64), initial=0.0)), op=MPI.MAX)
+        Umax = comm.allreduce(float(np.max(np.abs(U64), initial=0.0)), op=MPI.MAX)
+        if rank == 0:
+            print(f"\n[Precisão] {cdtype.name} vs complex128  (eps = {np.finfo(cdtype).eps:.1e} vs "
+                  f"{np.finfo(np.complex128).eps:.1e})")
+            print(f"  erro max ida e volta: {max(errors):.3e} ({cdtype.name})  vs  {err64:.3e} (complex128)")
+            print(f"  max |U - U_c128| / max |U_c128| (forward) = {dU / Umax:.3e}")
+            print(f"  dados e Alltoall por rank: {cdtype.itemsize / 16:.2f}x os de complex128")
+
+    if args.fields > 1:
+        # F campos: F chamadas (2F coletivas por forward) vs. um lote (2 coletivas)
+        F = args.fields
+        engine = "alltoallw" if args.transpose == "alltoallw" else "copy"
+        real = args.transform == "r2c"
+        fields = np.stack([u0 * (f + 1) for f in range(F)])
+        batch_args = (Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, engine, real)
+        timings = {}
+        for how in ("campo a campo", "lote"):
+            for _ in range(2):          # 1a vez = aquecimento
+                comm.Barrier()
+                t0 = MPI.Wtime()
+                if how == "lote":
+                    Ub = fft3d_forward_pencil_batched(fields, *batch_args)
+                else:
+                    Uf = [forward(fields[f], Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, engine)
+                          for f in range(F)]
+                comm.Barrier()
+                t1 = MPI.Wtime()
+                if how == "lote":
+                    ub = fft3d_inverse_pencil_batched(Ub, *batch_args)
+                else:
+                    uf = [inverse(Uf[f], Nz, Ny, Nx, Py, Px, comm2d, row_comm, col_comm, engine)
+                          for f in range(F)]
+                comm.Barrier()
+                t2 = MPI.Wtime()
+            timings[how] = (t1 - t0, t2 - t1)
+        dif = comm.allreduce(max(float(np.max(np.abs(Ub[f] - Uf[f]), initial=0.0)) for f in range(F)),
+                             op=MPI.MAX)
+        err = comm.allreduce(float(np.max(np.abs(ub - fields), initial=0.0)), op=MPI.MAX)
+        if rank == 0:
+            print(f"\n[Lote] {F} campos  transform={args.transform}  transpose={engine}")
+            print("          modo | coletivas/forward | forward (s) | inverse (s)")
+            for how, ncoll in (("campo a campo", 2 * F), ("lote", 2)):
+                tf, ti = timings[how]
+                print(f" {how:>13} | {ncoll:17d} | {tf:11.6f} | {ti:11.6f}")
+            print(f"  max |lote - campo a campo| = {dif:.3e}   erro ida e volta (lote) = {err:.3e}")
 
+    if plan is not None:
+        plan.free()
+    fft.save_wisdom(args.fftw_wisdom, comm)
+    free_transposes()
     MPI.Finalize()
 
 if __name__ == "__main__":
@@ -6,13 +6,34 @@
 # Problema: -∇² u = f em [0,1]x[0,1], u=0 nas bordas (Dirichlet)
 # Discretização 5-pontos; domínio particionado em grade cartesiana de processos.
 # Comunicação: troca de halos com MPI_Sendrecv; norma global com Allreduce.
+# Restrição e prolongamento vetorizados (fatias NumPy com passo 2); com --timing,
+# tempo acumulado por nível (suavização, halos, resíduo, restrição, prolongamento).
+# Aglomeração (--agg-size n): quando algum bloco local ficaria com menos de n
+# pontos por lado, o nível é reunido no rank 0 (Gatherv), resolvido ali (ciclo-V
+# em série ou solve direto denso se pequeno) e a correção volta com Scatterv.
+# Hierarquia consistente entre ranks com N = 2^k - 1: os blocos de cada eixo têm
+# n = (N+1)/P pontos, exceto o último (n - 1).
+# MultigridHierarchy: arrays de todos os níveis, buffers de halo e vizinhos
+# criados uma vez; em regime, o ciclo-V não aloca (NumPy com out=); --trace-alloc
+# compara o pico de alocação por ciclo com v_cycle() (tracemalloc).
+# Suavizador Jacobi ou Gauss-Seidel red-black (--smoother rbgs, troca de halos a
+# cada meia varredura), ciclos V/W/F (--cycle) e inicialização FMG (--fmg);
+# --compare mede, com solução manufaturada, quantos ciclos e quanto trabalho
+# cada combinação gasta até o erro algébrico ficar abaixo do de discretização.
+# Halos da hierarquia (--halo isendirecv, padrão): 4 Irecv + 4 Isend postados
+# juntos e um só Waitall; colunas com tipo derivado (Create_vector), sem cópias;
+# --bench-halos REPS mede por nível as duas variantes.
 # mpiexec -n 4 python3 mpi_multigrid_vcycle.py --Nx 128 --Ny 128 --cycles 5
+# mpiexec -n 16 python3 mpi_multigrid_vcycle.py --Nx 1023 --Ny 1023 --cycles 8 --agg-size 16 --timing
+# mpiexec -n 4 python3 mpi_multigrid_vcycle.py --Nx 255 --Ny 255 --smoother rbgs --cycle F --fmg --compare
+# mpiexec -n 4 python3 mpi_multigrid_vcycle.py --Nx 511 --Ny 511 --cycles 2 --bench-halos 100
 # ============================================================
 
 from mpi4py import MPI
 import numpy as np
 import math
 import argparse
+import tracemalloc
 
 # ---------------------------
 # util: fatoração 2D de size
@@ -41,11 +62,40 @@ def make_cart_comm(comm: MPI.Comm):
 # ---------------------------------
 # malha local + alocação
 # ---------------------------------
+def block_sizes(N: int, P: int):
+    """
+    Pontos interiores de cada um dos P blocos de um eixo com N pontos.
+    N = P*n - 1 (ex.: N = 2^k - 1, P potência de 2): P-1 blocos de n e o último
+    com n-1; todo bloco começa num múltiplo de n, então o ponto grosso I de cada
+    bloco cai sobre o fino 2I também na numeração GLOBAL e os níveis grossos
+    (blocos // 2) continuam consistentes entre os ranks.
+    Senão, blocos iguais (N divisível por P).
+    """
+    if (N + 1) % P == 0:
+        counts = np.full(P, (N + 1) // P)
+        counts[-1] -= 1
+    else:
+        assert N % P == 0, "Nx/Ny devem ser divisíveis por Px/Py (ou Nx+1/Ny+1)."
+        counts = np.full(P, N // P)
+    return counts
+
+def coarsen_blocks(counts, N: int):
+    """
+    Blocos do nível grosso (counts // 2, N // 2). Só é consistente se todo bloco
+    começar num ponto global par (o ponto grosso I de cada bloco cai sobre o fino
+    2I) e as metades cobrirem as N // 2 linhas/colunas grossas; senão ValueError.
+    """
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    coarse = counts // 2
+    if np.any(starts % 2) or coarse.sum() != N // 2:
+        raise ValueError(f"blocos {counts.tolist()} de N = {N} não engrossam de forma consistente entre os "
+                         f"ranks; use N = P*n - 1 com n múltiplo de 2^níveis (ex.: N = 2^k - 1, P potência de 2).")
+    return coarse, N // 2
+
 def local_shape(Nx: int, Ny: int, dims, coords):
     Py, Px = dims
-    assert Nx % Px == 0 and Ny % Py == 0, "Nx/Ny devem ser divisíveis por Px/Py."
-    nx = Nx // Px
-    ny = Ny // Py
+    nx = int(block_sizes(Nx, Px)[coords[1]])
+    ny = int(block_sizes(Ny, Py)[coords[0]])
     return nx, ny  # interior (sem halos)
 
 def alloc_with_halos(nxi: int, nyi: int):
@@ -69,49 +119,116 @@ def exchange_halos(u: np.ndarray, comm2d: MPI.Cartcomm, tagbase: int = 100):
 
     # --- Eixo X (colunas)
     left, right = comm2d.Shift(1, +1)  # source=left, dest=right
+    # Todo rank participa de todos os Sendrecv (PROC_NULL vira no-op): pular o
+    # Sendrecv quando não há vizinho para RECEBER também pulava o ENVIO que o
+    # vizinho do outro lado espera (deadlock com Px > 1 ou Py > 1).
 
     # (1) recebe da direita -> preenche EAST
-    if right != MPI.PROC_NULL:
-        send_col = u[1:-1, 1].copy()         # 1ª coluna interior (vai para o vizinho da ESQUERDA)
-        recv_col = np.empty(ny, dtype=u.dtype)
-        comm2d.Sendrecv(sendbuf=send_col, dest=left,  sendtag=tagbase+0,
-                        recvbuf=recv_col, source=right, recvtag=tagbase+0)
-        u[1:-1, -1] = recv_col               # ghost EAST
-    else:
-        u[1:-1, -1] = 0.0
+    send_col = u[1:-1, 1].copy()             # 1ª coluna interior (vai para o vizinho da ESQUERDA)
+    recv_col = np.empty(ny, dtype=u.dtype)
+    comm2d.Sendrecv(sendbuf=send_col, dest=left,  sendtag=tagbase+0,
+                    recvbuf=recv_col, source=right, recvtag=tagbase+0)
+    u[1:-1, -1] = recv_col if right != MPI.PROC_NULL else 0.0   # ghost EAST
 
     # (2) recebe da esquerda -> preenche WEST
-    if left != MPI.PROC_NULL:
-        send_col = u[1:-1, -2].copy()        # última coluna interior (vai para o vizinho da DIREITA)
-        recv_col = np.empty(ny, dtype=u.dtype)
-        comm2d.Sendrecv(sendbuf=send_col, dest=right, sendtag=tagbase+1,
-                        recvbuf=recv_col, source=left,  recvtag=tagbase+1)
-        u[1:-1, 0] = recv_col                # ghost WEST
-    else:
-        u[1:-1, 0] = 0.0
+    send_col = u[1:-1, -2].copy()            # última coluna interior (vai para o vizinho da DIREITA)
+    recv_col = np.empty(ny, dtype=u.dtype)
+    comm2d.Sendrecv(sendbuf=send_col, dest=right, sendtag=tagbase+1,
+                    recvbuf=recv_col, source=left,  recvtag=tagbase+1)
+    u[1:-1, 0] = recv_col if left != MPI.PROC_NULL else 0.0     # ghost WEST
 
-    # --- Eixo Y (linhas)
+    # --- Eixo Y (linhas): linhas inteiras, COM as colunas fantasmas já trocadas,
+    #     assim os cantos chegam do vizinho diagonal (restrição e prolongamento
+    #     usam os pontos diagonais)
     up, down = comm2d.Shift(0, +1)  # source=up, dest=down
 
     # (3) recebe de baixo -> preenche SOUTH
-    if down != MPI.PROC_NULL:
-        send_row = u[1, 1:-1].copy()         # 1ª linha interior (vai para o vizinho de CIMA)
-        recv_row = np.empty(nx, dtype=u.dtype)
-        comm2d.Sendrecv(sendbuf=send_row, dest=up,   sendtag=tagbase+2,
-                        recvbuf=recv_row, source=down, recvtag=tagbase+2)
-        u[-1, 1:-1] = recv_row               # ghost SOUTH
-    else:
-        u[-1, 1:-1] = 0.0
+    send_row = u[1, :].copy()                # 1ª linha interior (vai para o vizinho de CIMA)
+    recv_row = np.empty(nx + 2, dtype=u.dtype)
+    comm2d.Sendrecv(sendbuf=send_row, dest=up,   sendtag=tagbase+2,
+                    recvbuf=recv_row, source=down, recvtag=tagbase+2)
+    u[-1, :] = recv_row if down != MPI.PROC_NULL else 0.0       # ghost SOUTH
 
     # (4) recebe de cima -> preenche NORTH
-    if up != MPI.PROC_NULL:
-        send_row = u[-2, 1:-1].copy()        # última linha interior (vai para o vizinho de BAIXO)
-        recv_row = np.empty(nx, dtype=u.dtype)
-        comm2d.Sendrecv(sendbuf=send_row, dest=down, sendtag=tagbase+3,
-                        recvbuf=recv_row, source=up,   recvtag=tagbase+3)
-        u[0, 1:-1] = recv_row                # ghost NORTH
-    else:
-        u[0, 1:-1] = 0.0
+    send_row = u[-2, :].copy()               # última linha interior (vai para o vizinho de BAIXO)
+    recv_row = np.empty(nx + 2, dtype=u.dtype)
+    comm2d.Sendrecv(sendbuf=send_row, dest=down, sendtag=tagbase+3,
+                    recvbuf=recv_row, source=up,   recvtag=tagbase+3)
+    u[0, :] = recv_row if up != MPI.PROC_NULL else 0.0          # ghost NORTH
+
+# --------------------------
+# TROCA DE HALOS NÃO-BLOQUEANTE (tipos derivados)
+# --------------------------
+def column_type(u: np.ndarray):
+    """
+    Tipo MPI commitado de uma coluna interior de u (ny+2, nx+2), com o tipo base do
+    dtype de u. Quem cria libera (Free): MGLevel guarda o do nível.
+    """
+    ny, nx = u.shape[0] - 2, u.shape[1] - 2
+    return MPI.Datatype.fromcode(u.dtype.char).Create_vector(ny, 1, nx + 2).Commit()
+
+def halo_neighbors(comm2d: MPI.Cartcomm):
+    """(left, right, up, down, nw, ne, sw, se); PROC_NULL fora da grade (não-periódica)."""
+    Py, Px = comm2d.dims
+    cy, cx = comm2d.Get_coords(comm2d.Get_rank())
+    def at(dy, dx):
+        y, x = cy + dy, cx + dx
+        return comm2d.Get_cart_rank([y, x]) if 0 <= y < Py and 0 <= x < Px else MPI.PROC_NULL
+    return at(0, -1), at(0, 1), at(-1, 0), at(1, 0), at(-1, -1), at(-1, 1), at(1, -1), at(1, 1)
+
+def exchange_halos_nb(u: np.ndarray, comm2d: MPI.Cartcomm, tagbase: int = 100,
+                      corners: bool = True, nbrs: tuple = None, col: MPI.Datatype = None):
+    """
+    Variante não-bloqueante de exchange_halos: 4 Irecv + 4 Isend (W, E, N, S)
+    postados de uma vez e um único Waitall (1 latência em vez de 4 Sendrecv em
+    sequência). Colunas saem e chegam direto em u pelo tipo column_type (sem
+    cópias); linhas interiores já são contíguas. u deve ser C-contíguo.
+    corners=True: mais 4 + 4 mensagens de 1 valor com os vizinhos diagonais, que
+    preenchem os cantos (restrição e prolongamento usam os pontos diagonais; a
+    suavização não). nbrs: halo_neighbors(comm2d) já calculado; col: column_type
+    para a forma de u (se None, é criado e liberado nesta chamada).
+    """
+    ny, nx = u.shape[0] - 2, u.shape[1] - 2
+    left, right, up, down, nw, ne, sw, se = nbrs or halo_neighbors(comm2d)
+    own = col is None
+    if own:
+        col = column_type(u)
+    flat = u.reshape(-1)                      # view: [flat[k:], 1, col] = coluna a partir do índice k
+    def c(j):
+        return [flat[nx + 2 + j:], 1, col]    # coluna j, linhas 1..ny
+    reqs = [comm2d.Irecv(c(nx + 1), right, tagbase+0),           # ghost EAST
+            comm2d.Irecv(c(0), left, tagbase+1),                 # ghost WEST
+            comm2d.Irecv(u[-1, 1:-1], down, tagbase+2),          # ghost SOUTH
+            comm2d.Irecv(u[0, 1:-1], up, tagbase+3),             # ghost NORTH
+            comm2d.Isend(c(1), left, tagbase+0),
+            comm2d.Isend(c(nx), right, tagbase+1),
+            comm2d.Isend(u[1, 1:-1], up, tagbase+2),
+            comm2d.Isend(u[-2, 1:-1], down, tagbase+3)]
+    if corners:
+        reqs += [comm2d.Irecv(u[-1, -1:], se, tagbase+4),
+                 comm2d.Irecv(u[-1, :1], sw, tagbase+5),
+                 comm2d.Irecv(u[0, -1:], ne, tagbase+6),
+                 comm2d.Irecv(u[0, :1], nw, tagbase+7),
+                 comm2d.Isend(u[1, 1:2], nw, tagbase+4),
+                 comm2d.Isend(u[1, -2:-1], ne, tagbase+5),
+                 comm2d.Isend(u[-2, 1:2], sw, tagbase+6),
+                 comm2d.Isend(u[-2, -2:-1], se, tagbase+7)]
+    MPI.Request.Waitall(reqs)
+    if own:
+        col.Free()
+    # borda física (PROC_NULL não escreve nada): ghost = 0, como em exchange_halos
+    if right == MPI.PROC_NULL:
+        u[1:-1, -1] = 0.0
+    if left == MPI.PROC_NULL:
+        u[1:-1, 0] = 0.0
+    if down == MPI.PROC_NULL:
+        u[-1, :] = 0.0
+    if up == MPI.PROC_NULL:
+        u[0, :] = 0.0
+    if corners:
+        for who, i, j in ((se, -1, -1), (sw, -1, 0), (ne, 0, -1), (nw, 0, 0)):
+            if who == MPI.PROC_NULL:
+                u[i, j] = 0.0
 
 # --------------------------
 # operador A u (5 pontos)
@@ -130,17 +247,22 @@ def residual(u: np.ndarray, f_int: np.ndarray, h2inv: float):
 # --------------------------
 # suavização: Jacobi relaxado (CORRIGIDO: sinal do f)
 # --------------------------
-def jacobi(u: np.ndarray, f_int: np.ndarray, h2: float, omega: float, iters: int, comm2d: MPI.Cartcomm):
+def jacobi(u: np.ndarray, f_int: np.ndarray, h2: float, omega: float, iters: int, comm2d: MPI.Cartcomm,
+           timing: dict = None, level: int = 0):
     """
     Atualiza u (in-place) com Jacobi relaxado.
       u_new = (1-ω) u + ω * ( (soma_vizinhos - h^2 f) / 4 )
+    timing: se dado, acumula o tempo das trocas de halos e das atualizações (ver tick).
     """
     for _ in range(iters):
+        t = MPI.Wtime()
         exchange_halos(u, comm2d)            # halos atualizados antes de usar vizinhos
+        t = tick(timing, level, "halos", t)
         un = u.copy()
         u[1:-1,1:-1] = (1.0 - omega) * un[1:-1,1:-1] + \
                        omega * ( (un[1:-1,2:] + un[1:-1,:-2]
                                   + un[2:,1:-1] + un[:-2,1:-1] - h2 * f_int) * 0.25 )
+        tick(timing, level, "suavização", t)
 
 # --------------------------
 # restrição (full-weighting 2D)
@@ -150,81 +272,533 @@ def restrict_full_weighting(r: np.ndarray):
     r: resíduo fino (com halos)
     rc: resíduo grosso (com halos), interior metade
     (1/16)*(4 centro + 2 ortogonais + 1 diagonais)
+    O ponto grosso (I,J) fica sobre o fino (2I,2J): cada vizinho é uma fatia de r
+    com passo 2, e as parcelas são somadas na mesma ordem do laço ponto a ponto
+    (resultado idêntico bit a bit, sem laço Python).
     """
     nyf = r.shape[0] - 2
     nxf = r.shape[1] - 2
     nyc = nyf // 2
     nxc = nxf // 2
     rc = np.zeros((nyc + 2, nxc + 2), dtype=r.dtype)
-    for I in range(1, nyc+1):
-        i = 2 * I
-        for J in range(1, nxc+1):
-            j = 2 * J
-            rc[I,J] = ( 4.0 * r[i, j]
-                       + 2.0 * ( r[i-1, j] + r[i+1, j] + r[i, j-1] + r[i, j+1] )
-                       +       ( r[i-1, j-1] + r[i-1, j+1] + r[i+1, j-1] + r[i+1, j+1] )
-                      ) / 16.0
+    def s(di, dj):   # r[2I+di, 2J+dj] para I = 1..nyc, J = 1..nxc
+        return r[2+di : 2*nyc+1+di : 2, 2+dj : 2*nxc+1+dj : 2]
+    rc[1:-1,1:-1] = ( 4.0 * s(0, 0)
+                     + 2.0 * ( s(-1, 0) + s(1, 0) + s(0, -1) + s(0, 1) )
+                     +       ( s(-1, -1) + s(-1, 1) + s(1, -1) + s(1, 1) )
+                    ) / 16.0
     return rc
 
 # --------------------------
 # prolongamento (bilinear)
 # --------------------------
 def prolong_bilinear(ec: np.ndarray, nxf: int, nyf: int):
-    """Interp. bilinear da correção do nível grosso (ec) para o fino (ef)."""
+    """
+    Interp. bilinear da correção do nível grosso (ec) para o fino (ef).
+    Cada ponto fino recebe uma única contribuição, conforme a paridade (linha, coluna):
+    (par, par) = e[I,J]; (ímpar, par) e (par, ímpar) = média de 2; (ímpar, ímpar) = de 4.
+    As quatro classes são fatias de ef com passo 2 (mesmas contas do laço ponto a ponto).
+    """
     ef = np.zeros((nyf + 2, nxf + 2), dtype=ec.dtype)
     nyc = ec.shape[0] - 2
     nxc = ec.shape[1] - 2
-    for I in range(0, nyc+1):
-        for J in range(0, nxc+1):
-            eIJ   = ec[I,   J]
-            eI1J  = ec[I+1, J]
-            eIJ1  = ec[I,   J+1]
-            eI1J1 = ec[I+1, J+1]
-            i = 2 * I
-            j = 2 * J
-            ef[i,   j]   += eIJ
-            ef[i+1, j]   += 0.5*(eIJ + eI1J)
-            ef[i,   j+1] += 0.5*(eIJ + eIJ1)
-            ef[i+1, j+1] += 0.25*(eIJ + eI1J + eIJ1 + eI1J1)
+    eIJ   = ec[:-1, :-1]          # I = 0..nyc, J = 0..nxc
+    eI1J  = ec[1:,  :-1]
+    eIJ1  = ec[:-1, 1:]
+    eI1J1 = ec[1:,  1:]
+    ev, od = slice(0, 2*nyc+1, 2), slice(1, 2*nyc+2, 2)     # linhas i = 2I e i+1
+    evx, odx = slice(0, 2*nxc+1, 2), slice(1, 2*nxc+2, 2)   # colunas j = 2J e j+1
+    ef[ev, evx] += eIJ
+    ef[od, evx] += 0.5*(eIJ + eI1J)
+    ef[ev, odx] += 0.5*(eIJ + eIJ1)
+    ef[od, odx] += 0.25*(eIJ + eI1J + eIJ1 + eI1J1)
     return ef
 
+# --------------------------
+# tempo por nível
+# --------------------------
+TIMING_KEYS = ["suavização", "halos", "resíduo", "restrição", "prolongamento", "aglomeração"]
+
+def tick(timing: dict, level: int, key: str, t0: float):
+    """Soma MPI.Wtime() - t0 em timing[level][key] (se timing não for None); devolve o instante atual."""
+    t = MPI.Wtime()
+    if timing is not None:
+        row = timing.setdefault(level, dict.fromkeys(TIMING_KEYS, 0.0))
+        row[key] += t - t0
+    return t
+
+def report_timing(timing: dict, comm2d: MPI.Cartcomm, shapes: dict):
+    """Tabela (rank 0) dos tempos acumulados por nível, máximo entre os ranks."""
+    levels = sorted(shapes)
+    loc = np.array([[timing.get(l, {}).get(k, 0.0) for k in TIMING_KEYS] for l in levels])
+    tot = np.empty_like(loc)
+    comm2d.Allreduce(loc, tot, op=MPI.MAX)
+    if comm2d.Get_rank() == 0:
+        print("\n[Tempo por nível] soma de todos os ciclos, máx. entre ranks (s)")
+        print(" nível | n_local   | " + " | ".join(f"{k:>13}" for k in TIMING_KEYS) + " |     total")
+        for l, row in zip(levels, tot):
+            nx, ny = shapes[l]
+            print(f" {l:5d} | {nx:4d}x{ny:<4d} | " + " | ".join(f"{v:13.6f}" for v in row) + f" | {row.sum():9.6f}")
+        print(f" total |           | " + " | ".join(f"{v:13.6f}" for v in tot.sum(axis=0)) + f" | {tot.sum():9.6f}")
+
+# --------------------------
+# aglomeração dos níveis grossos
+# --------------------------
+class Agglomeration:
+    """
+    Nível 'level' (o primeiro em que algum bloco local teria menos de agg_size
+    pontos por lado) e abaixo dele resolvidos num só rank: Gatherv de u e f do
+    nível no rank 0 de comm2d, ciclo-V em série ali (comunicador 1x1, sem halos
+    entre ranks) ou, se o nível tiver até 'direct' incógnitas, solve direto com a
+    inversa densa do operador (montada uma vez), e Scatterv da solução. Nos níveis
+    grossos cada rank só teria latência de halos e o Jacobi da base converge mal;
+    aqui os demais ranks só esperam pelo Scatterv.
+    Formas, contagens e deslocamentos de todos os ranks e os buffers das trocas e
+    do solve são criados uma vez (o ciclo em série do rank 0 é uma
+    MultigridHierarchy, criada na 1a chamada de cada configuração).
+    """
+    def __init__(self, comm2d: MPI.Cartcomm, Nx: int, Ny: int, agg_size: int, direct: int = 1024):
+        Py, Px = comm2d.dims
+        xc, yc = block_sizes(Nx, Px), block_sizes(Ny, Py)
+        level, nxg, nyg = 0, Nx, Ny
+        while min(xc.min(), yc.min()) >= agg_size:
+            # os blocos de todos os ranks precisam ladrilhar o nível: o Gatherv monta U e F com eles
+            xc, nxg = coarsen_blocks(xc, nxg)
+            yc, nyg = coarsen_blocks(yc, nyg)
+            level += 1
+        self.comm2d, self.level, self.nx, self.ny, self.agg_size = comm2d, level, nxg, nyg, agg_size
+        self.root = comm2d.Get_rank() == 0
+        # bloco de cada rank no nível aglomerado: (linhas, colunas) e início global
+        xo = np.concatenate(([0], np.cumsum(xc)[:-1]))
+        yo = np.concatenate(([0], np.cumsum(yc)[:-1]))
+        self.blocks = []
+        for r in range(comm2d.Get_size()):
+            cy, cx = comm2d.Get_coords(r)
+            self.blocks.append((int(yc[cy]), int(xc[cx]), int(yo[cy]), int(xo[cx])))
+        sizes = np.array([2 * ny * nx for ny, nx, _, _ in self.blocks])   # u e f juntos
+        self.counts = (sizes, np.concatenate(([0], np.cumsum(sizes)[:-1])))
+        self.scounts = (sizes // 2, self.counts[1] // 2)                 # só u na volta
+        by, bx, _, _ = self.blocks[comm2d.Get_rank()]
+        self.send = np.empty((2, by, bx))
+        self.mine = np.empty((by, bx))
+        self.serial = MPI.COMM_SELF.Create_cart([1, 1], periods=[False, False]) if self.root else None
+        self.mg = {}
+        self.Ainv = None
+        if self.root:
+            self.recv = np.empty(int(sizes.sum()))
+            self.U = alloc_with_halos(nxg, nyg)
+            self.F = np.zeros((nyg, nxg))
+            self.out = np.empty(int(sizes.sum()) // 2)
+        if self.root and nxg * nyg <= direct:
+            # A = (T_y ⊗ I + I ⊗ T_x), T = tridiag(1, -2, 1): o mesmo 5 pontos de apply_A (sem 1/h^2)
+            Tx = -2.0 * np.eye(nxg) + np.eye(nxg, k=1) + np.eye(nxg, k=-1)
+            Ty = -2.0 * np.eye(nyg) + np.eye(nyg, k=1) + np.eye(nyg, k=-1)
+            self.Ainv = np.linalg.inv(np.kron(Ty, np.eye(nxg)) + np.kron(np.eye(nyg), Tx))
+            self.rhs, self.sol = np.empty(nxg * nyg), np.empty(nxg * nyg)
+
+    def solve(self, u: np.ndarray, f_int: np.ndarray, h: float, nu1: int, nu2: int, omega: float,
+              smoother: str = "jacobi", cycle: str = "V"):
+        """Resolve o nível aglomerado (u com halos, f_int interior deste rank); atualiza u."""
+        np.copyto(self.send[0], u[1:-1, 1:-1])
+        np.copyto(self.send[1], f_int)
+        self.comm2d.Gatherv(self.send, [self.recv, self.counts, MPI.DOUBLE] if self.root else None, root=0)
+        if self.root:
+            U, F = self.U, self.F
+            for (by, bx, y0, x0), d in zip(self.blocks, self.counts[1]):
+                blk = self.recv[d:d + 2 * by * bx].reshape(2, by, bx)
+                U[1 + y0:1 + y0 + by, 1 + x0:1 + x0 + bx] = blk[0]
+                F[y0:y0 + by, x0:x0 + bx] = blk[1]
+            if self.Ainv is not None:
+                np.multiply(F.ravel(), h * h, out=self.rhs)
+                np.matmul(self.Ainv, self.rhs, out=self.sol)
+                U[1:-1, 1:-1] = self.sol.reshape(self.ny, self.nx)
+            else:
+                key = (nu1, nu2, omega, smoother, cycle)
+                if key not in self.mg:
+                    self.mg[key] = MultigridHierarchy(self.serial, self.nx, self.ny, h, nu1, nu2, omega,
+                                                      smoother=smoother, cycle=cycle)
+                self.mg[key].cycle(U, F)
+            for (by, bx, y0, x0), d in zip(self.blocks, self.scounts[1]):
+                self.out[d:d + by * bx].reshape(by, bx)[...] = U[1 + y0:1 + y0 + by, 1 + x0:1 + x0 + bx]
+        self.comm2d.Scatterv([self.out, self.scounts, MPI.DOUBLE] if self.root else None, self.mine, root=0)
+        u[1:-1, 1:-1] = self.mine
+
+    def free(self):
+        """Libera as hierarquias em série do rank 0 e o comunicador 1x1."""
+        for mg in self.mg.values():
+            mg.free()
+        self.mg.clear()
+        if self.serial is not None:
+            self.serial.Free()
+            self.serial = None
+
+def make_agglomeration(comm2d: MPI.Cartcomm, Nx: int, Ny: int, agg_size: int = 0, direct: int = 1024):
+    """
+    Agglomeration para o problema global Nx x Ny, ou None se não for usada.
+    Com blocos desiguais (N = P*n - 1) ela é obrigatória a partir de 4 pontos por
+    lado: os ranks precisam concordar sobre o nível da base do ciclo-V.
+    """
+    if comm2d.Get_size() == 1:
+        return None
+    Py, Px = comm2d.dims
+    xc, yc = block_sizes(Nx, Px), block_sizes(Ny, Py)
+    if xc.min() != xc.max() or yc.min() != yc.max():
+        agg_size = max(agg_size, 4)
+    return Agglomeration(comm2d, Nx, Ny, agg_size, direct) if agg_size > 0 else None
+
 # --------------------------
 # um ciclo-V recursivo
 # --------------------------
 def v_cycle(u: np.ndarray, f_int: np.ndarray, h: float, comm2d: MPI.Cartcomm,
-            nu1: int = 3, nu2: int = 3, omega: float = 2/3, level: int = 0):
-    """Executa 1 ciclo-V no nível atual (u,f)."""
+            nu1: int = 3, nu2: int = 3, omega: float = 2/3, level: int = 0, timing: dict = None,
+            agg: Agglomeration = None):
+    """
+    Executa 1 ciclo-V no nível atual (u,f).
+    timing: dict opcional {nível: {etapa: segundos}} acumulado ao longo das chamadas.
+    agg: se dado, no nível agg.level o resto do ciclo roda aglomerado (Agglomeration).
+    """
     h2 = h*h
     h2inv = 1.0 / h2
     ny = u.shape[0] - 2
     nx = u.shape[1] - 2
 
+    if agg is not None and level == agg.level:
+        t = MPI.Wtime()
+        agg.solve(u, f_int, h, nu1, nu2, omega)
+        tick(timing, level, "aglomeração", t)
+        return
+
     # Base: subdomínio muito pequeno → só suaviza mais
     if nx < 4 or ny < 4:
-        jacobi(u, f_int, h2, omega, iters=20, comm2d=comm2d)
+        jacobi(u, f_int, h2, omega, iters=20, comm2d=comm2d, timing=timing, level=level)
         return
 
     # 1) pré-suavização
-    jacobi(u, f_int, h2, omega, iters=nu1, comm2d=comm2d)
+    jacobi(u, f_int, h2, omega, iters=nu1, comm2d=comm2d, timing=timing, level=level)
 
     # 2) resíduo e restrição
+    t = MPI.Wtime()
     exchange_halos(u, comm2d)             # garante halos atualizados
+    t = tick(timing, level, "halos", t)
     r = residual(u, f_int, h2inv)         # interior
     r_full = np.zeros_like(u)
     r_full[1:-1,1:-1] = r
+    t = tick(timing, level, "resíduo", t)
+    exchange_halos(r_full, comm2d)        # a restrição do último ponto grosso usa o resíduo do vizinho
+    t = tick(timing, level, "halos", t)
     rc = restrict_full_weighting(r_full)
+    tick(timing, level, "restrição", t)
 
     # 3) resolve no nível grosso (recursivo)
     hc = 2.0*h
     ec = np.zeros_like(rc)                # correção no grosso
-    v_cycle(ec, rc[1:-1,1:-1], hc, comm2d, nu1, nu2, omega, level+1)
+    v_cycle(ec, rc[1:-1,1:-1], hc, comm2d, nu1, nu2, omega, level+1, timing, agg)
 
-    # 4) prolonga e corrige
+    # 4) prolonga e corrige (halos de ec atualizados: a interpolação dos pontos
+    #    da borda do bloco usa o ponto grosso do vizinho)
+    t = MPI.Wtime()
+    exchange_halos(ec, comm2d)
+    t = tick(timing, level, "halos", t)
     ef = prolong_bilinear(ec, nx, ny)
     u[1:-1,1:-1] += ef[1:-1,1:-1]
+    tick(timing, level, "prolongamento", t)
 
     # 5) pós-suavização
-    jacobi(u, f_int, h2, omega, iters=nu2, comm2d=comm2d)
+    jacobi(u, f_int, h2, omega, iters=nu2, comm2d=comm2d, timing=timing, level=level)
+
+# --------------------------
+# hierarquia pré-alocada (ciclo-V sem alocações)
+# --------------------------
+class MGLevel:
+    """
+    Arrays de um nível (nx x ny pontos locais a partir do ponto global (y0, x0),
+    passo h), alocados uma vez.
+    """
+    def __init__(self, nx: int, ny: int, h: float, x0: int = 0, y0: int = 0):
+        self.nx, self.ny, self.h, self.x0, self.y0 = nx, ny, h, x0, y0
+        self.h2 = h*h
+        self.h2inv = 1.0 / self.h2
+        self.u = alloc_with_halos(nx, ny)        # correção (níveis grossos)
+        self.f = np.zeros((ny, nx))              # lado direito (níveis grossos: resíduo restrito)
+        self.r = alloc_with_halos(nx, ny)        # resíduo com halos (entrada da restrição)
+        self.ef = alloc_with_halos(nx, ny)       # correção prolongada do nível de baixo
+        self.w1 = np.empty((ny, nx))             # temporários do Jacobi / da restrição
+        self.w2 = np.empty((ny, nx))
+        self.col_send, self.col_recv = np.empty(ny), np.empty(ny)
+        self.row_send, self.row_recv = np.empty(nx + 2), np.empty(nx + 2)
+        self.coltype = column_type(self.u)       # coluna (tipo derivado) de exchange_halos_nb
+        self.x = alloc_with_halos(nx, ny)        # FMG: solução e lado direito do nível
+        self.b = np.zeros((ny, nx))
+        # red-black: a cor do ponto local (i, j) é a paridade GLOBAL (y0+i-1 + x0+j-1),
+        # a mesma em qualquer partição; cada cor são 2 sub-malhas de passo 2, guardadas
+        # como fatias (centro, W, E, N, S em u com halos; centro em f interior)
+        def sl(a, n):
+            return slice(a, a + 2*n - 1, 2)
+        self.colors = ([], [])
+        for r0 in (1, 2):
+            for c0 in (1, 2):
+                nr, nc = len(range(r0, ny + 1, 2)), len(range(c0, nx + 1, 2))
+                if nr and nc:
+                    self.colors[(y0 + r0 - 1 + x0 + c0 - 1) % 2].append((
+                        (sl(r0, nr), sl(c0, nc)),
+                        (sl(r0, nr), sl(c0 - 1, nc)), (sl(r0, nr), sl(c0 + 1, nc)),
+                        (sl(r0 - 1, nr), sl(c0, nc)), (sl(r0 + 1, nr), sl(c0, nc)),
+                        (sl(r0 - 1, nr), sl(c0 - 1, nc))))
+
+class MultigridHierarchy:
+    """
+    Ciclo-V com tudo criado no construtor: MGLevel de cada nível (u e f dos níveis
+    grossos, resíduo com halos, correção prolongada, temporários), buffers de halo
+    e vizinhos (Shift). v_cycle(u, f) só escreve nesses arrays (ufuncs com out=),
+    sem np.zeros/copy por nível nem u.copy() por varredura: útil com muitos
+    ciclos (passo de tempo), sem churn do alocador nem page faults.
+    Mesmas contas, na mesma ordem, de v_cycle/jacobi/residual/restrict_full_weighting/
+    prolong_bilinear (o Jacobi escreve a soma dos vizinhos num temporário antes
+    de alterar u, o que dispensa a cópia un).
+    smoother: "jacobi" (ω = omega) ou "rbgs" (Gauss-Seidel red-black, ω = 1);
+    cycle: "V", "W" ou "F" (tipo padrão de cycle()). work acumula o trabalho em
+    pontos locais atualizados (varreduras e resíduos), para work-per-digit.
+    halo: "isendirecv" (exchange_halos_nb; cantos só antes da restrição e do
+    prolongamento) ou "sendrecv" (4 Sendrecv com buffers do nível).
+    """
+    def __init__(self, comm2d: MPI.Cartcomm, Nx: int, Ny: int, h: float,
+                 nu1: int = 3, nu2: int = 3, omega: float = 2/3, agg: Agglomeration = None,
+                 smoother: str = "jacobi", cycle: str = "V", halo: str = "isendirecv"):
+        self.comm2d, self.nu1, self.nu2, self.omega, self.agg = comm2d, nu1, nu2, omega, agg
+        self.smoother, self.kind, self.halo = smoother, cycle, halo
+        self.work = 0
+        self.left, self.right = comm2d.Shift(1, +1)
+        self.up, self.down = comm2d.Shift(0, +1)
+        self.nbrs = halo_neighbors(comm2d)
+        Py, Px = comm2d.dims
+        cy, cx = comm2d.Get_coords(comm2d.Get_rank())
+        xc, yc = block_sizes(Nx, Px), block_sizes(Ny, Py)   # blocos de todos os ranks (local_shape)
+        self.levels = []
+        while True:
+            nx, ny = int(xc[cx]), int(yc[cy])
+            self.levels.append(MGLevel(nx, ny, h, int(xc[:cx].sum()), int(yc[:cy].sum())))
+            # mesma regra de parada de v_cycle: base (< 4 pontos) ou nível aglomerado
+            if nx < 4 or ny < 4 or (agg is not None and len(self.levels) - 1 == agg.level):
+                break
+            xc, yc, h = xc // 2, yc // 2, 2.0*h
+
+    def free(self):
+        """Libera os tipos derivados dos níveis (a Agglomeration, compartilhada, não)."""
+        for lv in self.levels:
+            if lv.coltype is not None:
+                lv.coltype.Free()
+                lv.coltype = None
+
+    def exchange(self, a: np.ndarray, lv: MGLevel, tagbase: int = 100, corners: bool = False):
+        """
+        Troca de halos de a (forma do nível lv). isendirecv: exchange_halos_nb com os
+        vizinhos já calculados (corners=True também preenche os cantos). sendrecv:
+        exchange_halos com os buffers do nível (sempre com cantos).
+        """
+        if self.halo == "isendirecv":
+            exchange_halos_nb(a, self.comm2d, tagbase, corners, self.nbrs, lv.coltype)
+            return
+        comm2d = self.comm2d
+        np.copyto(lv.col_send, a[1:-1, 1])
+        comm2d.Sendrecv(lv.col_send, self.left, tagbase+0, lv.col_recv, self.right, tagbase+0)
+        if self.right != MPI.PROC_NULL:
+            a[1:-1, -1] = lv.col_recv
+        else:
+            a[1:-1, -1] = 0.0
+        np.copyto(lv.col_send, a[1:-1, -2])
+        comm2d.Sendrecv(lv.col_send, self.right, tagbase+1, lv.col_recv, self.left, tagbase+1)
+        if self.left != MPI.PROC_NULL:
+            a[1:-1, 0] = lv.col_recv
+        else:
+            a[1:-1, 0] = 0.0
+        np.copyto(lv.row_send, a[1, :])
+        comm2d.Sendrecv(lv.row_send, self.up, tagbase+2, lv.row_recv, self.down, tagbase+2)
+        if self.down != MPI.PROC_NULL:
+            a[-1, :] = lv.row_recv
+        else:
+            a[-1, :] = 0.0
+        np.copyto(lv.row_send, a[-2, :])
+        comm2d.Sendrecv(lv.row_send, self.down, tagbase+3, lv.row_recv, self.up, tagbase+3)
+        if self.up != MPI.PROC_NULL:
+            a[0, :] = lv.row_recv
+        else:
+            a[0, :] = 0.0
+
+    def smooth(self, u: np.ndarray, f_int: np.ndarray, lv: MGLevel, iters: int, timing: dict, level: int):
+        """iters varreduras do suavizador escolhido."""
+        self.work += iters * lv.nx * lv.ny
+        if self.smoother == "rbgs":
+            self.rbgs(u, f_int, lv, iters, timing, level)
+        else:
+            self.jacobi(u, f_int, lv, iters, timing, level)
+
+    def jacobi(self, u: np.ndarray, f_int: np.ndarray, lv: MGLevel, iters: int, timing: dict, level: int):
+        """Jacobi relaxado de jacobi(), sem alocar: w1 = vizinhos, w2 = temporário."""
+        omega, w1, w2, ui = self.omega, lv.w1, lv.w2, u[1:-1, 1:-1]
+        for _ in range(iters):
+            t = MPI.Wtime()
+            self.exchange(u, lv)
+            t = tick(timing, level, "halos", t)
+            np.add(u[1:-1, 2:], u[1:-1, :-2], out=w1)
+            np.add(w1, u[2:, 1:-1], out=w1)
+            np.add(w1, u[:-2, 1:-1], out=w1)
+            np.multiply(f_int, lv.h2, out=w2)
+            np.subtract(w1, w2, out=w1)
+            np.multiply(w1, 0.25, out=w1)
+            np.multiply(w1, omega, out=w1)
+            np.multiply(ui, 1.0 - omega, out=w2)
+            np.add(w2, w1, out=ui)
+            tick(timing, level, "suavização", t)
+
+    def rbgs(self, u: np.ndarray, f_int: np.ndarray, lv: MGLevel, iters: int, timing: dict, level: int):
+        """
+        Gauss-Seidel red-black: para cada cor, troca de halos (meia varredura) e
+        u = (soma_vizinhos - h^2 f) / 4 nos pontos da cor. Os 4 vizinhos são da
+        outra cor, então cada sub-malha é atualizada direto em u, sem temporário.
+        """
+        for _ in range(iters):
+            for subs in lv.colors:
+                t = MPI.Wtime()
+                self.exchange(u, lv)
+                t = tick(timing, level, "halos", t)
+                for C, W, E, N, S, F in subs:
+                    uc = u[C]
+                    np.multiply(f_int[F], -lv.h2, out=uc)
+                    np.add(uc, u[W], out=uc)
+                    np.add(uc, u[E], out=uc)
+                    np.add(uc, u[N], out=uc)
+                    np.add(uc, u[S], out=uc)
+                    np.multiply(uc, 0.25, out=uc)
+                tick(timing, level, "suavização", t)
+
+    def residual(self, u: np.ndarray, f_int: np.ndarray, lv: MGLevel):
+        """lv.r (interior) = f - A u, com halos de u já trocados."""
+        self.work += lv.nx * lv.ny
+        ri = lv.r[1:-1, 1:-1]
+        np.multiply(u[1:-1, 1:-1], -4.0, out=ri)
+        np.add(ri, u[1:-1, 2:], out=ri)
+        np.add(ri, u[1:-1, :-2], out=ri)
+        np.add(ri, u[2:, 1:-1], out=ri)
+        np.add(ri, u[:-2, 1:-1], out=ri)
+        np.multiply(ri, lv.h2inv, out=ri)
+        np.subtract(f_int, ri, out=ri)
+
+    @staticmethod
+    def restrict(r: np.ndarray, fc: np.ndarray, w: np.ndarray):
+        """restrict_full_weighting de r (com halos) direto em fc (interior grosso); w: temporário grosso."""
+        nyc, nxc = fc.shape
+        def s(di, dj):
+            return r[2+di : 2*nyc+1+di : 2, 2+dj : 2*nxc+1+dj : 2]
+        np.multiply(s(0, 0), 4.0, out=fc)
+        np.add(s(-1, 0), s(1, 0), out=w)
+        np.add(w, s(0, -1), out=w)
+        np.add(w, s(0, 1), out=w)
+        np.multiply(w, 2.0, out=w)
+        np.add(fc, w, out=fc)
+        np.add(s(-1, -1), s(-1, 1), out=w)
+        np.add(w, s(1, -1), out=w)
+        np.add(w, s(1, 1), out=w)
+        np.add(fc, w, out=fc)
+        np.divide(fc, 16.0, out=fc)
+
+    @staticmethod
+    def prolong_add(ec: np.ndarray, u: np.ndarray, ef: np.ndarray):
+        """u (interior) += prolong_bilinear(ec), montando a interpolação no buffer ef."""
+        nyc, nxc = ec.shape[0] - 2, ec.shape[1] - 2
+        eIJ, eI1J, eIJ1, eI1J1 = ec[:-1, :-1], ec[1:, :-1], ec[:-1, 1:], ec[1:, 1:]
+        ev, od = slice(0, 2*nyc+1, 2), slice(1, 2*nyc+2, 2)
+        evx, odx = slice(0, 2*nxc+1, 2), slice(1, 2*nxc+2, 2)
+        np.copyto(ef[ev, evx], eIJ)
+        np.add(eIJ, eI1J, out=ef[od, evx])
+        np.multiply(ef[od, evx], 0.5, out=ef[od, evx])
+        np.add(eIJ, eIJ1, out=ef[ev, odx])
+        np.multiply(ef[ev, odx], 0.5, out=ef[ev, odx])
+        np.add(eIJ, eI1J, out=ef[od, odx])
+        np.add(ef[od, odx], eIJ1, out=ef[od, odx])
+        np.add(ef[od, odx], eI1J1, out=ef[od, odx])
+        np.multiply(ef[od, odx], 0.25, out=ef[od, odx])
+        np.add(u[1:-1, 1:-1], ef[1:-1, 1:-1], out=u[1:-1, 1:-1])
+
+    def v_cycle(self, u: np.ndarray, f_int: np.ndarray, timing: dict = None, level: int = 0):
+        """Um ciclo-V a partir do nível 'level' (u com halos, f_int interior), como v_cycle()."""
+        self.cycle(u, f_int, timing, level, "V")
+
+    def cycle(self, u: np.ndarray, f_int: np.ndarray, timing: dict = None, level: int = 0, kind: str = None):
+        """
+        Um ciclo (kind = "V", "W" ou "F"; padrão: o da hierarquia) a partir do nível
+        'level'. No nível grosso: V visita 1 vez; W, 2 ciclos-W; F, um ciclo-F e
+        depois um ciclo-V. O nível aglomerado é visitado só uma vez (já é resolvido).
+        """
+        kind = kind or self.kind
+        lv = self.levels[level]
+        if self.agg is not None and level == self.agg.level:
+            t = MPI.Wtime()
+            self.agg.solve(u, f_int, lv.h, self.nu1, self.nu2, self.omega, self.smoother, self.kind)
+            tick(timing, level, "aglomeração", t)
+            return
+        if level == len(self.levels) - 1:          # base: só suaviza mais
+            self.smooth(u, f_int, lv, 20, timing, level)
+            return
+
+        self.smooth(u, f_int, lv, self.nu1, timing, level)
+
+        t = MPI.Wtime()
+        self.exchange(u, lv)
+        t = tick(timing, level, "halos", t)
+        self.residual(u, f_int, lv)
+        t = tick(timing, level, "resíduo", t)
+        self.exchange(lv.r, lv, corners=True)
+        t = tick(timing, level, "halos", t)
+        cl = self.levels[level + 1]
+        self.restrict(lv.r, cl.f, cl.w1)
+        tick(timing, level, "restrição", t)
+
+        cl.u.fill(0.0)
+        if kind == "V" or (self.agg is not None and level + 1 == self.agg.level):
+            self.cycle(cl.u, cl.f, timing, level + 1, "V")
+        elif kind == "W":
+            self.cycle(cl.u, cl.f, timing, level + 1, "W")
+            self.cycle(cl.u, cl.f, timing, level + 1, "W")
+        else:
+            self.cycle(cl.u, cl.f, timing, level + 1, "F")
+            self.cycle(cl.u, cl.f, timing, level + 1, "V")
+
+        t = MPI.Wtime()
+        self.exchange(cl.u, cl, corners=True)
+        t = tick(timing, level, "halos", t)
+        self.prolong_add(cl.u, u, lv.ef)
+        tick(timing, level, "prolongamento", t)
+
+        self.smooth(u, f_int, lv, self.nu2, timing, level)
+
+    def fmg(self, u: np.ndarray, f_int: np.ndarray, timing: dict = None):
+        """
+        Multigrid completo (FMG): f é restrito até o nível mais grosso, resolvido
+        ali, e a solução de cada nível, prolongada, é o chute inicial de um ciclo
+        no nível seguinte (até o fino, em u). Ignora o u de entrada; com um ciclo
+        por nível já chega perto do erro de discretização.
+        """
+        L = len(self.levels) - 1
+        xs = [u] + [lv.x for lv in self.levels[1:]]
+        bs = [f_int] + [lv.b for lv in self.levels[1:]]
+        for l in range(L):
+            lv, cl = self.levels[l], self.levels[l + 1]
+            t = MPI.Wtime()
+            np.copyto(lv.r[1:-1, 1:-1], bs[l])
+            self.exchange(lv.r, lv, corners=True)
+            t = tick(timing, l, "halos", t)
+            self.restrict(lv.r, cl.b, cl.w1)
+            tick(timing, l, "restrição", t)
+        xs[L].fill(0.0)
+        self.cycle(xs[L], bs[L], timing, L)
+        for l in range(L - 1, -1, -1):
+            t = MPI.Wtime()
+            self.exchange(xs[l + 1], self.levels[l + 1], corners=True)
+            t = tick(timing, l, "halos", t)
+            xs[l].fill(0.0)
+            self.prolong_add(xs[l + 1], xs[l], self.levels[l].ef)
+            tick(timing, l, "prolongamento", t)
+            self.cycle(xs[l], bs[l], timing, l)
 
 # --------------------------
 # norma global do resíduo
@@ -237,6 +811,105 @@ def global_residual_norm(u: np.ndarray, f_int: np.ndarray, h: float, comm2d: MPI
     tot = comm2d.allreduce(loc, op=MPI.SUM)
     return math.sqrt(tot)
 
+# --------------------------
+# latência da troca de halos por nível
+# --------------------------
+def bench_halos(mg: MultigridHierarchy, reps: int = 50):
+    """
+    Tempo médio (máx. entre ranks) de uma troca de halos em cada nível de mg:
+    4 Sendrecv em sequência x 8 mensagens não-bloqueantes (sem e com cantos).
+    """
+    comm2d, halo = mg.comm2d, mg.halo
+    rows = []
+    for lv in mg.levels:
+        a = alloc_with_halos(lv.nx, lv.ny)
+        ts = []
+        for mode, corners in (("sendrecv", True), ("isendirecv", False), ("isendirecv", True)):
+            mg.halo = mode
+            mg.exchange(a, lv, corners=corners)            # aquece (cria o tipo da coluna)
+            comm2d.Barrier()
+            t0 = MPI.Wtime()
+            for _ in range(reps):
+                mg.exchange(a, lv, corners=corners)
+            ts.append(comm2d.allreduce((MPI.Wtime() - t0) / reps, op=MPI.MAX))
+        rows.append((lv.nx, lv.ny, ts))
+    mg.halo = halo
+    if comm2d.Get_rank() == 0:
+        print(f"\n[Halos] µs por troca (média de {reps}, máx. entre ranks)")
+        print(" nível | n_local   | 4x Sendrecv | Isend/Irecv | +cantos")
+        for l, (nx, ny, ts) in enumerate(rows):
+            print(f" {l:5d} | {nx:4d}x{ny:<4d} | " + " | ".join(f"{t * 1e6:11.1f}" for t in ts[:2])
+                  + f" | {ts[2] * 1e6:7.1f}")
+
+# --------------------------
+# comparação suavizador x ciclo x FMG
+# --------------------------
+def digits_gained(e0: float, e: float):
+    """Dígitos de redução log10(e0/e), ou None se e não caiu (ou não é finito): sem work-per-digit."""
+    if not (math.isfinite(e) and e < e0):
+        return None
+    return math.log10(e0 / max(e, 1e-300))
+
+def compare_cycles(comm2d: MPI.Cartcomm, Nx: int, Ny: int, h: float, nu1: int, nu2: int,
+                   agg: Agglomeration = None, max_cycles: int = 30):
+    """
+    Solução manufaturada u = sin(πx) sin(πy), f = -2π² u (o código resolve A u = f
+    com A u = ∇²u, ver apply_A). A solução discreta u_h
+    (referência convergida a 1e-11 no resíduo) tem erro de discretização
+    e_d = max|u_h - u|; cada combinação roda ciclos a partir de zero (ou FMG no 1o)
+    até o erro algébrico max|u_k - u_h| ficar abaixo de e_d / 10.
+    Trabalho em WU (1 WU = uma varredura no nível fino do rank, máx. entre ranks;
+    o nível aglomerado não entra) e por dígito de redução do erro algébrico.
+    """
+    rank = comm2d.Get_rank()
+    ref = MultigridHierarchy(comm2d, Nx, Ny, h, nu1, nu2, agg=agg, smoother="rbgs")
+    lv0 = ref.levels[0]
+    X = (lv0.x0 + 1 + np.arange(lv0.nx)) * h
+    Y = (lv0.y0 + 1 + np.arange(lv0.ny)) * h
+    ue = np.outer(np.sin(math.pi * Y), np.sin(math.pi * X))
+    f = -2.0 * math.pi**2 * ue
+
+    def gmax(a):
+        return comm2d.allreduce(float(np.max(np.abs(a))), op=MPI.MAX)
+
+    uh = alloc_with_halos(lv0.nx, lv0.ny)
+    r0 = global_residual_norm(uh, f, h, comm2d)
+    for _ in range(100):
+        ref.cycle(uh, f)
+        if global_residual_norm(uh, f, h, comm2d) <= 1e-11 * r0:
+            break
+    e_disc = gmax(uh[1:-1, 1:-1] - ue)
+    e0 = gmax(uh[1:-1, 1:-1])          # erro algébrico do chute zero
+    if rank == 0:
+        print(f"\n[Comparação] solução manufaturada, erro de discretização max|u_h - u| = {e_disc:.3e}; "
+              f"meta: erro algébrico < {0.1 * e_disc:.3e}  (nu1={nu1}, nu2={nu2})")
+        print(" suavizador | ciclo | início | ciclos | erro/e_d |    WU | WU/dígito | ms/dígito")
+    for smoother in ("jacobi", "rbgs"):
+        for kind in ("V", "W", "F"):
+            for fmg in (False, True):
+                mg = MultigridHierarchy(comm2d, Nx, Ny, h, nu1, nu2, agg=agg, smoother=smoother, cycle=kind)
+                u = alloc_with_halos(lv0.nx, lv0.ny)
+                err, k, t = e0, 0, 0.0
+                while err >= 0.1 * e_disc and k < max_cycles:
+                    comm2d.Barrier()
+                    t0 = MPI.Wtime()
+                    if fmg and k == 0:
+                        mg.fmg(u, f)
+                    else:
+                        mg.cycle(u, f)
+                    t += comm2d.allreduce(MPI.Wtime() - t0, op=MPI.MAX)
+                    k += 1
+                    err = gmax(u[1:-1, 1:-1] - uh[1:-1, 1:-1])
+                wu = comm2d.allreduce(mg.work, op=MPI.MAX) / (lv0.nx * lv0.ny)
+                mg.free()
+                digits = digits_gained(e0, err)
+                if rank == 0:
+                    per = (f"{wu / digits:9.2f} | {t * 1e3 / digits:9.3f}" if digits is not None
+                           else f"{'divergiu':>9} | {'divergiu':>9}")
+                    print(f" {smoother:>10} | {kind:>5} | {'FMG' if fmg else 'zero':>6} | {k:6d} | {err / e_disc:8.3f} | "
+                          f"{wu:5.1f} | {per}")
+    ref.free()
+
 # --------------------------
 # main
 # --------------------------
@@ -244,9 +917,28 @@ def main():
     parser = argparse.ArgumentParser(description="Multigrid 2D (ciclo-V) com mpi4py — exemplo acadêmico (sem deadlock)")
     parser.add_argument("--Nx", type=int, default=128, help="pontos interiores em X (global)")
     parser.add_argument("--Ny", type=int, default=128, help="pontos interiores em Y (global)")
-    parser.add_argument("--cycles", type=int, default=5, help="quantidade de ciclos-V")
+    parser.add_argument("--cycles", type=int, default=5, help="quantidade de ciclos")
     parser.add_argument("--nu1", type=int, default=3, help="pré-suavizações por nível")
     parser.add_argument("--nu2", type=int, default=3, help="pós-suavizações por nível")
+    parser.add_argument("--agg-size", type=int, default=0,
+                        help="aglomera no rank 0 quando um bloco local teria menos de n pontos por lado "
+                             "(0 = não; com blocos desiguais, N = P*n - 1 e P > 1, vale no mínimo 4)")
+    parser.add_argument("--agg-direct", type=int, default=1024,
+                        help="nível aglomerado com até n incógnitas: solve direto (0 = ciclo-V em série)")
+    parser.add_argument("--smoother", type=str, default="jacobi", choices=["jacobi", "rbgs"],
+                        help="jacobi: Jacobi relaxado (ω = 2/3) | rbgs: Gauss-Seidel red-black")
+    parser.add_argument("--cycle", type=str, default="V", choices=["V", "W", "F"], help="tipo de ciclo")
+    parser.add_argument("--fmg", action="store_true", help="1o ciclo substituído por multigrid completo (FMG)")
+    parser.add_argument("--halo", type=str, default="isendirecv", choices=["sendrecv", "isendirecv"],
+                        help="troca de halos da hierarquia: 4 Sendrecv ou Isend/Irecv com um Waitall")
+    parser.add_argument("--bench-halos", type=int, default=0, metavar="REPS",
+                        help="mede a troca de halos em cada nível (Sendrecv x Isend/Irecv), REPS chamadas (0 = não)")
+    parser.add_argument("--timing", action="store_true",
+                        help="tabela de tempo por nível (suavização, halos, resíduo, transferências)")
+    parser.add_argument("--trace-alloc", action="store_true",
+                        help="mais um ciclo-V de v_cycle() e da hierarquia sob tracemalloc: pico e diferença")
+    parser.add_argument("--compare", action="store_true",
+                        help="compara suavizador x ciclo x FMG até o erro de discretização (solução manufaturada)")
     args = parser.parse_args()
 
     comm = MPI.COMM_WORLD
@@ -259,9 +951,16 @@ def main():
 
     # shapes locais
     nxi, nyi = local_shape(Nx, Ny, dims, coords)
-    if (nxi % 2 != 0) or (nyi % 2 != 0):
+    if (Nx + 1) % (2 * Px) or (Ny + 1) % (2 * Py):
         if rank == 0:
-            print("Aviso: nxi/nyi deveriam ser pares para coarsening limpo. Ajuste Nx/Ny e o grid de processos.")
+            print("Aviso: use Nx = Px*n - 1 e Ny = Py*n - 1 (ex.: 2^k - 1) para coarsening limpo entre os ranks.")
+    agg = make_agglomeration(comm2d, Nx, Ny, args.agg_size, args.agg_direct)
+    if rank == 0 and agg is not None:
+        how = "solve direto" if agg.Ainv is not None else "ciclo-V em série"
+        print(f"[Aglomeração] a partir do nível {agg.level} ({agg.nx}x{agg.ny}) no rank 0: {how}")
+        if agg.agg_size != args.agg_size:
+            print(f"  --agg-size {args.agg_size} -> {agg.agg_size}: com blocos desiguais os ranks precisam "
+                  f"concordar sobre a base (a partir de 4 pontos por lado)")
 
     # passo de malha (uniforme em [0,1])
     hx = 1.0 / (Nx + 1)
@@ -279,18 +978,73 @@ def main():
     if rank == 0:
         print(f"[L0]  ||r||2 = {r0:.6e}  | Px x Py = {Px} x {Py} | n_local = {nxi}x{nyi}")
 
-    # ciclos-V
+    # ciclos (hierarquia pré-alocada)
+    mg = MultigridHierarchy(comm2d, Nx, Ny, h, nu1=args.nu1, nu2=args.nu2, omega=2/3, agg=agg,
+                            smoother=args.smoother, cycle=args.cycle, halo=args.halo)
+    timing = {} if args.timing else None
+    rk = r0
     for k in range(1, args.cycles+1):
-        v_cycle(u, f[1:-1,1:-1], h, comm2d, nu1=args.nu1, nu2=args.nu2, omega=2/3, level=0)
+        if args.fmg and k == 1:
+            mg.fmg(u, f[1:-1,1:-1], timing=timing)
+        else:
+            mg.cycle(u, f[1:-1,1:-1], timing=timing)
         rk = global_residual_norm(u, f[1:-1,1:-1], h, comm2d)
         if rank == 0:
-            print(f"[V-cycle {k}] ||r||2 = {rk:.6e}  (fator {rk/max(r0,1e-30):.3e} vs. inicial)")
+            name = "FMG" if args.fmg and k == 1 else f"{args.cycle}-cycle"
+            print(f"[{name} {k}] ||r||2 = {rk:.6e}  (fator {rk/max(r0,1e-30):.3e} vs. inicial)")
+
+    # trabalho em WU: 1 WU = uma varredura no nível fino (pontos locais), máx. entre ranks
+    wu = comm2d.allreduce(mg.work, op=MPI.MAX) / (nxi * nyi)
+    digits = digits_gained(r0, rk)
+    if rank == 0:
+        per = (f"{digits:.2f} dígitos de resíduo -> {wu / digits:.2f} WU/dígito" if digits is not None
+               else "resíduo não caiu (divergiu): WU/dígito n/a")
+        print(f"[Trabalho] {args.smoother} {args.cycle}{' + FMG' if args.fmg else ''}: {wu:.1f} WU, {per}")
+
+    if args.timing:
+        shapes = {l: (lv.nx, lv.ny) for l, lv in enumerate(mg.levels)}
+        report_timing(timing, comm2d, shapes)
+    if args.bench_halos > 0:
+        bench_halos(mg, args.bench_halos)
+
+    if args.trace_alloc:
+        # Alocações em regime: mais um ciclo-V de cada versão, a partir do mesmo u, sob tracemalloc
+        # (hierarquia com Jacobi e ciclo-V, para comparar bit a bit com v_cycle())
+        mgj = mg if (args.smoother, args.cycle) == ("jacobi", "V") else \
+            MultigridHierarchy(comm2d, Nx, Ny, h, nu1=args.nu1, nu2=args.nu2, omega=2/3, agg=agg, halo=args.halo)
+        peaks, outs = [], []
+        for run in (lambda w: v_cycle(w, f[1:-1,1:-1], h, comm2d, args.nu1, args.nu2, 2/3, agg=agg),
+                    lambda w: mgj.v_cycle(w, f[1:-1,1:-1])):
+            w = u.copy()
+            tracemalloc.start()
+            run(w)
+            peaks.append(comm2d.allreduce(tracemalloc.get_traced_memory()[1], op=MPI.MAX))
+            tracemalloc.stop()
+            outs.append(w)
+        # só o interior: a suavização com isendirecv não atualiza os cantos dos halos
+        dif = comm2d.allreduce(float(np.max(np.abs(outs[0][1:-1,1:-1] - outs[1][1:-1,1:-1]))), op=MPI.MAX)
+        if rank == 0:
+            print(f"\n[Alocação] pico por ciclo-V (máx. entre ranks): v_cycle() = {peaks[0] / 2**10:.1f} KiB | "
+                  f"MultigridHierarchy = {peaks[1] / 2**10:.1f} KiB  (dados locais: {u.nbytes / 2**10:.1f} KiB)")
+            print(f"  max |v_cycle() - MultigridHierarchy| = {dif:.3e}")
+        if mgj is not mg:
+            mgj.free()
 
     # amostra (opcional)
     if rank == 0:
         nyc, nxc = u.shape[0]//2, u.shape[1]//2
         print(f"[rank 0] amostra u[centro-1:centro+2, centro-1:centro+2]:\n{u[nyc-1:nyc+2, nxc-1:nxc+2]}")
 
+    if args.compare:
+        if (Nx + 1) % (2 * Px) or (Ny + 1) % (2 * Py):
+            if rank == 0:
+                print("\n[Comparação] requer Nx = Px*n - 1 e Ny = Py*n - 1 (ex.: 2^k - 1).")
+        else:
+            compare_cycles(comm2d, Nx, Ny, h, args.nu1, args.nu2, agg)
+
+    mg.free()
+    if agg is not None:
+        agg.free()
     MPI.Finalize()
 
 if __name__ == "__main__":
@@ -0,0 +1,247 @@
+# spectral_poisson_mpi.py
+# ------------------------------------------------------------
+# Solver espectral (direto) de Poisson / Helmholtz periódico com mpi4py
+#   (alpha - ∇²) u = f   em [0,1)^3 (ou [0,1)^2 com --Nz 1), condições periódicas
+# - FFT pencil distribuída de ft3d_mpi.py (DistributedFFTPlan, r2c/c2r):
+#   f → f^ ; u^ = f^ / (alpha + |k|²) ; u^ → u
+# - O fator 1/(alpha + |k|²) é montado UMA vez por plano, no layout de saída do
+#   plano (Nz, ~Ny/Py, ~(Nx/2+1)/Px); cada solve é forward + produto + backward,
+#   sem alocações
+# - alpha = 0 (Poisson): o modo k = 0 é zerado (solução de média nula; f deve ter
+#   média nula)
+# - --symbol spectral: |k|² exato (erro de máquina para f suave)
+#   --symbol fd: autovalores do Laplaciano de diferenças finitas (5/7 pontos):
+#   resolve exatamente o sistema discreto que CG e multigrid resolvem iterando
+# - --bench: escala forte (P = 1, 2, 4, ... processos) no MESMO problema 2D N x N,
+#   comparando com o CG de cg_spmv_ep.py e o ciclo-V de mpi_multigrid_vcycle.py
+#
+# Execução:
+#   # Poisson 3D 128^3, solução manufaturada (erro vs. solução exata)
+#   mpiexec -n 8 python spectral_poisson_mpi.py --N 128 --Nz 128
+#
+#   # Helmholtz, símbolo de diferenças finitas
+#   mpiexec -n 8 python spectral_poisson_mpi.py --N 128 --Nz 128 --alpha 10 --symbol fd
+#
+#   # escala: espectral x CG x multigrid, 2D 256 x 256, P = 1, 2, 4, 8
+#   mpiexec -n 8 python spectral_poisson_mpi.py --N 256 --bench
+# ------------------------------------------------------------
+
+from mpi4py import MPI
+import numpy as np
+import argparse
+import contextlib
+import io
+import math
+
+from ft3d_mpi import DistributedFFTPlan, compute_dims, set_fft_backend, available_fft_backends
+
+# ---------- símbolo do operador ----------
+def laplacian_symbol(N, L, kind="spectral", half=False):
+    """
+    Autovalores de -d²/dx² para os modos de uma direção periódica com N pontos:
+      spectral: k²,                  k = 2π m / L
+      fd      : (2 - 2 cos(k h)) / h², h = L / N  (stencil de 3 pontos)
+    half=True: só os modos m = 0..N//2 (eixo do rfft).
+    """
+    m = np.fft.rfftfreq(N, d=1.0 / N) if half else np.fft.fftfreq(N, d=1.0 / N)
+    k = 2.0 * math.pi * m / L
+    if kind == "spectral":
+        return k * k
+    h = L / N
+    return (2.0 - 2.0 * np.cos(k * h)) / (h * h)
+
+class SpectralPoissonSolver:
+    """
+    Resolve (alpha - ∇²) u = f (periódico) com um DistributedFFTPlan r2c.
+    O construtor monta inv_symbol = 1/(alpha + kz² + ky² + kx²) só para os modos
+    deste rank (plan.output_shape em plan.output_offset); solve(f, out=u) usa f e
+    u no layout de entrada do plano (reais) e não aloca arrays.
+    """
+    def __init__(self, plan, lengths=(1.0, 1.0, 1.0), alpha=0.0, symbol="spectral"):
+        assert plan.real, "o solver usa o plano r2c (DistributedFFTPlan(..., real=True))"
+        self.plan, self.alpha = plan, alpha
+        Lz, Ly, Lx = lengths
+        nz, ny, nx = plan.output_shape
+        _, y0, x0 = plan.output_offset
+        kz = laplacian_symbol(plan.Nz, Lz, symbol)
+        ky = laplacian_symbol(plan.Ny, Ly, symbol)[y0:y0 + ny]
+        kx = laplacian_symbol(plan.Nx, Lx, symbol, half=True)[x0:x0 + nx]
+        den = alpha + kz[:, None, None] + ky[None, :, None] + kx[None, None, :]
+        self.inv_symbol = np.zeros_like(den)
+        np.divide(1.0, den, out=self.inv_symbol, where=den != 0.0)   # k = 0 com alpha = 0: média nula
+        self._fhat = plan.alloc_output()
+
+    def solve(self, f, out=None):
+        """u = (alpha - ∇²)^{-1} f."""
+        fh = self.plan.forward(f, out=self._fhat)
+        fh *= self.inv_symbol
+        return self.plan.backward(fh, out=out)
+
+# ---------- problema manufaturado ----------
+# u = Σ a cos(2π (mz z + my y + mx x))  ⇒  f = Σ a (alpha + |k|²) cos(...)
+MODES = [(1.0, (1, 2, 3)), (0.5, (0, 1, -4)), (0.25, (3, 0, 1))]
+
+def manufactured(plan, alpha):
+    """(u_exata, f) no bloco de entrada do plano, domínio [0,1)^3 (ou 2D se Nz = 1)."""
+    dz, dy, nx = plan.input_shape
+    z0, y0, _ = plan.input_offset
+    z = ((z0 + np.arange(dz)) / plan.Nz)[:, None, None]
+    y = ((y0 + np.arange(dy)) / plan.Ny)[None, :, None]
+    x = (np.arange(nx) / plan.Nx)[None, None, :]
+    u = np.zeros(plan.input_shape)
+    f = np.zeros(plan.input_shape)
+    for a, (mz, my, mx) in MODES:
+        mz = mz if plan.Nz > 1 else 0
+        phase = np.cos(2.0 * math.pi * (mz * z + my * y + mx * x))
+        k2 = (2.0 * math.pi) ** 2 * (mz * mz + my * my + mx * mx)
+        u += a * phase
+        f += a * (alpha + k2) * phase
+    return u, f
+
+def time_solves(solver, f, u, reps, comm):
+    """Tempo médio de um solve (após aquecimento), máximo entre os ranks."""
+    solver.solve(f, out=u)
+    comm.Barrier()
+    t0 = MPI.Wtime()
+    for _ in range(reps):
+        solver.solve(f, out=u)
+    return comm.allreduce((MPI.Wtime() - t0) / reps, op=MPI.MAX)
+
+# ---------- benchmark: mesmo problema 2D que CG / multigrid ----------
+def bench_spectral(sub, N, reps):
+    """Direto, periódico, símbolo fd (mesmo operador de 5 pontos). Retorna (iters, tempo)."""
+    plan = DistributedFFTPlan(sub, 1, N, N, 1, sub.Get_size(), real=True)
+    solver = SpectralPoissonSolver(plan, symbol="fd")
+    _, f = manufactured(plan, 0.0)
+    u = plan.alloc_input()
+    t = time_solves(solver, f, u, reps, sub)
+    plan.free()
+    return 1, t
+
+def bench_cg(sub, N, tol, max_iters, precond):
+    """cg_spmv_ep.conjugate_gradient (Dirichlet, f = 1), decomposição 2D. Retorna (iters, tempo)."""
+    import cg_spmv_ep
+    with contextlib.redirect_stdout(io.StringIO()):   # sem o log por iteração
+        _, rel, it, t_iter, _ = cg_spmv_ep.conjugate_gradient(N, N, max_iters, tol, "sendrecv",
+                                                              precond=precond, decomp="2d", comm=sub)
+    return it, t_iter * it
+
+def bench_multigrid(sub, N, tol, max_cycles):
+    """Ciclos-V de mpi_multigrid_vcycle (Dirichlet, f = 1) até ||r||/||r0|| < tol. Retorna (ciclos, tempo)."""
+    import mpi_multigrid_vcycle as mg
+    comm2d, dims, coords = mg.make_cart_comm(sub)
+    nxi, nyi = mg.local_shape(N, N, dims, coords)
+    h = 1.0 / (N + 1)
+    u = mg.alloc_with_halos(nxi, nyi)
+    f = np.ones((nyi, nxi))
+    agg = mg.make_agglomeration(comm2d, N, N)
+    sub.Barrier()
+    t0 = MPI.Wtime()
+    r0 = mg.global_residual_norm(u, f, h, comm2d)
+    k = 0
+    for k in range(1, max_cycles + 1):
+        mg.v_cycle(u, f, h, comm2d, agg=agg)
+        if mg.global_residual_norm(u, f, h, comm2d) < tol * r0:
+            break
+    t = sub.allreduce(MPI.Wtime() - t0, op=MPI.MAX)
+    comm2d.Free()
+    return k, t
+
+def run_bench(comm, args):
+    """Escala forte: para P = 1, 2, 4, ..., size, resolve o problema 2D N x N em P ranks."""
+    rank, size = comm.Get_rank(), comm.Get_size()
+    plist = sorted({min(2 ** i, size) for i in range(size.bit_length() + 1)})
+    solvers = ["espectral", "cg"]
+    if (args.N + 1) & args.N == 0:           # N = 2^k - 1: CG pré-condicionado com multigrid
+        solvers.append("cg+mg")
+    solvers.append("multigrid")
+    rows = []
+    for p in plist:
+        sub = comm.Split(0 if rank < p else MPI.UNDEFINED, rank)
+        if sub != MPI.COMM_NULL:
+            for name in solvers:
+                if name == "espectral":
+                    it, t = bench_spectral(sub, args.N, args.reps)
+                elif name == "cg":
+                    it, t = bench_cg(sub, args.N, args.tol, args.max_iters, "none")
+                elif name == "cg+mg":
+                    it, t = bench_cg(sub, args.N, args.tol, args.max_iters, "mg")
+                else:
+                    Py, Px = MPI.Compute_dims(p, [0, 0])
+                    # a hierarquia de mpi_multigrid_vcycle só é consistente com N = 2^k - 1
+                    # (n_fino = 2 n_grosso + 1), em blocos de (N+1)/P pontos (o último com um a menos)
+                    if (args.N + 1) & args.N or (args.N + 1) % Px or (args.N + 1) % Py:
+                        it, t = 0, float("nan")
+                    else:
+                        it, t = bench_multigrid(sub, args.N, args.tol, min(args.max_iters, 100))
+                rows.append((p, name, it, t))
+            sub.Free()
+        comm.Barrier()
+
+    if rank == 0:
+        print(f"\n[Bench] 2D, N x N = {args.N} x {args.N} incógnitas, Laplaciano de 5 pontos, tol = {args.tol:.0e}")
+        print("  espectral: periódico, direto (símbolo fd) | CG e multigrid: Dirichlet, f = 1, iterativos")
+        print("   P | solver     | iters | tempo (s)  | speedup")
+        t1 = {name: t for p, name, _, t in rows if p == 1}
+        for p, name, it, t in rows:
+            if math.isnan(t):
+                print(f" {p:3d} | {name:<10} |     - |          - |       -   (requer N = 2^k - 1 e N+1 divisível pela grade)")
+                continue
+            print(f" {p:3d} | {name:<10} | {it:5d} | {t:10.6f} | {t1[name] / t:7.2f}")
+
+# ---------- main ----------
+def main():
+    ap = argparse.ArgumentParser(description="Poisson/Helmholtz periódico espectral sobre a FFT pencil — mpi4py")
+    ap.add_argument("--N", type=int, default=128, help="pontos em X e Y")
+    ap.add_argument("--Nz", type=int, default=None, help="pontos em Z (padrão N; 1 = problema 2D)")
+    ap.add_argument("--alpha", type=float, default=0.0, help="alpha >= 0: (alpha - ∇²) u = f (0 = Poisson)")
+    ap.add_argument("--symbol", choices=["spectral", "fd"], default="spectral",
+                    help="spectral: |k|² | fd: autovalores do Laplaciano de diferenças finitas")
+    ap.add_argument("--py", type=int, default=None, help="linhas da grade de processos (Z)")
+    ap.add_argument("--px", type=int, default=None, help="colunas da grade de processos (Y)")
+    ap.add_argument("--reps", type=int, default=5, help="solves cronometrados (média)")
+    ap.add_argument("--fft-backend", choices=["numpy", "scipy", "pyfftw", "auto"], default="numpy")
+    ap.add_argument("--fft-threads", type=int, default=1)
+    ap.add_argument("--bench", action="store_true",
+                    help="escala forte 2D N x N vs. cg_spmv_ep.py e mpi_multigrid_vcycle.py")
+    ap.add_argument("--tol", type=float, default=1e-8, help="tolerância dos solvers iterativos (--bench)")
+    ap.add_argument("--max-iters", type=int, default=5000, help="máx. de iterações/ciclos (--bench)")
+    args = ap.parse_args()
+    if args.fft_backend not in ("auto", *available_fft_backends()):
+        ap.error(f"--fft-backend {args.fft_backend}: pacote não instalado")
+    assert args.alpha >= 0.0, "alpha deve ser >= 0"
+
+    comm = MPI.COMM_WORLD
+    rank, size = comm.Get_rank(), comm.Get_size()
+    set_fft_backend(args.fft_backend, args.fft_threads)
+
+    if args.bench:
+        run_bench(comm, args)
+        MPI.Finalize()
+        return
+
+    Nz = args.N if args.Nz is None else args.Nz
+    Py, Px = compute_dims(size, args.py, args.px) if Nz > 1 else (1, size)
+    plan = DistributedFFTPlan(comm, Nz, args.N, args.N, Py, Px, real=True)
+    t0 = MPI.Wtime()
+    solver = SpectralPoissonSolver(plan, alpha=args.alpha, symbol=args.symbol)
+    t_setup = comm.allreduce(MPI.Wtime() - t0, op=MPI.MAX)
+
+    u_ex, f = manufactured(plan, args.alpha)
+    u = plan.alloc_input()
+    t_solve = time_solves(solver, f, u, args.reps, comm)
+    err = comm.allreduce(float(np.max(np.abs(u - u_ex), initial=0.0)), op=MPI.MAX)
+    ref = comm.allreduce(float(np.max(np.abs(u_ex), initial=0.0)), op=MPI.MAX)
+
+    if rank == 0:
+        kind = "Poisson" if args.alpha == 0.0 else f"Helmholtz (alpha={args.alpha:g})"
+        print(f"[Espectral] {kind}  símbolo={args.symbol}  N=({Nz},{args.N},{args.N})  P={size}  Py={Py} Px={Px}")
+        print(f"  Montagem do símbolo (1 vez por plano): {t_setup:0.6f} s")
+        print(f"  Tempo por solve (forward + divisão + backward): {t_solve:0.6f} s")
+        print(f"  erro max |u - u_exata| / max|u_exata| = {err / ref:.3e}")
+
+    plan.free()
+    MPI.Finalize()
+
+if __name__ == "__main__":
+    main()